@@ -1,11 +1,12 @@
 """
 Main application class for the Image & PDF Utility Tool.
 """
+import threading
 import tkinter as tk
+from tkinter import messagebox
 
 from utils.ui_components import create_primary_button, create_title_label, create_subtitle_label, BG_COLOR, FONT_FAMILY
-from operations.pdf_operations import merge_pdfs, split_pdf, images_to_pdf, lock_pdf, unlock_pdf
-from operations.image_operations import resize_image, crop_image, compress_image
+from operations.registry import OPERATIONS, load_operation, prewarm_operations
 
 
 class ImagePdfToolApp(tk.Tk):
@@ -15,8 +16,39 @@ class ImagePdfToolApp(tk.Tk):
         super().__init__()
         self.title("Image & PDF Utility Tool")
         self.configure(bg=BG_COLOR)
+        self._first_paint_callbacks = []
+        self.bind("<Map>", self._on_map, add="+")
         self._build_ui()
 
+    def on_first_paint(self, callback):
+        """Call ``callback`` once the main window has been drawn for the first time."""
+        self._first_paint_callbacks.append(callback)
+
+    def _on_map(self, event):
+        if event.widget is not self or self._first_paint_callbacks is None:
+            return
+        callbacks, self._first_paint_callbacks = self._first_paint_callbacks, None
+        # Widgets are drawn by idle callbacks queued when the window is mapped,
+        # so an idle callback queued now runs right after the first paint
+        self.after_idle(lambda: [callback() for callback in callbacks])
+
+    def start_prewarm(self):
+        """Import the operation modules on a background thread."""
+        threading.Thread(target=prewarm_operations, daemon=True).start()
+
+    def run_operation(self, operation):
+        """Open an operation, importing its module on first use."""
+        try:
+            self.config(cursor="watch")
+            self.update_idletasks()
+            function = load_operation(operation)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load {operation['label']}.\n\n{e}")
+            return
+        finally:
+            self.config(cursor="")
+        function(self)
+
     def _build_ui(self):
         """Build the main user interface."""
         # Center the main frame
@@ -32,56 +64,13 @@ class ImagePdfToolApp(tk.Tk):
         button_frame = tk.Frame(container, bg=BG_COLOR)
         button_frame.pack()
 
-        # Row 1 buttons
-        create_primary_button(
-            button_frame,
-            text="Merge PDFs",
-            command=lambda: merge_pdfs(self),
-        ).grid(row=0, column=0, padx=10, pady=10, sticky="ew")
-
-        create_primary_button(
-            button_frame,
-            text="Split PDF",
-            command=lambda: split_pdf(self),
-        ).grid(row=0, column=1, padx=10, pady=10, sticky="ew")
-
-        create_primary_button(
-            button_frame,
-            text="Resize Image",
-            command=lambda: resize_image(self),
-        ).grid(row=0, column=2, padx=10, pady=10, sticky="ew")
-
-        # Row 2 buttons
-        create_primary_button(
-            button_frame,
-            text="JPG to PDF",
-            command=lambda: images_to_pdf(self),
-        ).grid(row=1, column=0, padx=10, pady=10, sticky="ew")
-
-        create_primary_button(
-            button_frame,
-            text="Crop Image",
-            command=lambda: crop_image(self),
-        ).grid(row=1, column=1, padx=10, pady=10, sticky="ew")
-
-        create_primary_button(
-            button_frame,
-            text="Compress Image",
-            command=lambda: compress_image(self),
-        ).grid(row=1, column=2, padx=10, pady=10, sticky="ew")
-
-        # Row 3 buttons
-        create_primary_button(
-            button_frame,
-            text="Lock PDF",
-            command=lambda: lock_pdf(self),
-        ).grid(row=2, column=0, padx=10, pady=10, sticky="ew")
-
-        create_primary_button(
-            button_frame,
-            text="Unlock PDF",
-            command=lambda: unlock_pdf(self),
-        ).grid(row=2, column=1, padx=10, pady=10, sticky="ew")
+        # One button per registered operation, three per row
+        for index, operation in enumerate(OPERATIONS):
+            create_primary_button(
+                button_frame,
+                text=operation["label"],
+                command=lambda operation=operation: self.run_operation(operation),
+            ).grid(row=index // 3, column=index % 3, padx=10, pady=10, sticky="ew")
 
         # Footer
         footer = tk.Label(
@@ -0,0 +1 @@
+# Benchmarks for the Image & PDF Utility Tool
@@ -0,0 +1,99 @@
+"""
+Benchmark for target-size compression.
+
+Compares the number of full resolution JPEG encodes per image, wall time and
+how close the result lands to the target, for the current solver and for the
+previous fixed-quality scale walk. The solver only evaluates candidates in
+parallel while its size model is unsure, so "rounds" (sequential encode
+steps) is what drives wall time on multi-core machines, and the number of
+encodes should not grow with ``max_workers``. Run from the project folder
+with:
+
+    python -m benchmarks.bench_compress [max_workers]
+"""
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from benchmarks.corpus import make_photo_like_image
+from operations.compression import compress_to_target_size
+
+
+def legacy_compress(image, target_kb):
+    """The previous fixed quality 85 scale walk, returning (size, encodes)."""
+    target_bytes = target_kb * 1024
+    working_img = image.convert("RGB")
+    width, height = working_img.size
+
+    def encode(img):
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85, optimize=True)
+        return buffer.tell()
+
+    encodes = 1
+    current_size = encode(working_img)
+    if current_size <= target_bytes:
+        return current_size, encodes
+
+    scale_factor = math.sqrt(target_bytes / current_size) * 0.95
+    best_size = None
+    for _ in range(10):
+        new_width = max(50, int(width * scale_factor))
+        new_height = max(50, int(height * scale_factor))
+        new_size = encode(working_img.resize((new_width, new_height), Image.Resampling.LANCZOS))
+        encodes += 1
+        if new_size <= target_bytes:
+            best_size = new_size
+            scale_factor *= 1.05
+        else:
+            scale_factor *= 0.9
+        if best_size is not None and best_size >= target_bytes * 0.90:
+            break
+        if new_width <= 50 or new_height <= 50:
+            break
+    # The old code saved the winner with one more full encode
+    return best_size, encodes + 1
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    cases = [
+        (make_photo_like_image(4000, 3000, seed), target_kb)
+        for seed in range(3)
+        for target_kb in (150, 500, 1500)
+    ]
+
+    print(f"{'image':>12} {'target':>8} | {'old enc':>7} {'old s':>6} {'old fill':>8} | "
+          f"{'new enc':>7} {'rounds':>6} {'new s':>6} {'new fill':>8} {'q':>3}")
+    totals = {"old": 0, "new": 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "out.jpg")
+        for img, target_kb in cases:
+            start = time.perf_counter()
+            old_size, old_encodes = legacy_compress(img, target_kb)
+            old_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = compress_to_target_size(img, target_kb, output_path, max_workers=max_workers)
+            new_time = time.perf_counter() - start
+            # The winning candidate's bytes are written as-is, no extra encode
+            new_encodes = result["encodes"]
+
+            totals["old"] += old_encodes
+            totals["new"] += new_encodes
+            old_fill = (old_size or 0) / (target_kb * 1024)
+            new_fill = result["size"] / (target_kb * 1024)
+            print(f"{img.width}x{img.height:>5} {target_kb:>6}KB | {old_encodes:>7} {old_time:>6.2f} {old_fill:>8.1%} | "
+                  f"{new_encodes:>7} {result['rounds']:>6} {new_time:>6.2f} {new_fill:>8.1%} {result['quality']:>3}")
+
+    print(f"\nFull resolution encodes per image: "
+          f"old {totals['old'] / len(cases):.1f}, new {totals['new'] / len(cases):.1f}")
+
+
+if __name__ == "__main__":
+    main()
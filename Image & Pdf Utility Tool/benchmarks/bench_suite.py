@@ -0,0 +1,333 @@
+"""
+Benchmark suite for every engine operation.
+
+A deterministic synthetic corpus (N-page PDFs, a mixed JPEG/PNG set, a huge
+image) is generated in a temporary folder, then each operation runs in its
+own fresh process so its peak RSS is not polluted by the others. The median
+time and peak RSS of every operation are compared against a stored baseline
+and the run fails when one regresses by more than the threshold. Run from
+the project folder with:
+
+    python -m benchmarks.bench_suite [--profile quick|full] [--only NAME ...]
+    python -m benchmarks.bench_suite --update-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import build_corpus
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.25  # Fail when 25% slower or bigger than the baseline
+DEFAULT_REPEAT = 3
+
+
+def peak_rss_bytes():
+    """Return the peak resident set size of this process, or None."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+
+    if sys.platform.startswith("linux"):
+        # VmHWM belongs to the address space, so unlike ru_maxrss it does
+        # not carry over the parent's peak into a freshly spawned process
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Operations ---------------------------------------------------------------
+# Each takes the corpus dict and an empty output folder. Imports happen
+# inside, so a process only loads what its operation needs.
+
+def bench_merge_pdfs(corpus, output_dir):
+    from operations.pdf_processing import merge_pdf_files
+    merge_pdf_files(corpus["merge_pdfs"], os.path.join(output_dir, "merged.pdf"))
+
+
+def bench_split_pdf(corpus, output_dir):
+    from operations.pdf_processing import split_pdf_file
+    pages = corpus["pdf_pages"]
+    ranges = [(1, pages // 4), (pages // 2, pages)]
+    split_pdf_file(corpus["pdf"], ranges, os.path.join(output_dir, "split.pdf"))
+
+
+def bench_images_to_pdf(corpus, output_dir):
+    from operations.pdf_processing import images_to_pdf_file
+    images_to_pdf_file(corpus["images"], os.path.join(output_dir, "images.pdf"))
+
+
+def bench_lock_pdf(corpus, output_dir):
+    from operations.pdf_processing import lock_pdf_file
+    lock_pdf_file(corpus["pdf"], os.path.join(output_dir, "locked.pdf"), corpus["password"])
+
+
+def bench_unlock_pdf(corpus, output_dir):
+    from operations.pdf_processing import unlock_pdf_file
+    unlock_pdf_file(corpus["locked_pdf"], os.path.join(output_dir, "unlocked.pdf"), corpus["password"])
+
+
+def bench_resize_huge(corpus, output_dir):
+    from PIL import Image
+    from operations.image_processing import resize_image_file
+    with Image.open(corpus["huge_image"]) as img:
+        size = (img.width // 4, img.height // 4)
+    resize_image_file(corpus["huge_image"], os.path.join(output_dir, "resized.jpg"), size)
+
+
+def bench_crop_huge(corpus, output_dir):
+    from PIL import Image
+    from operations.image_processing import crop_image_file
+    with Image.open(corpus["huge_image"]) as img:
+        width, height = img.size
+    box = (width // 4, height // 4, width * 3 // 4, height * 3 // 4)
+    crop_image_file(corpus["huge_image"], os.path.join(output_dir, "cropped.jpg"), box)
+
+
+def bench_preview_huge(corpus, output_dir):
+    from operations.image_processing import load_preview
+    load_preview(corpus["huge_image"], (800, 600), high_quality=True).close()
+
+
+def bench_tile_pyramid(corpus, output_dir):
+    from operations.tile_pyramid import TilePyramid
+    pyramid = TilePyramid(corpus["huge_image"])
+    # A zoomed-out overview, then a 1:1 view of the middle
+    for zoom, box in ((0.125, (0, 0) + pyramid.size),
+                      (1.0, (pyramid.size[0] // 2, pyramid.size[1] // 2,
+                             pyramid.size[0] // 2 + 1600, pyramid.size[1] // 2 + 1200))):
+        level = pyramid.level_for_zoom(zoom)
+        for tx, ty in pyramid.tiles_in_box(level, box):
+            pyramid.get_tile(level, tx, ty)
+    pyramid.clear()
+
+
+def bench_compress_jpeg(corpus, output_dir):
+    from PIL import Image
+    from operations.compression import compress_to_target_size
+    with Image.open(corpus["photo"]) as img:
+        compress_to_target_size(img, 500, os.path.join(output_dir, "photo.jpg"))
+
+
+def bench_compress_jpeg_parallel(corpus, output_dir):
+    from PIL import Image
+    from operations.compression import compress_to_target_size
+    with Image.open(corpus["photo"]) as img:
+        compress_to_target_size(img, 500, os.path.join(output_dir, "photo.jpg"), max_workers=4)
+
+
+def bench_compress_png(corpus, output_dir):
+    from PIL import Image
+    from operations.compression import compress_to_target_size
+    with Image.open(corpus["screenshot"]) as img:
+        compress_to_target_size(img, 40, os.path.join(output_dir, "screenshot.png"), fmt="PNG")
+
+
+def bench_compress_ssim(corpus, output_dir):
+    from PIL import Image
+    from operations.compression import compress_to_quality
+    from operations.quality_metrics import is_ssim_available
+    if not is_ssim_available():
+        return
+    with Image.open(corpus["photo"]) as img:
+        compress_to_quality(img, 0.95, os.path.join(output_dir, "photo.jpg"))
+
+
+def bench_batch_compress(corpus, output_dir):
+    from operations.batch_processing import iter_batch_compress
+    for _ in iter_batch_compress(corpus["images"], 150, output_dir, input_dir=corpus["image_dir"]):
+        pass
+
+
+def bench_batch_crop(corpus, output_dir):
+    from operations.batch_processing import iter_batch_crop
+    template = {"box": [100, 100, 500, 400], "image_size": [640, 480]}
+    for _ in iter_batch_crop(corpus["images"], template, output_dir, lossless=False):
+        pass
+
+
+OPERATIONS = {
+    "merge_pdfs": bench_merge_pdfs,
+    "split_pdf": bench_split_pdf,
+    "images_to_pdf": bench_images_to_pdf,
+    "lock_pdf": bench_lock_pdf,
+    "unlock_pdf": bench_unlock_pdf,
+    "resize_huge": bench_resize_huge,
+    "crop_huge": bench_crop_huge,
+    "preview_huge": bench_preview_huge,
+    "tile_pyramid": bench_tile_pyramid,
+    "compress_jpeg": bench_compress_jpeg,
+    "compress_jpeg_x4": bench_compress_jpeg_parallel,
+    "compress_png": bench_compress_png,
+    "compress_ssim": bench_compress_ssim,
+    "batch_compress": bench_batch_compress,
+    "batch_crop": bench_batch_crop,
+}
+
+
+# Runner -------------------------------------------------------------------
+
+def _run_operation(name, corpus, output_root, repeat, results):
+    """Time one operation ``repeat`` times (runs in a fresh process)."""
+    times = []
+    try:
+        for i in range(repeat):
+            output_dir = os.path.join(output_root, f"{name}_{i}")
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            OPERATIONS[name](corpus, output_dir)
+            times.append(time.perf_counter() - start)
+        results.put({"times": times, "peak_rss": peak_rss_bytes()})
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_operation(name, corpus, output_root, repeat):
+    """Run one operation in a spawned process and return its measurements."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_operation, args=(name, corpus, output_root, repeat, results))
+    process.start()
+    measurement = results.get()
+    process.join()
+    if "error" in measurement:
+        return measurement
+    times = measurement["times"]
+    peak_rss = measurement["peak_rss"]
+    return {
+        "median_s": round(statistics.median(times), 4),
+        "min_s": round(min(times), 4),
+        "peak_rss_mb": None if peak_rss is None else round(peak_rss / (1024 * 1024), 1),
+    }
+
+
+def machine_info():
+    """Describe the machine, so baselines from different hosts are not mixed up."""
+    from PIL import __version__ as pillow_version
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pillow": pillow_version,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages against ``baseline``."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None or "error" in result or "error" in base:
+            continue
+        for key, unit in (("median_s", "s"), ("peak_rss_mb", " MB")):
+            if result[key] is None or not base.get(key):
+                continue
+            change = result[key] / base[key] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{name}: {key} {base[key]}{unit} -> {result[key]}{unit} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every engine operation.")
+    parser.add_argument("--profile", choices=["quick", "full"], default="full",
+                        help="corpus size (default: full)")
+    parser.add_argument("--only", nargs="+", choices=sorted(OPERATIONS), metavar="NAME",
+                        help="run only these operations")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"timed runs per operation (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown/growth before failing (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline instead of comparing")
+    args = parser.parse_args()
+
+    names = args.only or list(OPERATIONS)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        corpus = build_corpus(os.path.join(tmp, "corpus"), args.profile)
+        print(f"Generated {args.profile} corpus in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'operation':<16} {'median':>9} {'min':>9} {'peak RSS':>10}")
+        for name in names:
+            result = run_operation(name, corpus, os.path.join(tmp, "output"), args.repeat)
+            results[name] = result
+            if "error" in result:
+                print(f"{name:<16} failed: {result['error']}")
+                continue
+            rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']} MB"
+            print(f"{name:<16} {result['median_s']:>8.3f}s {result['min_s']:>8.3f}s {rss:>10}")
+
+    run = {"profile": args.profile, "repeat": args.repeat, "machine": machine_info(), "results": results}
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                # Keep the other operations when only some were re-run
+                previous = json.load(f)
+            if previous.get("profile") == args.profile:
+                run["results"] = {**previous["results"], **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare against; run with --update-baseline first.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("profile") != args.profile:
+        print(f"\nBaseline uses the {baseline.get('profile')} profile; not comparing.")
+        return 0
+    if baseline.get("machine") != run["machine"]:
+        print("\nWarning: the baseline was recorded on a different machine or library version.")
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions over {args.threshold:.0%}:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"\nNo regressions over {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Deterministic synthetic inputs for the benchmarks.
+
+Everything is generated locally from fixed seeds, so two runs on the same
+Pillow version produce identical files and timings can be compared.
+"""
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+from operations.pdf_processing import lock_pdf_file
+
+
+CORPUS_PASSWORD = "benchmark"
+
+# Sizes per corpus profile; "quick" is for smoke runs, "full" for baselines
+CORPUS_PROFILES = {
+    "quick": {"pdf_pages": 20, "merge_files": 2, "image_count": 4, "huge_size": (3000, 2000), "photo_size": (1600, 1200)},
+    "full": {"pdf_pages": 200, "merge_files": 4, "image_count": 12, "huge_size": (8000, 6000), "photo_size": (4000, 3000)},
+}
+
+# (width, height) cycled through by the mixed image set
+IMAGE_SET_SIZES = [(640, 480), (1600, 1200), (1200, 1600), (3000, 2000), (800, 800), (2048, 1365)]
+
+
+def make_photo_like_image(width, height, seed):
+    """Build a deterministic photo-like image.
+
+    Noise octaves are upscaled and summed so detail falls off with spatial
+    frequency the way it does in real photos, then a few sharp-edged shapes
+    are drawn on top. The noise comes from a ``random.Random`` seeded with
+    ``seed`` (Pillow's ``effect_noise`` cannot be seeded).
+    """
+    rng = random.Random(seed)
+    bands = []
+    for band in range(3):
+        layer = Image.new("L", (width, height), 128)
+        for octave in range(1, 8):
+            size = (max(2, width >> (8 - octave)), max(2, height >> (8 - octave)))
+            noise = Image.frombytes("L", size, rng.randbytes(size[0] * size[1]))
+            noise = noise.resize((width, height), Image.Resampling.BICUBIC)
+            layer = Image.blend(layer, noise, 0.5 / octave + 0.02 * ((seed + band) % 3))
+        bands.append(layer)
+    img = Image.merge("RGB", bands)
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x = (seed * 97 + i * 131) * width // 1000 % width
+        y = (seed * 53 + i * 71) * height // 1000 % height
+        draw.ellipse((x, y, x + width // 8, y + height // 8), outline=(i * 20, 255 - i * 20, 128), width=6)
+    return img
+
+
+def make_screenshot_like_image(width, height, seed):
+    """Build a deterministic screenshot-like RGBA image (flat colors, text, alpha)."""
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for i in range(40):
+        x = (seed * 37 + i * 89) % max(1, width - 200)
+        y = (seed * 61 + i * 47) % max(1, height - 80)
+        draw.rectangle((x, y, x + 200, y + 80), fill=(i * 6 % 256, 120, 255 - i * 6 % 256, 220))
+        draw.text((x + 8, y + 8), f"Window {seed}.{i} - benchmark text", fill=(0, 0, 0, 255))
+    return img
+
+
+def make_text_page(page_number, size=(612, 792)):
+    """Build a grayscale page image with text-like lines."""
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    draw.text((60, 40), f"Page {page_number}", fill=0)
+    for line in range(45):
+        width = 300 + (page_number * 31 + line * 17) % 190
+        draw.rectangle((60, 80 + line * 15, 60 + width, 86 + line * 15), fill=60)
+    return page
+
+
+def make_pdf(path, pages, first_page=1):
+    """Write an N-page PDF of text-like pages."""
+    images = [make_text_page(first_page + i) for i in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:])
+    for img in images:
+        img.close()
+
+
+def make_huge_image(path, size):
+    """Write a very large JPEG by tiling a photo-like patch.
+
+    Each tile is mirrored or flipped differently so the image does not
+    compress like a plain repetition.
+    """
+    tile = make_photo_like_image(1024, 1024, 7)
+    variants = [
+        tile,
+        tile.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+        tile.transpose(Image.Transpose.FLIP_TOP_BOTTOM),
+        tile.transpose(Image.Transpose.ROTATE_180),
+    ]
+    img = Image.new("RGB", size)
+    for ty in range(0, size[1], 1024):
+        for tx in range(0, size[0], 1024):
+            img.paste(variants[(tx // 1024 + 3 * (ty // 1024)) % len(variants)], (tx, ty))
+    img.save(path, quality=90)
+    img.close()
+
+
+def build_corpus(folder, profile="full"):
+    """Generate every benchmark input in ``folder`` and return their paths."""
+    settings = CORPUS_PROFILES[profile]
+    os.makedirs(folder, exist_ok=True)
+    corpus = {"profile": profile, "password": CORPUS_PASSWORD}
+
+    # PDFs: several to merge, one large one to split, lock and unlock
+    corpus["merge_pdfs"] = []
+    for i in range(settings["merge_files"]):
+        path = os.path.join(folder, f"merge_{i}.pdf")
+        make_pdf(path, settings["pdf_pages"] // 4, first_page=i * 100 + 1)
+        corpus["merge_pdfs"].append(path)
+    corpus["pdf"] = os.path.join(folder, "document.pdf")
+    make_pdf(corpus["pdf"], settings["pdf_pages"])
+    corpus["pdf_pages"] = settings["pdf_pages"]
+    corpus["locked_pdf"] = os.path.join(folder, "document_locked.pdf")
+    lock_pdf_file(corpus["pdf"], corpus["locked_pdf"], CORPUS_PASSWORD)
+
+    # Mixed-size JPEG/PNG set, in its own folder for the batch operations
+    image_dir = os.path.join(folder, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    corpus["image_dir"] = image_dir
+    corpus["images"] = []
+    for i in range(settings["image_count"]):
+        size = IMAGE_SET_SIZES[i % len(IMAGE_SET_SIZES)]
+        if i % 3 == 2:
+            path = os.path.join(image_dir, f"image_{i:02d}.png")
+            make_screenshot_like_image(*size, seed=i).save(path)
+        else:
+            path = os.path.join(image_dir, f"image_{i:02d}.jpg")
+            make_photo_like_image(*size, seed=i).save(path, quality=92)
+        corpus["images"].append(path)
+
+    # Single large inputs
+    corpus["photo"] = os.path.join(folder, "photo.jpg")
+    make_photo_like_image(*settings["photo_size"], seed=1).save(corpus["photo"], quality=95)
+    corpus["screenshot"] = os.path.join(folder, "screenshot.png")
+    make_screenshot_like_image(*settings["photo_size"], seed=1).save(corpus["screenshot"])
+    corpus["huge_image"] = os.path.join(folder, "huge.jpg")
+    make_huge_image(corpus["huge_image"], settings["huge_size"])
+    return corpus
@@ -0,0 +1,193 @@
+"""
+Load test for the local HTTP service.
+
+Sends the same job from several client threads and reports requests per
+second and latency percentiles, counting 429 (queue full) answers
+separately. Run from the project folder, against a running service or one
+started for the test:
+
+    python -m benchmarks.load_test --start-server --workers 2
+    python -m benchmarks.load_test --operation compress --params target_kb=100 --file photo.jpg
+
+Without ``--file`` a photo-like JPEG (or, for PDF operations, a PDF) is
+generated with the benchmark corpus.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.corpus import make_pdf, make_photo_like_image
+
+
+PDF_OPERATIONS = ("merge", "split", "lock", "unlock")
+DEFAULT_PARAMS = {
+    "compress": "target_kb=100",
+    "resize": "width=800",
+    "crop": "box=0,0,400,300",
+    "split": "ranges=1-3",
+}
+
+
+def percentile(values, fraction):
+    """Return the ``fraction`` percentile of ``values`` (nearest rank)."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def send_job(host, port, path, body, headers):
+    """POST one job and return (status, seconds)."""
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(host, port, timeout=300)
+    try:
+        connection.request("POST", path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - start
+    finally:
+        connection.close()
+
+
+def wait_for_server(host, port, timeout=30):
+    """Wait until the service answers /status."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/status")
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"The service on port {port} did not start.")
+
+
+def run_load(host, port, path, body, headers, requests, concurrency):
+    """Send ``requests`` jobs from ``concurrency`` threads; return the report."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            try:
+                status, seconds = send_job(host, port, path, body, headers)
+            except OSError:
+                status, seconds = "error", None
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(seconds)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "ok": statuses.get(200, 0),
+        "rejected_429": statuses.get(429, 0),
+        "other": {str(k): v for k, v in statuses.items() if k not in (200, 429)},
+        "requests_per_second": round(requests / elapsed, 2),
+        "ok_per_second": round(statuses.get(200, 0) / elapsed, 2),
+    }
+    if latencies:
+        report.update(
+            p50_ms=round(statistics.median(latencies) * 1000, 1),
+            p95_ms=round(percentile(latencies, 0.95) * 1000, 1),
+            p99_ms=round(percentile(latencies, 0.99) * 1000, 1),
+            max_ms=round(max(latencies) * 1000, 1),
+        )
+    return report
+
+
+def make_input(operation, folder):
+    """Generate a test input for ``operation`` and return its path."""
+    if operation in PDF_OPERATIONS:
+        path = os.path.join(folder, "load_test.pdf")
+        make_pdf(path, 10)
+    else:
+        path = os.path.join(folder, "load_test.jpg")
+        make_photo_like_image(1600, 1200, seed=3).save(path, quality=92)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the local HTTP service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--operation", default="compress")
+    parser.add_argument("--params", help="query string (default depends on the operation)")
+    parser.add_argument("--password", default="load-test", help="X-Password for lock/unlock")
+    parser.add_argument("--file", help="input file (default: a generated one)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--start-server", action="store_true", help="start a service for the test")
+    parser.add_argument("--workers", type=int, help="worker processes of the started service")
+    parser.add_argument("--queue-depth", type=int, help="queue depth of the started service")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    params = args.params if args.params is not None else DEFAULT_PARAMS.get(args.operation, "")
+    path = f"/{args.operation}" + (f"?{params}" if params else "")
+
+    server = None
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = args.file or make_input(args.operation, folder)
+        with open(filepath, "rb") as f:
+            body = f.read()
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "X-Filename": os.path.basename(filepath),
+            "X-Password": args.password,
+        }
+
+        if args.start_server:
+            command = [sys.executable, "main.py", "serve", "--quiet", "--host", host, "--port", str(port)]
+            if args.workers:
+                command += ["--workers", str(args.workers)]
+            if args.queue_depth is not None:
+                command += ["--queue-depth", str(args.queue_depth)]
+            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            server = subprocess.Popen(command, cwd=project_dir, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_server(host, port)
+            report = run_load(host, port, path, body, headers, args.requests, args.concurrency)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['requests']} requests, concurrency {report['concurrency']}, {report['seconds']}s")
+    print(f"  {report['requests_per_second']} req/s ({report['ok_per_second']} ok/s)")
+    print(f"  ok {report['ok']}, 429 {report['rejected_429']}, other {report['other'] or 0}")
+    if "p99_ms" in report:
+        print(f"  latency p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, "
+              f"p99 {report['p99_ms']} ms, max {report['max_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Command-line interface for the Image & PDF Utility Tool.
+
+Runs the same operations as the GUI without importing tkinter, e.g.:
+
+    python main.py merge "scans/*.pdf" -o packet.pdf
+    python main.py compress photos/*.jpg --target-kb 200 --output-dir out --jobs 4
+    python main.py split report.pdf --ranges 1-3,7 -o summary.pdf
+    python main.py lock @files.txt --password-env PDF_PASSWORD --output-dir locked
+
+Inputs are paths, glob patterns (``**`` matches sub-folders) or ``@list``
+files naming one path per line (``@-`` reads the list from stdin). One
+result is printed per job on stdout, as JSON lines by default, and the exit
+status is 1 if any job failed.
+
+``python main.py pipeline steps.json inputs...`` chains several operations
+in memory (see operations/pipeline.py).
+
+Jobs that would need more memory than ``--memory-mb`` wait for memory,
+run a cheaper path or are refused (see operations/memory_governor.py).
+
+With ``--queue batch.db`` the jobs are first recorded in a resumable queue
+(see operations/job_queue.py); ``python main.py resume batch.db`` finishes
+an interrupted batch and ``python main.py status batch.db`` shows progress.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from operations.result_cache import CACHE_ENV
+from utils.arguments import add_serve_arguments, parse_box, parse_page_ranges
+
+
+OUTPUT_FORMATS = ("jsonl", "json", "csv")
+RESULT_FIELDS = ["operation", "status", "inputs", "output", "seconds", "error"]
+
+
+def expand_inputs(patterns):
+    """Expand glob patterns and ``@list`` files into a list of paths.
+
+    Paths keep the order they were given in; matches of a single glob are
+    sorted. Duplicates are dropped.
+    """
+    paths = []
+    for pattern in patterns:
+        if pattern.startswith("@"):
+            if pattern == "@-":
+                lines = sys.stdin.read().splitlines()
+            else:
+                with open(pattern[1:], encoding="utf-8") as f:
+                    lines = f.read().splitlines()
+            paths.extend(line.strip() for line in lines if line.strip())
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise ValueError(f"No files match {pattern}")
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    return list(dict.fromkeys(paths))
+
+
+def build_parser():
+    """Return the argument parser with one sub-command per operation."""
+    parser = argparse.ArgumentParser(prog="main.py", description="Image & PDF Utility Tool (command line).")
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument("--jobs", type=int, default=1, metavar="N", help="run N jobs in parallel")
+    run_options.add_argument("--format", choices=OUTPUT_FORMATS, default="jsonl", dest="result_format",
+                             help="result format on stdout (default: jsonl)")
+    run_options.add_argument("--cache", metavar="DIR", default=os.environ.get(CACHE_ENV),
+                             help=f"reuse results of identical earlier jobs from this folder (default: ${CACHE_ENV})")
+    run_options.add_argument("--cache-max-mb", type=int, metavar="MB", help="size cap of the cache folder")
+    run_options.add_argument("--memory-mb", type=float, metavar="MB",
+                             help="memory budget shared by the parallel jobs (default: half the physical memory)")
+
+    common = argparse.ArgumentParser(add_help=False, parents=[run_options])
+    common.add_argument("inputs", nargs="+", help="files, glob patterns or @list files")
+    common.add_argument("-o", "--output", help="output file (one job only)")
+    common.add_argument("--output-dir", help="folder for outputs (default: next to each input)")
+    common.add_argument("--queue", metavar="DB",
+                        help="record the jobs in this queue database so the batch can be resumed")
+    common.add_argument("--max-attempts", type=int, default=3, metavar="N",
+                        help="with --queue, attempts per job before it is marked failed (default: 3)")
+
+    subparsers.add_parser("merge", parents=[common], help="merge PDFs into one")
+    subparsers.add_parser("img2pdf", parents=[common], help="convert images to one PDF")
+
+    split = subparsers.add_parser("split", parents=[common], help="extract page ranges from PDFs")
+    split.add_argument("--ranges", type=parse_page_ranges, required=True, help='pages, e.g. "1-3,5"')
+
+    for command, help_text in (("lock", "password-protect PDFs"), ("unlock", "remove PDF passwords")):
+        sub = subparsers.add_parser(command, parents=[common], help=help_text)
+        password = sub.add_mutually_exclusive_group(required=True)
+        password.add_argument("--password")
+        password.add_argument("--password-env", metavar="VAR", help="read the password from this variable")
+
+    resize = subparsers.add_parser("resize", parents=[common], help="resize images")
+    resize.add_argument("--width", type=int)
+    resize.add_argument("--height", type=int)
+
+    crop = subparsers.add_parser("crop", parents=[common], help="crop images")
+    box = crop.add_mutually_exclusive_group(required=True)
+    box.add_argument("--box", type=parse_box, help="left,top,right,bottom in pixels")
+    box.add_argument("--template", help="crop template saved by the crop dialog")
+    crop.add_argument("--absolute", action="store_true", help="use template pixels instead of scaling")
+    crop.add_argument("--lossless", action="store_true", help="crop JPEGs with jpegtran when installed")
+
+    compress = subparsers.add_parser("compress", parents=[common], help="compress images")
+    target = compress.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target-kb", type=int, help="target file size in KB")
+    target.add_argument("--min-ssim", type=float, help="smallest file with at least this SSIM")
+    compress.add_argument("--to", default="JPEG", type=str.upper, dest="output_format",
+                          help="JPEG, PNG, WEBP or AVIF (default: JPEG)")
+    compress.add_argument("--lossless", action="store_true", help="lossless WebP")
+    compress.add_argument("--dither", action="store_true", help="dither PNG palettes")
+
+    add_serve_arguments(subparsers.add_parser("serve", help="run the local HTTP service"))
+
+    pipeline = subparsers.add_parser("pipeline", parents=[run_options],
+                                     help="run a JSON/YAML pipeline of steps in memory")
+    pipeline.add_argument("definition", help="pipeline file (see operations/pipeline.py)")
+    pipeline.add_argument("inputs", nargs="+", help="files, glob patterns or @list files")
+    pipeline.add_argument("-o", "--output", help="output file, for pipelines that write one file")
+    pipeline.add_argument("--output-dir", help="folder for outputs (default: next to each input)")
+    pipeline.add_argument("--queue-size", type=int, help="items allowed to wait between two steps")
+
+    resume = subparsers.add_parser("resume", parents=[run_options], help="finish a batch recorded with --queue")
+    resume.add_argument("queue", metavar="DB", help="queue database")
+    resume.add_argument("--batch", type=int, help="only this batch (default: every unfinished task)")
+
+    status = subparsers.add_parser("status", help="show the batches in a queue database")
+    status.add_argument("queue", metavar="DB", help="queue database")
+
+    cache = subparsers.add_parser("cache", help="show or clear the result cache")
+    cache.add_argument("folder", nargs="?", default=os.environ.get(CACHE_ENV), help=f"cache folder (default: ${CACHE_ENV})")
+    cache.add_argument("--max-mb", type=int, help="change the size cap")
+    cache.add_argument("--clear", action="store_true", help="delete every cached result")
+
+    watch = subparsers.add_parser("watch", help="process files dropped into watched folders")
+    watch.add_argument("config", help="JSON file mapping folders to pipelines (see watcher.py)")
+    watch.add_argument("--once", action="store_true", help="process the files already there, then exit")
+    watch.add_argument("--poll", action="store_true", help="poll the folders instead of using inotify")
+    return parser
+
+
+def build_params(args):
+    """Return the job parameters for the parsed arguments."""
+    if args.command == "split":
+        return {"ranges": args.ranges}
+    if args.command in ("lock", "unlock"):
+        password = args.password
+        if args.password_env:
+            password = os.environ.get(args.password_env)
+            if not password:
+                raise ValueError(f"{args.password_env} is not set.")
+        return {"password": password}
+    if args.command == "resize":
+        return {"width": args.width, "height": args.height}
+    if args.command == "crop":
+        params = {"box": args.box, "lossless": args.lossless}
+        if args.template:
+            from operations.batch_processing import load_crop_template
+            params.update(template=load_crop_template(args.template), relative=not args.absolute)
+        return params
+    if args.command == "compress":
+        # Each job already has its own process; search candidates sequentially
+        return {
+            "target_kb": args.target_kb,
+            "min_ssim": args.min_ssim,
+            "format": args.output_format,
+            "lossless": args.lossless,
+            "dither": args.dither,
+            "max_workers": 1 if args.jobs > 1 else None,
+        }
+    return {}
+
+
+def build_jobs(args, params):
+    """Return the (operation, inputs, output_path, params) jobs to run."""
+    from operations.jobs import default_output_path, takes_many_inputs, unique_output_paths
+
+    inputs = expand_inputs(args.inputs)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if takes_many_inputs(args.command):
+        output_path = args.output or default_output_path(args.command, inputs[0], args.output_dir, params)
+        return [(args.command, inputs, output_path, params)]
+
+    if args.output and len(inputs) > 1:
+        raise ValueError("--output needs a single input; use --output-dir for several.")
+    if args.output:
+        return [(args.command, inputs, args.output, params)]
+    output_paths = unique_output_paths(
+        inputs, [default_output_path(args.command, path, args.output_dir, params) for path in inputs])
+    return [(args.command, [path], output_path, params) for path, output_path in zip(inputs, output_paths)]
+
+
+def iter_results(jobs, max_workers=1, cache_dir=None):
+    """Run jobs and yield their results, in completion order."""
+    from operations.jobs import init_worker, run_job
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield run_job(*job, cache_dir)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(max_workers,)) as executor:
+        futures = [executor.submit(run_job, *job, cache_dir) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    """Run the command line; returns the process exit status."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        from server import serve
+        try:
+            serve(args.host, args.port, args.workers, args.queue_depth, args.max_upload_mb, args.quiet, args.cache)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        return 0
+    if args.command == "watch":
+        from watcher import WatchDaemon, load_config
+        try:
+            config = load_config(args.config)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        WatchDaemon(config, poll=args.poll).run(once=args.once)
+        return 0
+    if args.command == "cache":
+        if not args.folder:
+            parser.error(f"give a cache folder or set {CACHE_ENV}")
+        from operations.result_cache import ResultCache
+        cache = ResultCache(args.folder, None if args.max_mb is None else args.max_mb * 1024 * 1024)
+        if args.clear:
+            cache.clear()
+        cache.evict()
+        print(json.dumps(cache.stats(), indent=2))
+        return 0
+    if args.command != "status" and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.command != "status" and args.memory_mb is not None:
+        from operations.memory_governor import MEMORY_ENV
+        # Worker processes each take their share of it (see jobs.init_worker)
+        os.environ[MEMORY_ENV] = str(args.memory_mb)
+    if args.command == "pipeline":
+        try:
+            return run_pipeline_command(args)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.command in ("resume", "status"):
+        try:
+            return run_queue_command(args)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if args.command == "resize" and not (args.width or args.height):
+        parser.error("resize needs --width, --height or both")
+    if args.command == "compress" and args.output_format not in ("JPEG", "PNG", "WEBP", "AVIF"):
+        parser.error(f"unknown output format: {args.output_format}")
+
+    try:
+        params = build_params(args)
+        jobs = build_jobs(args, params)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.cache and args.cache_max_mb is not None:
+        from operations.result_cache import ResultCache
+        ResultCache(args.cache, args.cache_max_mb * 1024 * 1024).close()
+    if not args.queue:
+        return print_results(iter_results(jobs, args.jobs, args.cache), args.result_format)
+
+    from operations.job_queue import JobQueue, iter_queue
+    if "password" in params:
+        # Never store passwords; tasks read them from the environment when they run
+        if not args.password_env:
+            parser.error("use --password-env with --queue, so the password is not stored")
+        # Every job shares the one params dict
+        del params["password"]
+        params["password_env"] = args.password_env
+    queue = JobQueue(args.queue)
+    batch_id = queue.add_batch(jobs, description=" ".join(argv or sys.argv[1:]), max_attempts=args.max_attempts)
+    print(f"Batch {batch_id}: {len(jobs)} jobs in {args.queue}", file=sys.stderr)
+    try:
+        return print_results(iter_queue(queue, batch_id, args.jobs, cache_dir=args.cache), args.result_format)
+    finally:
+        queue.close()
+
+
+def run_pipeline_command(args):
+    """Run the ``pipeline`` command.
+
+    With ``--jobs N`` the inputs are shared out between N pipelines running
+    in parallel processes; steps that combine files (img2pdf, merge) need
+    every input in one pipeline, so they always run in one.
+    """
+    from operations.jobs import init_worker
+    from operations.pipeline import PIPELINE_STEPS, DEFAULT_QUEUE_SIZE, load_pipeline, run_pipeline
+
+    definition = load_pipeline(args.definition)
+    steps = definition["steps"]
+    inputs = expand_inputs(args.inputs)
+    output_dir = args.output_dir or definition.get("output_dir")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    options = {
+        "output_dir": output_dir,
+        "output": args.output or definition.get("output"),
+        "queue_size": args.queue_size or definition.get("queue_size", DEFAULT_QUEUE_SIZE),
+    }
+    combines = any(PIPELINE_STEPS.get(step.get("operation"), (None,) * 4)[3] for step in steps)
+    if args.jobs <= 1 or combines or len(inputs) <= 1:
+        return print_results(run_pipeline(steps, inputs, **options), args.result_format)
+
+    def iter_parallel():
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(args.jobs,)) as executor:
+            futures = [executor.submit(run_pipeline, steps, inputs[i::args.jobs], **options)
+                       for i in range(args.jobs)]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    return print_results(iter_parallel(), args.result_format)
+
+
+def run_queue_command(args):
+    """Run the ``resume`` and ``status`` commands."""
+    from operations.job_queue import JobQueue, iter_queue
+    if not os.path.exists(args.queue):
+        raise ValueError(f"No queue database at {args.queue}")
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == "status":
+            print(json.dumps(queue.batches(), indent=2))
+            return 0
+        return print_results(iter_queue(queue, args.batch, args.jobs, cache_dir=args.cache), args.result_format)
+    finally:
+        queue.close()
+
+
+def print_results(results, result_format):
+    """Print results as they arrive; returns 1 if any job failed for good, else 0."""
+    failed = False
+    collected = []
+    writer = None
+    for result in results:
+        # Queued jobs that will be retried have not failed yet
+        if result["status"] != "done" and result.get("queue_status") != "pending":
+            failed = True
+        if result_format == "jsonl":
+            print(json.dumps(result), flush=True)
+        elif result_format == "csv":
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(dict(result, inputs=";".join(result["inputs"])))
+            sys.stdout.flush()
+        else:
+            collected.append(result)
+    if result_format == "json":
+        print(json.dumps(collected, indent=2))
+    return 1 if failed else 0
@@ -8,18 +8,58 @@ A comprehensive tool for PDF and image operations including:
 - Lock PDF (password-protect with AES-256)
 - Unlock PDF (remove password protection)
 - Resize images
-- Crop images (interactive)
-- Compress images to target size
+- Crop images (interactive, with zoom and lossless JPEG crops)
+- Batch crop images with saved crop templates
+- Batch compress folders of images to a target size, with a report
+- Compress images to a target size or a minimum SSIM
+
+Set IMAGE_PDF_TOOL_TRACE to a file path to record a trace of every
+operation (see utils/tracing.py). Operation modules are imported in the
+background once the window is shown; set IMAGE_PDF_TOOL_PREWARM=0 to
+import them only when first used. Decoded images are shared between
+operations on the same file, up to IMAGE_PDF_TOOL_IMAGE_CACHE_MB megabytes
+(see operations/image_cache.py). Command-line and service jobs are kept
+within a memory budget of IMAGE_PDF_TOOL_MEMORY_MB megabytes (see
+operations/memory_governor.py).
+
+Run with a command (merge, split, img2pdf, lock, unlock, resize, crop,
+compress) to use the tool from the command line instead; see cli.py or
+``python main.py --help``. ``python main.py serve`` runs the same
+operations as a local HTTP service (see server.py), and
+``python main.py watch`` processes files dropped into folders (see
+watcher.py). ``python main.py pipeline`` chains operations in memory
+without intermediate files (see operations/pipeline.py).
 """
+import os
+import sys
+import time
+
+START_TIME = time.perf_counter()
+
 
-from app import ImagePdfToolApp
+# Set to 0 to skip importing the operation modules in the background
+PREWARM_ENV = "IMAGE_PDF_TOOL_PREWARM"
+
+
+def on_first_paint(app):
+    """Report the time to the first window and start the pre-warm."""
+    print(f"Window shown in {(time.perf_counter() - START_TIME) * 1000:.0f} ms")
+    if os.environ.get(PREWARM_ENV, "1") != "0":
+        app.start_prewarm()
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Command line mode never imports tkinter
+        from cli import main as cli_main
+        sys.exit(cli_main())
+
+    from app import ImagePdfToolApp
     app = ImagePdfToolApp()
     # Default window size
-    app.geometry("800x530")
-    app.minsize(800, 530)
+    app.geometry("800x600")
+    app.minsize(800, 600)
+    app.on_first_paint(lambda: on_first_paint(app))
     print("Started Successfully...")
     app.mainloop()
     print("Closing...")
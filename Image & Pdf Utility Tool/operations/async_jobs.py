@@ -0,0 +1,158 @@
+"""
+asyncio interface to the headless jobs, for embedding in async services.
+
+    jobs = AsyncJobs(max_concurrency=4)
+    result = await jobs.compress("photo.jpg", "small.jpg", target_kb=200)
+    pages = (await jobs.merge(["a.pdf", "b.pdf"], "both.pdf"))["pages"]
+
+Every call runs ``run_job`` on an executor, so the event loop never waits
+on Pillow or PyPDF2. By default that is a process pool shared by every
+AsyncJobs in the process. A semaphore limits how many of an AsyncJobs'
+calls run at once; the rest wait without holding a worker. A slot is
+only given back once its worker is done, so cancelling calls cannot push
+more jobs onto the executor than ``max_concurrency``. Calls return
+the same result dicts as ``run_job`` and do not raise when a job fails,
+even when its worker process dies.
+
+Jobs write to a hidden partial file next to the output, which is renamed
+to the output only when the job succeeds. Cancelling the task that awaits
+a call removes the partial file. A job that has not started yet is simply
+dropped. A job that is already running in a worker cannot be interrupted,
+so its partial file is removed as soon as it finishes. Either way, a
+cancelled call never leaves an output behind.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from operations.jobs import init_worker, run_job
+
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """Return the process pool shared by AsyncJobs instances, starting it once."""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            # Spawned workers do not inherit the service's sockets or threads
+            workers = os.cpu_count() or 1
+            _shared_executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=init_worker, initargs=(workers,))
+        return _shared_executor
+
+
+def _discard_shared_executor(executor):
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is executor:
+            _shared_executor = None
+    executor.shutdown(wait=False)
+
+
+def _partial_path(output_path):
+    """Return a hidden temporary path next to ``output_path`` with the same extension."""
+    folder, name = os.path.split(output_path)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(folder, f".{stem}.{uuid.uuid4().hex[:8]}.partial{extension}")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class AsyncJobs:
+    """Runs jobs from asyncio code on an executor, a limited number at a time."""
+
+    def __init__(self, max_concurrency=None, executor=None, cache_dir=None):
+        """``executor`` defaults to the shared process pool (see get_shared_executor)."""
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.executor = executor
+        self.cache_dir = cache_dir
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def run(self, operation, inputs, output_path, params=None):
+        """Run one job and return its result dict (see ``run_job``)."""
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        executor = self.executor or get_shared_executor()
+        partial_path = _partial_path(output_path)
+        try:
+            future = executor.submit(run_job, operation, list(inputs), partial_path, params, self.cache_dir)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # The slot is freed when the worker is done, not when the caller stops waiting
+        future.add_done_callback(lambda _: self._release_slot(loop))
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                # Already running in a worker; clean up once it is done
+                future.add_done_callback(lambda _: _remove(partial_path))
+            raise
+        except BrokenProcessPool as e:
+            # A worker died; start a fresh shared pool for later calls
+            _discard_shared_executor(executor)
+            result = {"operation": operation, "inputs": list(inputs), "status": "failed", "error": str(e)}
+        if result["status"] == "done":
+            try:
+                os.replace(partial_path, output_path)
+            except OSError as e:
+                _remove(partial_path)
+                result.update(status="failed", error=f"Could not write {output_path}: {e}")
+        else:
+            _remove(partial_path)
+        result["output"] = output_path
+        return result
+
+    def _release_slot(self, loop):
+        """Give a semaphore slot back from whichever thread finished the job."""
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            pass  # The event loop is closed; nobody is waiting for the slot
+
+    async def merge(self, inputs, output_path):
+        return await self.run("merge", inputs, output_path)
+
+    async def split(self, filepath, ranges, output_path):
+        """Write the pages of 1-based inclusive ``ranges`` to ``output_path``."""
+        return await self.run("split", [filepath], output_path, {"ranges": [list(r) for r in ranges]})
+
+    async def images_to_pdf(self, inputs, output_path):
+        return await self.run("img2pdf", inputs, output_path)
+
+    async def lock(self, filepath, output_path, password):
+        return await self.run("lock", [filepath], output_path, {"password": password})
+
+    async def unlock(self, filepath, output_path, password):
+        return await self.run("unlock", [filepath], output_path, {"password": password})
+
+    async def resize(self, filepath, output_path, width=None, height=None):
+        """Resize an image; a missing side keeps the aspect ratio."""
+        return await self.run("resize", [filepath], output_path, {"width": width, "height": height})
+
+    async def crop(self, filepath, output_path, box=None, template=None, relative=True, lossless=False):
+        """Crop an image to ``box`` or to a crop ``template`` (see jobs._crop)."""
+        params = {"box": list(box) if box else None, "template": template,
+                  "relative": relative, "lossless": lossless}
+        return await self.run("crop", [filepath], output_path, params)
+
+    async def compress(self, filepath, output_path, target_kb=None, min_ssim=None, format="JPEG",
+                       lossless=False, dither=False):
+        """Compress an image to ``target_kb`` or to the smallest size keeping ``min_ssim``."""
+        if (target_kb is None) == (min_ssim is None):
+            raise ValueError("Please give either target_kb or min_ssim.")
+        params = {"target_kb": target_kb, "min_ssim": min_ssim, "format": format,
+                  "lossless": lossless, "dither": dither, "max_workers": 1}
+        return await self.run("compress", [filepath], output_path, params)
@@ -0,0 +1,194 @@
+"""
+Batch processing for the Image & PDF Utility Tool.
+
+Batch jobs run one file per task on a process pool, so big folders use all
+CPU cores. Results are yielded per file as soon as each task finishes.
+Workers are spawned rather than forked, since the GUI that starts them
+runs threads, and each takes its share of the memory budget (see
+``jobs.init_worker``).
+"""
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from operations.compression import compress_to_target_size, OUTPUT_FORMATS
+from operations.image_processing import crop_image_file, resolve_crop_template
+from operations.jobs import init_worker, unique_output_paths
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp")
+REPORT_FIELDS = [
+    "input", "output", "status", "original_size", "final_size",
+    "original_width", "original_height", "width", "height",
+    "format", "quality", "colors", "seconds", "error",
+]
+
+
+def list_image_files(folder, recursive=False):
+    """Return the sorted paths of the images in ``folder``.
+
+    With ``recursive`` set, images in sub-folders are included too.
+    """
+    if not recursive:
+        return sorted(
+            os.path.join(folder, name)
+            for name in os.listdir(folder)
+            if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(folder, name))
+        )
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(folder)
+        for name in names
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def save_crop_template(path, template):
+    """Write a crop template to a JSON file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(template, f, indent=2)
+
+
+def load_crop_template(path):
+    """Read a crop template from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        template = json.load(f)
+    if len(template.get("box", ())) != 4 or len(template.get("image_size", ())) != 2:
+        raise ValueError("Not a valid crop template.")
+    return template
+
+
+def _worker_pool(max_workers=None):
+    """Return a process pool of ``max_workers`` (default: one per core) job workers."""
+    workers = max_workers or os.cpu_count() or 1
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_worker, initargs=(workers,))
+
+
+def _crop_one(filepath, output_path, template, relative, lossless):
+    """Crop a single file for a batch (runs in a worker process)."""
+    result = {"input": filepath, "output": output_path}
+    try:
+        with Image.open(filepath) as img:
+            box = resolve_crop_template(template, img.size, relative=relative)
+        x1, y1, x2, y2 = crop_image_file(filepath, output_path, box, lossless=lossless)
+        result.update(ok=True, width=x2 - x1, height=y2 - y1, box=[x1, y1, x2, y2])
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+    return result
+
+
+def iter_batch_crop(filepaths, template, output_dir, relative=True, lossless=True, max_workers=None):
+    """Apply a crop template to many files in parallel.
+
+    Yields one result dict per file, in completion order. Outputs are written
+    to ``output_dir`` as ``cropped_<name>``.
+    """
+    with _worker_pool(max_workers) as executor:
+        futures = [
+            executor.submit(
+                _crop_one,
+                filepath,
+                os.path.join(output_dir, f"cropped_{os.path.basename(filepath)}"),
+                template,
+                relative,
+                lossless,
+            )
+            for filepath in filepaths
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _compress_one(filepath, output_path, target_kb, fmt, lossless, dither):
+    """Compress a single file for a batch (runs in a worker process).
+
+    Files already under the target are copied unchanged instead of being
+    re-encoded.
+    """
+    start = time.perf_counter()
+    result = {"input": filepath, "output": output_path}
+    try:
+        result["original_size"] = os.path.getsize(filepath)
+        with Image.open(filepath) as img:
+            result.update(original_width=img.width, original_height=img.height)
+            if result["original_size"] <= target_kb * 1024:
+                output_path = os.path.splitext(output_path)[0] + os.path.splitext(filepath)[1]
+                shutil.copyfile(filepath, output_path)
+                result.update(
+                    status="skipped",
+                    output=output_path,
+                    final_size=result["original_size"],
+                    width=img.width,
+                    height=img.height,
+                    format=img.format,
+                )
+            else:
+                # The pool already runs one file per core, so search sequentially
+                compressed = compress_to_target_size(
+                    img, target_kb, output_path, fmt=fmt, lossless=lossless, dither=dither, max_workers=1)
+                result.update(
+                    status="compressed",
+                    final_size=compressed["size"],
+                    width=compressed["width"],
+                    height=compressed["height"],
+                    format=fmt,
+                    quality=None if compressed["lossless"] else compressed["quality"],
+                    colors=compressed.get("colors"),
+                )
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def iter_batch_compress(filepaths, target_kb, output_dir, fmt="JPEG", lossless=False, dither=False,
+                        input_dir=None, max_workers=None):
+    """Compress many files to a target size in parallel.
+
+    Yields one result dict per file, in completion order. Outputs are
+    written to ``output_dir``; when ``input_dir`` is given, sub-folders
+    relative to it are recreated there. Files that would share an output
+    name (``a.jpg`` and ``a.png``) keep their extension in it.
+    """
+    extension = OUTPUT_FORMATS[fmt]["extension"]
+    output_paths = []
+    for filepath in filepaths:
+        relative_dir = os.path.relpath(os.path.dirname(filepath), input_dir) if input_dir else "."
+        target_dir = os.path.normpath(os.path.join(output_dir, relative_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        output_paths.append(os.path.join(target_dir, f"compressed_{name}{extension}"))
+    output_paths = unique_output_paths(filepaths, output_paths)
+    with _worker_pool(max_workers) as executor:
+        futures = []
+        for filepath, output_path in zip(filepaths, output_paths):
+            futures.append(executor.submit(
+                _compress_one,
+                filepath,
+                output_path,
+                target_kb,
+                fmt,
+                lossless,
+                dither,
+            ))
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_report(results, path):
+    """Write batch results as CSV or JSON, depending on the file extension."""
+    if path.lower().endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
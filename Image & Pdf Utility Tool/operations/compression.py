@@ -0,0 +1,763 @@
+"""
+Target-size image compression for the Image & PDF Utility Tool.
+
+Output can be JPEG, PNG, WebP (lossy or lossless, alpha preserved) or AVIF
+when the installed Pillow can write it. The solver first lowers the encoder
+quality and only then shrinks the image. Both
+searches run against a size model fitted on small downsampled probes, so
+nearly all trial encodes are cheap; only the final one or two candidates are
+encoded at full resolution, and each of those recalibrates the model.
+
+PNG has its own search: zlib settings first, then palette quantization,
+then resizing, stopping at the first step that meets the target.
+
+Instead of a size, ``compress_to_quality`` targets a minimum SSIM and
+returns the smallest full resolution file that reaches it.
+"""
+import io
+import math
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from operations.quality_metrics import SSIMReference
+from utils.tracing import in_context, is_enabled, span, traced
+
+
+# Quality search range and file details per output format
+OUTPUT_FORMATS = {
+    "JPEG": {"label": "JPEG", "extension": ".jpg", "min_quality": 60, "max_quality": 85, "alpha": False},
+    "PNG": {"label": "PNG", "extension": ".png", "min_quality": None, "max_quality": None, "alpha": True},
+    "WEBP": {"label": "WebP", "extension": ".webp", "min_quality": 50, "max_quality": 90, "alpha": True},
+    "AVIF": {"label": "AVIF", "extension": ".avif", "min_quality": 40, "max_quality": 80, "alpha": True},
+}
+LOSSLESS_EFFORT = 80  # WebP lossless "quality" is compression effort, not fidelity
+MIN_DIMENSION = 50
+PROBE_SIZE = 512  # Longest side of the downsampled probe, in pixels
+MAX_ROUNDS = 3
+MAX_ATTEMPTS = 10  # Hard cap on search rounds while nothing fits yet
+MAX_PARALLEL_CANDIDATES = 4
+TARGET_TOLERANCE = 0.90  # Accept results within 10% under the target
+TARGET_AIM = 0.95  # Plan candidates for the middle of the accepted window
+SSIM_QUALITY_RANGE = (10, 95)  # Quality searched by the SSIM mode
+PNG_PALETTE_SIZES = (256, 128, 64)  # Palettes tried after lossless PNG, in order
+PNG_ZLIB_SETTINGS = (  # (compress_level, zlib strategy) tried for every palette
+    (9, zlib.Z_DEFAULT_STRATEGY),
+    (9, zlib.Z_FILTERED),
+    (9, zlib.Z_RLE),
+)
+PNG_NATIVE_MODES = ("1", "L", "LA", "P", "I", "I;16")  # Stored by PNG as they are
+
+
+class EncodeSink:
+    """Write-only file object that counts encoded bytes.
+
+    Bytes are kept only while the total stays within ``keep_limit``; once an
+    encode grows past it the buffer is dropped and the sink just counts.
+    Trial encodes that overshoot the target therefore cost no memory, while
+    a candidate that fits keeps its bytes so it can be written to disk
+    without encoding it again.
+    """
+
+    def __init__(self, keep_limit=0):
+        self.keep_limit = keep_limit
+        self.size = 0
+        self._chunks = []
+
+    def write(self, data):
+        self.size += len(data)
+        if self._chunks is not None:
+            if self.size <= self.keep_limit:
+                self._chunks.append(bytes(data))
+            else:
+                self._chunks = None
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        """Return the encoded bytes, or None if they were discarded."""
+        if self._chunks is None:
+            return None
+        return b"".join(self._chunks)
+
+
+def get_available_formats():
+    """Return the output formats the installed Pillow can encode."""
+    available = ["JPEG", "PNG"]
+    if features.check("webp"):
+        available.append("WEBP")
+    Image.init()
+    if "AVIF" in Image.SAVE:
+        available.append("AVIF")
+    return available
+
+
+def get_format_choices():
+    """Return the compression choices offered by the dialogs.
+
+    Maps a display label to the keyword arguments it passes to
+    ``compress_to_target_size``.
+    """
+    choices = {}
+    for fmt in get_available_formats():
+        choices[OUTPUT_FORMATS[fmt]["label"]] = {"fmt": fmt}
+        if fmt == "PNG":
+            choices["PNG (dithered)"] = {"fmt": fmt, "dither": True}
+        elif fmt == "WEBP":
+            choices["WebP (lossless)"] = {"fmt": fmt, "lossless": True}
+    return choices
+
+
+def get_quality_range(fmt, lossless=False):
+    """Return the (min, max) quality searched for ``fmt``."""
+    if lossless:
+        return LOSSLESS_EFFORT, LOSSLESS_EFFORT
+    return OUTPUT_FORMATS[fmt]["min_quality"], OUTPUT_FORMATS[fmt]["max_quality"]
+
+
+def prepare_image(image, fmt):
+    """Return ``image`` in a mode ``fmt`` can store, keeping alpha if it can.
+
+    The image itself is returned when no conversion is needed. PNG keeps
+    grayscale, palette and bilevel images in their own (smaller) mode.
+    Formats without alpha drop it, and 16 and 32-bit grayscale is scaled
+    down to 8 bits rather than clipped.
+    """
+    alpha = OUTPUT_FORMATS[fmt]["alpha"]
+    if fmt == "PNG" and image.mode in PNG_NATIVE_MODES:
+        return image
+    if image.mode in (('RGB', 'RGBA') if alpha else ('RGB', 'L', 'CMYK')):
+        return image
+    if image.mode in ('I', 'I;16'):
+        gray = _scale_to_8_bit(image)
+        if alpha:
+            with gray:
+                return gray.convert('RGB')
+        return gray
+    if not alpha:
+        return image.convert('L' if image.mode in ('1', 'LA', 'F') else 'RGB')
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _scale_to_8_bit(image):
+    """Return a 16 or 32-bit integer grayscale image as an L image, keeping its range."""
+    with image.point(lambda value: value / 256) as scaled:
+        return scaled.convert('L')
+
+
+def encode_image(img, quality, fmt="JPEG", lossless=False, keep_limit=0):
+    """Encode ``img`` and return the sink holding the result.
+
+    Only the size is recorded unless the output fits in ``keep_limit``
+    bytes, in which case the sink also keeps the encoded bytes.
+    """
+    sink = EncodeSink(keep_limit)
+    with span("encode", format=fmt, quality=quality, size=img.size) as encode_span:
+        if fmt == "JPEG":
+            img.save(sink, format='JPEG', quality=quality, optimize=True)
+        elif fmt == "WEBP":
+            img.save(sink, format='WEBP', quality=quality, lossless=lossless, method=4)
+        else:
+            img.save(sink, format=fmt, quality=quality)
+        encode_span.set(bytes_out=sink.size)
+    return sink
+
+
+def scaled_size(size, scale):
+    """Return ``size`` multiplied by ``scale``, never below MIN_DIMENSION."""
+    width, height = size
+    if scale >= 1.0:
+        return width, height
+    return max(MIN_DIMENSION, int(width * scale)), max(MIN_DIMENSION, int(height * scale))
+
+
+class SizeModel:
+    """Predicts the encoded size of an image from downsampled probes.
+
+    Encoding a probe and a half-size probe at the same quality fits a power
+    law ``bytes = a * pixels ** b`` for that quality, which extrapolates to
+    any output size. Every real full resolution encode is recorded: a
+    prediction is anchored on the nearest real measurement at the same
+    quality (or rescaled by the latest measurement at another quality), and
+    two measurements at one quality replace the probe exponent with their
+    own, so the model behaves like a secant search once data comes in.
+    """
+
+    def __init__(self, img, fmt="JPEG", lossless=False, size=None):
+        # ``img`` may be a reduced copy; ``size`` is then the full size to predict for
+        self.size = size or img.size
+        self.format = fmt
+        self.lossless = lossless
+        self.min_quality, self.max_quality = get_quality_range(fmt, lossless)
+        probe_scale = min(1.0, PROBE_SIZE / max(img.size))
+        probe_size = (max(2, int(img.width * probe_scale)), max(2, int(img.height * probe_scale)))
+        self.probe = img.resize(probe_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        self.small_probe = self.probe.resize(
+            (probe_size[0] // 2, probe_size[1] // 2), Image.Resampling.BILINEAR)
+        self.probe_pixels = probe_size[0] * probe_size[1]
+        self.small_probe_pixels = (probe_size[0] // 2) * (probe_size[1] // 2)
+        self.correction = 1.0
+        self.probe_encodes = 0
+        self._fits = {}  # quality -> (probe bytes, exponent)
+        self._measurements = {}  # quality -> [(pixels, bytes), ...]
+
+    def _fit(self, quality):
+        """Return the (probe bytes, exponent) power law for ``quality``."""
+        if quality not in self._fits:
+            probe_bytes = self.encode(self.probe, quality).size
+            small_bytes = self.encode(self.small_probe, quality).size
+            self.probe_encodes += 2
+            exponent = math.log(probe_bytes / small_bytes) / math.log(self.probe_pixels / self.small_probe_pixels)
+            self._fits[quality] = (probe_bytes, _clamp_exponent(exponent))
+        return self._fits[quality]
+
+    def encode(self, img, quality, keep_limit=0):
+        """Encode ``img`` with this model's format settings."""
+        return encode_image(img, quality, self.format, self.lossless, keep_limit)
+
+    def _probe_predict(self, quality, pixels):
+        probe_bytes, exponent = self._fit(quality)
+        return probe_bytes * (pixels / self.probe_pixels) ** exponent
+
+    def predict(self, quality, scale=1.0):
+        """Predict the encoded size in bytes at ``quality`` and ``scale``."""
+        width, height = scaled_size(self.size, scale)
+        pixels = width * height
+        measurements = self._measurements.get(quality)
+        if not measurements:
+            return self._probe_predict(quality, pixels) * self.correction
+
+        nearest = sorted(measurements, key=lambda m: abs(math.log(m[0] / pixels)))
+        anchor_pixels, anchor_bytes = nearest[0]
+        other = next((m for m in nearest[1:] if m[0] != anchor_pixels), None)
+        if other is not None:
+            exponent = _clamp_exponent(math.log(anchor_bytes / other[1]) / math.log(anchor_pixels / other[0]))
+        else:
+            exponent = self._fit(quality)[1]
+        return anchor_bytes * (pixels / anchor_pixels) ** exponent
+
+    def calibrate(self, quality, scale, actual_bytes):
+        """Record a real encode and refit the correction factor."""
+        width, height = scaled_size(self.size, scale)
+        pixels = width * height
+        self._measurements.setdefault(quality, []).append((pixels, actual_bytes))
+        self.correction = actual_bytes / self._probe_predict(quality, pixels)
+
+    def best_quality(self, target_bytes, scale=1.0):
+        """Binary search the highest quality predicted to fit, or None."""
+        low, high = self.min_quality, self.max_quality
+        if self.predict(low, scale) > target_bytes:
+            return None
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.predict(mid, scale) <= target_bytes:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def best_scale(self, target_bytes, quality):
+        """Binary search the largest scale predicted to fit at ``quality``."""
+        low, high = 0.0, 1.0
+        for _ in range(20):
+            mid = (low + high) / 2
+            if self.predict(quality, mid) <= target_bytes:
+                low = mid
+            else:
+                high = mid
+        return low
+
+    def plan(self, target_bytes, aim=TARGET_AIM):
+        """Return the (quality, scale) candidate predicted to land at ``aim`` of the target."""
+        aim_bytes = target_bytes * aim
+        quality = self.best_quality(aim_bytes)
+        if quality is not None:
+            return quality, 1.0
+        return self.min_quality, self.best_scale(aim_bytes, self.min_quality)
+
+    def preview(self, target_bytes):
+        """Return the predicted outcome of compressing to ``target_bytes``.
+
+        The dict has the planned ``quality``, the output ``width`` and
+        ``height`` and the predicted ``size`` in bytes.
+        """
+        quality, scale = self.plan(target_bytes)
+        width, height = scaled_size(self.size, scale)
+        return {
+            "quality": quality,
+            "width": width,
+            "height": height,
+            "size": int(self.predict(quality, scale)),
+        }
+
+    def bracket(self, target_bytes, count):
+        """Return up to ``count`` distinct candidates spread around the target.
+
+        The candidates aim from just under the accepted window to the target
+        itself, so evaluating them together usually brackets the real size.
+        """
+        if count == 1:
+            return [self.plan(target_bytes)]
+        low, high = TARGET_TOLERANCE - 0.02, 1.0
+        aims = [low + (high - low) * i / (count - 1) for i in range(count)]
+        candidates = []
+        for aim in aims:
+            candidate = self.plan(target_bytes, aim)
+            if candidate not in candidates:
+                candidates.append(candidate)
+        return candidates
+
+
+def build_size_model(filepath, fmt="JPEG", lossless=False):
+    """Build a SizeModel for an image file without a full resolution decode.
+
+    JPEGs are decoded at a reduced DCT scale just large enough for the
+    probe, so this is cheap enough to run while a dialog opens.
+    """
+    lossless = lossless and fmt == "WEBP"
+    with Image.open(filepath) as img:
+        size = img.size
+        img.draft(None, (PROBE_SIZE, PROBE_SIZE))
+        working_img = prepare_image(img, fmt)
+        working_img.load()
+        model = SizeModel(working_img, fmt, lossless, size=size)
+        if working_img is not img:
+            working_img.close()
+    return model
+
+
+def _clamp_exponent(exponent):
+    """Keep fitted pixel/size exponents in a physically sensible range."""
+    return min(1.5, max(0.3, exponent))
+
+
+def _encode_candidate(model, working_img, quality, scale, keep_limit):
+    """Resize (if needed) and encode one candidate; runs on a worker thread.
+
+    Returns the candidate's (width, height) and its encode sink. Resized
+    copies are released straight away, only the encoded bytes are kept.
+    """
+    new_size = scaled_size(working_img.size, scale)
+    if new_size == working_img.size:
+        return new_size, model.encode(working_img, quality, keep_limit)
+    with span("resize", size=new_size):
+        candidate = working_img.resize(new_size, Image.Resampling.LANCZOS)
+    with candidate:
+        return new_size, model.encode(candidate, quality, keep_limit)
+
+
+def _write_output(data, output_path):
+    """Write the encoded result to ``output_path``, a path or a binary file object."""
+    if hasattr(output_path, "write"):
+        output_path.write(data)
+        return
+    with span("write", output=output_path):
+        with open(output_path, "wb") as f:
+            f.write(data)
+
+
+def _source_png(image):
+    """Return the (bytes, size) of the PNG file ``image`` was opened from, or None."""
+    filename = getattr(image, "filename", None)
+    if image.format != "PNG" or not filename:
+        return None
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as source:
+            return data, source.size
+    except OSError:
+        return None
+
+
+def _decode(image, fmt):
+    """Decode ``image`` (a no-op if it already is) and convert it for ``fmt``."""
+    with span("decode", size=image.size, mode=image.mode):
+        image.load()
+        return prepare_image(image, fmt)
+
+
+@traced("compress_image")
+def compress_to_target_size(image, target_kb, output_path, fmt="JPEG", lossless=False, dither=False,
+                            max_workers=None):
+    """Compress an image to a target size in KB and save it as ``fmt``.
+
+    ``fmt`` is one of OUTPUT_FORMATS; ``lossless`` applies to WebP only and
+    ``dither`` to PNG only (see ``compress_png_to_target_size``).
+    Quality is lowered first (down to the format's minimum), then the image
+    is resized proportionally; lossless WebP only searches over scale.
+    Each round normally encodes the model's single best candidate at full
+    resolution. When the model is unsure (its plan is predicted to miss
+    the accepted window, or an encode missed its prediction by more than
+    that window even after calibration) the round instead evaluates up to
+    ``max_workers`` candidates around the target at once on a thread pool
+    (Pillow releases the GIL while resizing and encoding), so it costs
+    about one encode of wall time. Trial encodes go to a counting sink; the bytes of the winning
+    candidate are written to ``output_path`` (a path or a binary file
+    object) as they are. Returns a dict with the final ``size`` in bytes,
+    ``width``, ``height`` and ``quality``, plus the number of search
+    ``rounds``, full resolution ``encodes`` and ``probe_encodes`` that were
+    needed.
+    """
+    if fmt == "PNG":
+        return compress_png_to_target_size(image, target_kb, output_path, dither=dither, max_workers=max_workers)
+
+    target_bytes = target_kb * 1024
+    if max_workers is None:
+        max_workers = min(MAX_PARALLEL_CANDIDATES, os.cpu_count() or 1)
+
+    # Convert the image only if the format cannot store its mode; otherwise
+    # it is encoded straight from the caller's image without a copy
+    lossless = lossless and fmt == "WEBP"
+    working_img = _decode(image, fmt)
+
+    with span("probe"):
+        model = SizeModel(working_img, fmt, lossless)
+
+    best = None  # (size, data, dimensions, quality) of the largest candidate that fits
+    smallest = None  # (size, dimensions, quality, scale) fallback when nothing fits
+    full_encodes = 0
+    rounds = 0
+    tried = set()
+    missed = False  # Real sizes were off even after calibrating on a real encode
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while rounds < MAX_ROUNDS or (best is None and rounds < MAX_ATTEMPTS):
+            # Spend extra full resolution encodes only while the model is unsure
+            quality, scale = model.plan(target_bytes)
+            fill = model.predict(quality, scale) / target_bytes
+            count = max_workers if missed or not TARGET_TOLERANCE <= fill <= 1.0 else 1
+            candidates = [c for c in model.bracket(target_bytes, count) if c not in tried]
+            if not candidates and best is None and smallest is not None:
+                # The model keeps proposing candidates that were too big;
+                # shrink the smallest one by its measured overshoot
+                smallest_bytes, _, quality, scale = smallest
+                scale = scale * math.sqrt(target_bytes / smallest_bytes * TARGET_AIM)
+                candidates = [(quality, scale)]
+            if not candidates:
+                break
+            tried.update(candidates)
+            rounds += 1
+
+            # Probe-only predictions are expected to be off; calibrated ones are not
+            calibrated = full_encodes > 0
+            predictions = [model.predict(quality, scale) for quality, scale in candidates]
+            results = executor.map(
+                in_context(lambda c: _encode_candidate(model, working_img, c[0], c[1], target_bytes)), candidates)
+            missed = False
+            for (quality, scale), predicted, (dimensions, sink) in zip(candidates, predictions, results):
+                full_encodes += 1
+                missed = missed or (calibrated and abs(sink.size / predicted - 1) > 1 - TARGET_TOLERANCE)
+                model.calibrate(quality, scale, sink.size)
+                if sink.size <= target_bytes:
+                    if best is None or sink.size > best[0]:
+                        best = (sink.size, sink.getvalue(), dimensions, quality)
+                elif smallest is None or sink.size < smallest[0]:
+                    smallest = (sink.size, dimensions, quality, scale)
+
+            # Stop when close enough, or when nothing better can be produced
+            if best is not None:
+                if best[0] >= target_bytes * TARGET_TOLERANCE:
+                    break
+                if best[3] == model.max_quality and best[2] == working_img.size:
+                    break
+            elif smallest is not None and min(smallest[1]) <= MIN_DIMENSION:
+                break
+
+    if best is not None:
+        _, data, (final_width, final_height), quality = best
+    else:
+        if smallest is not None and min(smallest[1]) <= MIN_DIMENSION:
+            _, _, quality, scale = smallest
+        else:
+            # Last resort: reduce to minimum size
+            quality, scale = model.min_quality, 0.1
+        (final_width, final_height), sink = _encode_candidate(model, working_img, quality, scale, math.inf)
+        data = sink.getvalue()
+
+    # Save the result
+    _write_output(data, output_path)
+
+    if working_img is not image:
+        working_img.close()
+
+    return {
+        "size": len(data),
+        "width": final_width,
+        "height": final_height,
+        "format": fmt,
+        "lossless": lossless,
+        "quality": quality,
+        "rounds": rounds,
+        "encodes": full_encodes,
+        "probe_encodes": model.probe_encodes,
+    }
+
+
+def encode_png(img, compress_level, strategy, keep_limit=0):
+    """Encode ``img`` as PNG with the given zlib settings.
+
+    Only critical chunks (and transparency) are written: the ICC profile,
+    text and EXIF chunks of the source are dropped.
+    """
+    sink = EncodeSink(keep_limit)
+    with span("encode", format="PNG", compress_level=compress_level, strategy=strategy) as encode_span:
+        if is_enabled():
+            encode_span.set(colors=len(img.getpalette() or ()) // 3 or None)
+        img.save(sink, format='PNG', compress_level=compress_level, compress_type=strategy, icc_profile=None)
+        encode_span.set(bytes_out=sink.size)
+    return sink
+
+
+def quantize_image(img, colors, dither=False):
+    """Reduce ``img`` to a palette of ``colors`` entries, keeping alpha.
+
+    Images with an alpha channel use the fast octree quantizer, the only
+    built-in one that keeps per-entry alpha; Pillow cannot dither while
+    doing so, so ``dither`` applies to opaque images only.
+    """
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        # Pillow only quantizes RGB(A) and L images
+        if img.mode in ('I', 'I;16'):
+            with _scale_to_8_bit(img) as gray:
+                return quantize_image(gray, colors, dither)
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        with img.convert('RGBA' if has_alpha else 'RGB') as converted:
+            return quantize_image(converted, colors, dither)
+    with span("quantize", colors=colors, dither=dither):
+        if img.mode == 'RGBA':
+            return img.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        palette_img = img.quantize(colors, method=Image.Quantize.MEDIANCUT)
+        if not dither:
+            return palette_img
+        dithered = img.quantize(palette=palette_img, dither=Image.Dither.FLOYDSTEINBERG)
+        palette_img.close()
+        return dithered
+
+
+@traced("compress_png")
+def compress_png_to_target_size(image, target_kb, output_path, dither=False, max_workers=None):
+    """Compress an image to a target size in KB and save it as PNG.
+
+    Candidates are tried from most to least faithful: lossless PNG, then
+    palettes of PNG_PALETTE_SIZES colors (optionally dithered), each with
+    every zlib setting in PNG_ZLIB_SETTINGS. They run on a thread pool, and
+    once a candidate fits, every candidate that is not more faithful is
+    skipped. If even the smallest palette is too big the image is resized.
+    Alpha is kept throughout, and grayscale or palette images stay in their
+    mode. A PNG input is kept as it is when nothing comes out smaller than
+    it. Returns the same dict as
+    ``compress_to_target_size``, with ``colors`` set to the palette size
+    (None for lossless) and ``quality`` set to None.
+    """
+    target_bytes = target_kb * 1024
+    if max_workers is None:
+        max_workers = min(MAX_PARALLEL_CANDIDATES, os.cpu_count() or 1)
+    working_img = _decode(image, "PNG")
+
+    levels = (None,) + PNG_PALETTE_SIZES
+    palettes = {}  # colors -> quantized image, shared by the zlib settings
+    palette_locks = {colors: threading.Lock() for colors in levels}
+    search = {
+        "best": None,  # (level, size, data, setting) of the most faithful fit
+        "smallest": {},  # level -> (size, setting) of its smallest encode
+        "encodes": 0,
+    }
+    search_lock = threading.Lock()
+
+    def get_level_image(level):
+        colors = levels[level]
+        if colors is None:
+            return working_img
+        with palette_locks[colors]:
+            if colors not in palettes:
+                palettes[colors] = quantize_image(working_img, colors, dither)
+            return palettes[colors]
+
+    def try_candidate(level, setting):
+        # Skip once something at least as faithful already fits
+        with search_lock:
+            if search["best"] is not None and search["best"][0] <= level:
+                return
+        sink = encode_png(get_level_image(level), *setting, keep_limit=target_bytes)
+        with search_lock:
+            search["encodes"] += 1
+            smallest = search["smallest"].get(level)
+            if smallest is None or sink.size < smallest[0]:
+                search["smallest"][level] = (sink.size, setting)
+            best = search["best"]
+            if sink.size <= target_bytes and (best is None or level < best[0]):
+                search["best"] = (level, sink.size, sink.getvalue(), setting)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(in_context(try_candidate), level, setting)
+            for level in range(len(levels))
+            for setting in PNG_ZLIB_SETTINGS
+        ]
+        for future in futures:
+            future.result()
+    for palette_img in palettes.values():
+        palette_img.close()
+
+    full_encodes = search["encodes"]
+    rounds = 1
+    if search["best"] is not None:
+        level, _, data, _ = search["best"]
+        colors = levels[level]
+        final_width, final_height = working_img.size
+    else:
+        # Resize at the smallest palette, with its best zlib setting. PNG
+        # size grows roughly with the pixel count, so aim each scale at the
+        # square root of the remaining overshoot.
+        colors = levels[-1]
+        size, setting = search["smallest"][len(levels) - 1]
+        scale = 1.0
+        data = None
+
+        def encode_scaled(candidate_scale, keep_limit=target_bytes):
+            new_size = scaled_size(working_img.size, candidate_scale)
+            with span("resize", size=new_size):
+                resized = working_img.resize(new_size, Image.Resampling.LANCZOS)
+            with resized:
+                with quantize_image(resized, colors, dither) as palette_img:
+                    return new_size, encode_png(palette_img, *setting, keep_limit=keep_limit)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while data is None and rounds < MAX_ATTEMPTS:
+                rounds += 1
+                aims = [TARGET_AIM * (1 - 0.1 * i) for i in range(max_workers)]
+                scales = [scale * math.sqrt(target_bytes * aim / size) for aim in aims]
+                smallest_result = None
+                for candidate_scale, (dimensions, sink) in zip(scales, executor.map(in_context(encode_scaled), scales)):
+                    full_encodes += 1
+                    if sink.size <= target_bytes:
+                        # Scales are tried largest first, so the first fit wins
+                        if data is None:
+                            data = sink.getvalue()
+                            final_width, final_height = dimensions
+                    elif smallest_result is None or sink.size < smallest_result[0]:
+                        smallest_result = (sink.size, candidate_scale, dimensions)
+                if data is None:
+                    size, scale, dimensions = smallest_result
+                    if min(dimensions) <= MIN_DIMENSION:
+                        break
+
+        if data is None:
+            # Nothing fits even at the minimum size; keep the smallest result
+            (final_width, final_height), sink = encode_scaled(scale, math.inf)
+            data = sink.getvalue()
+
+    source = _source_png(image)
+    if source is not None and len(source[0]) <= len(data):
+        # Nothing beat the PNG we were given; keep it rather than grow it
+        data, (final_width, final_height) = source
+        colors = None
+
+    _write_output(data, output_path)
+
+    if working_img is not image:
+        working_img.close()
+
+    return {
+        "size": len(data),
+        "width": final_width,
+        "height": final_height,
+        "format": "PNG",
+        "lossless": colors is None,
+        "quality": None,
+        "colors": colors,
+        "rounds": rounds,
+        "encodes": full_encodes,
+        "probe_encodes": 0,
+    }
+
+
+def _score_quality(reference, working_img, quality, fmt):
+    """Encode one SSIM candidate and score it; runs on a worker thread."""
+    sink = encode_image(working_img, quality, fmt, keep_limit=math.inf)
+    with span("score", quality=quality) as score_span:
+        with Image.open(io.BytesIO(sink.getvalue())) as decoded:
+            ssim = reference.score(decoded)
+        score_span.set(ssim=ssim)
+    return ssim, sink
+
+
+@traced("compress_to_quality")
+def compress_to_quality(image, min_ssim, output_path, fmt="JPEG", max_workers=None):
+    """Save the smallest ``fmt`` file whose SSIM is at least ``min_ssim``.
+
+    The image is never resized; only the encoder quality is searched, over
+    SSIM_QUALITY_RANGE. Each round encodes several qualities at once on a
+    thread pool and narrows the range to the lowest one that passes, so
+    with one worker this is a plain binary search. SSIM is measured on a
+    luminance downsample against statistics of the original computed once.
+    If even the highest quality misses ``min_ssim``, it is used anyway.
+    Returns a dict like ``compress_to_target_size`` plus the ``ssim``.
+    """
+    if fmt not in OUTPUT_FORMATS or OUTPUT_FORMATS[fmt]["min_quality"] is None:
+        raise ValueError(f"SSIM mode needs a lossy format, not {fmt}.")
+    if max_workers is None:
+        max_workers = min(MAX_PARALLEL_CANDIDATES, os.cpu_count() or 1)
+
+    working_img = _decode(image, fmt)
+    with span("probe"):
+        reference = SSIMReference(working_img)
+
+    low, high = SSIM_QUALITY_RANGE
+    best = None  # (quality, ssim, sink) of the lowest passing quality
+    encodes = 0
+    rounds = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Invariant: the answer lies in [low, high]; high itself passes or
+        # is the top of the range
+        while low < high:
+            rounds += 1
+            width = high - low
+            qualities = sorted({low + width * i // (max_workers + 1) for i in range(1, max_workers + 1)})
+            if width <= max_workers:
+                qualities = list(range(low, high))
+            results = executor.map(in_context(lambda q: _score_quality(reference, working_img, q, fmt)), qualities)
+            for quality, (ssim, sink) in zip(qualities, results):
+                encodes += 1
+                if ssim >= min_ssim:
+                    if quality < high:
+                        high = quality
+                        best = (quality, ssim, sink)
+                elif low <= quality < high:
+                    low = quality + 1
+
+    if best is None:
+        # Nothing below the top of the range passed; use the top quality
+        ssim, sink = _score_quality(reference, working_img, high, fmt)
+        encodes += 1
+        best = (high, ssim, sink)
+
+    quality, ssim, sink = best
+    data = sink.getvalue()
+    _write_output(data, output_path)
+
+    width, height = working_img.size
+    if working_img is not image:
+        working_img.close()
+
+    return {
+        "size": len(data),
+        "width": width,
+        "height": height,
+        "format": fmt,
+        "lossless": False,
+        "quality": quality,
+        "ssim": round(ssim, 4),
+        "reached": ssim >= min_ssim,
+        "rounds": rounds,
+        "encodes": encodes,
+        "probe_encodes": 0,
+    }
@@ -0,0 +1,184 @@
+"""
+Process-wide cache of decoded images.
+
+Resizing, cropping and compressing the same photo one after the other
+would otherwise decode it three times. Decoded images are kept in an LRU
+cache keyed by the file's path, modification time and size, so a file that
+changes on disk is decoded again, and the least recently used images are
+evicted once the cache holds more than its memory cap. The cap defaults to
+512 MB and can be set in megabytes with IMAGE_PDF_TOOL_IMAGE_CACHE_MB; 0
+turns the cache off. Pool workers turn it off unless that variable is set
+(see ``configure_worker``): jobs are spread over processes, so a worker
+rarely sees the same file twice, and each would hold its own copy.
+
+Cached images are shared: callers read from them (crop, resize, encode)
+but must never modify or close them.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from PIL import Image
+
+from utils.tracing import span
+
+
+IMAGE_CACHE_ENV = "IMAGE_PDF_TOOL_IMAGE_CACHE_MB"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+
+def estimate_image_bytes(img):
+    """Estimate the memory held by a decoded Pillow image."""
+    bytes_per_band = 4 if img.mode in ("I", "F") else 1
+    return max(1, img.width * img.height * len(img.getbands()) * bytes_per_band)
+
+
+def _file_key(filepath):
+    """Return the (path, mtime, size) key of a file as it is now."""
+    stat = os.stat(filepath)
+    return os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size
+
+
+class DecodedImageCache:
+    """Size-capped, least recently used store of decoded images."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()  # (path, mtime_ns, size) -> (image, nbytes)
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the image stored under ``key``, or None."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, img, nbytes):
+        """Store ``img`` under ``key``, replacing older versions of the same file.
+
+        Returns False (and stores nothing) if the image alone exceeds the cap.
+        """
+        if nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            # The file changed on disk; its old decodes can never be hit again
+            for stale in [k for k in self._cache if k[0] == key[0]]:
+                self._drop(stale)
+            if key in self._cache:
+                self._drop(key)
+            self._cache[key] = (img, nbytes)
+            self._cache_bytes += nbytes
+            while self._cache_bytes > self.max_bytes:
+                self._drop(next(iter(self._cache)))
+                self.evictions += 1
+        return True
+
+    def _drop(self, key):
+        # Images handed out before the eviction may still be in use, so they
+        # are left to the garbage collector instead of being closed here
+        _, nbytes = self._cache.pop(key)
+        self._cache_bytes -= nbytes
+
+    def trim(self, max_bytes):
+        """Evict least recently used images until at most ``max_bytes`` are held."""
+        with self._lock:
+            while self._cache and self._cache_bytes > max_bytes:
+                self._drop(next(iter(self._cache)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached image."""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counts and the memory currently held."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._cache),
+                "bytes": self._cache_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _max_bytes_from_env():
+    value = os.environ.get(IMAGE_CACHE_ENV)
+    if not value:
+        return DEFAULT_MAX_BYTES
+    try:
+        return max(0, int(float(value) * 1024 * 1024))
+    except ValueError:
+        return DEFAULT_MAX_BYTES
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Return this process's DecodedImageCache, creating it once."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = DecodedImageCache(_max_bytes_from_env())
+        return _shared_cache
+
+
+def configure_worker():
+    """Turn the cache off in this pool worker, unless its size was set explicitly."""
+    global _shared_cache
+    with _shared_cache_lock:
+        _shared_cache = DecodedImageCache(_max_bytes_from_env() if os.environ.get(IMAGE_CACHE_ENV) else 0)
+
+
+def cached_image(filepath):
+    """Return the cached decode of ``filepath``, or None; never decodes.
+
+    For callers that have a cheaper way to get what they need (a draft
+    decode) when the full image is not already in memory.
+    """
+    return get_image_cache().get(_file_key(filepath))
+
+
+@contextmanager
+def open_decoded(filepath):
+    """Yield ``filepath`` as a fully decoded image, from the cache when possible.
+
+    A drop-in for ``with Image.open(filepath) as img`` where the pixels are
+    going to be read anyway. The image keeps its ``format`` and ``info``.
+    Images that fit the cache stay in it after the block and must not be
+    modified; images too large for it are closed as usual.
+    """
+    cache = get_image_cache()
+    key = _file_key(filepath)
+    img = cache.get(key)
+    if img is not None:
+        yield img
+        return
+
+    img = Image.open(filepath)
+    try:
+        with span("decode", input=filepath, size=img.size):
+            img.load()
+    except BaseException:
+        img.close()
+        raise
+    if cache.put(key, img, estimate_image_bytes(img)):
+        yield img
+        return
+    with img:
+        yield img
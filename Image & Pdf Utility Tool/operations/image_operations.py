@@ -2,12 +2,42 @@
 Image operations for the Image & PDF Utility Tool.
 """
 import os
-import io
-import math
+import queue
+import threading
+from collections import OrderedDict
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 
+from operations.image_processing import (
+    load_preview,
+    get_jpeg_mcu_size,
+    snap_box_to_mcu,
+    is_lossless_crop_available,
+    crop_image_file,
+    make_crop_template,
+    resize_image_file,
+)
+from operations.batch_processing import (
+    list_image_files,
+    save_crop_template,
+    load_crop_template,
+    iter_batch_crop,
+    iter_batch_compress,
+    write_report,
+)
+from operations.tile_pyramid import TilePyramid
+from operations.image_cache import open_decoded
+from operations.compression import (
+    build_size_model,
+    compress_to_target_size,
+    compress_to_quality,
+    get_format_choices,
+    OUTPUT_FORMATS,
+    PNG_PALETTE_SIZES,
+)
+from operations.quality_metrics import is_ssim_available
+from utils.tracing import span
 from utils.helpers import center_dialog, get_image_filetypes, get_save_image_filetypes
 from utils.ui_components import create_primary_button, create_secondary_button, BG_COLOR, FONT_FAMILY
 
@@ -154,15 +184,8 @@ def resize_image(app):
                     return
                 
                 # Resize the image using high-quality resampling
-                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Convert if needed for JPEG
-                if output_path.lower().endswith(('.jpg', '.jpeg')) and resized_img.mode in ('RGBA', 'P'):
-                    resized_img = resized_img.convert('RGB')
-                
-                resized_img.save(output_path)
-                resized_img.close()
                 img.close()
+                resize_image_file(filepath, output_path, (new_width, new_height))
                 
                 resize_dialog.destroy()
                 messagebox.showinfo(
@@ -207,9 +230,11 @@ def crop_image(app):
         return
     
     try:
-        # Open the image
-        original_img = Image.open(filepath)
-        original_width, original_height = original_img.size
+        # Read the header only; pixels are decoded (once, through the
+        # shared image cache) by the zoomed view and by the crop itself
+        with Image.open(filepath) as header:
+            original_width, original_height = header.size
+            mcu_size = get_jpeg_mcu_size(header)  # None for non-JPEG files
         
         # Create crop dialog window
         crop_dialog = tk.Toplevel(app)
@@ -226,9 +251,13 @@ def crop_image(app):
         display_width = int(original_width * scale)
         display_height = int(original_height * scale)
         
-        # Resize image for display
-        display_img = original_img.resize((display_width, display_height), Image.Resampling.LANCZOS)
-        photo_img = ImageTk.PhotoImage(display_img)
+        # Show a fast draft preview first; a high quality one is swapped in
+        # once it has been computed in the background
+        preview_state = {
+            "image": load_preview(filepath, (display_width, display_height)),
+            "refined": None,
+        }
+        photo_img = ImageTk.PhotoImage(preview_state["image"])
         
         # Handle size and colors
         HANDLE_SIZE = 10
@@ -237,18 +266,44 @@ def crop_image(app):
         OVERLAY_COLOR = "#000000"
         OVERLAY_ALPHA = 0.5
         
-        # Crop state - initialized to full image
+        # Zoom steps (zoom is screen pixels per original image pixel): the
+        # fitted view, then powers of two, so zoomed views show pyramid tiles
+        # at their own resolution (or whole multiples of it) without resampling
+        MAX_ZOOM = max(8.0, scale)
+        ZOOM_LEVELS = [scale] + [2.0 ** k for k in range(-16, 4) if scale * 1.0001 < 2.0 ** k <= MAX_ZOOM]
+        TILE_PHOTO_LIMIT = 64 * 1024 * 1024  # PhotoImages kept for tiles scrolled off screen
+        
+        # Crop state in original image coordinates - initialized to full image
         crop_state = {
             "x1": 0,
             "y1": 0,
-            "x2": display_width,
-            "y2": display_height,
+            "x2": original_width,
+            "y2": original_height,
             "dragging": None,  # Which handle/edge is being dragged
             "drag_start_x": 0,
             "drag_start_y": 0,
             "scale": scale,
+            "redraw_pending": None,  # after_idle id while a redraw is queued
         }
         
+        # View state - the canvas starts fitted to the whole image
+        view_state = {
+            "zoom": scale,
+            "offset_x": 0.0,  # Original image coordinates of the canvas top-left
+            "offset_y": 0.0,
+            "pan_start": (0, 0, 0.0, 0.0),
+            "dirty": False,  # Tiles need re-rendering on the next redraw
+            "level_poll": None,  # after id while waiting for a pyramid level to decode
+        }
+        
+        # Zoomed-in views are drawn from a tile pyramid decoded in the
+        # background; only visible tiles are turned into PhotoImages, and
+        # those are kept (up to TILE_PHOTO_LIMIT) for panning back
+        pyramid = TilePyramid(filepath)
+        tile_items = {}  # (level, tx, ty, factor) -> canvas item id
+        tile_photos = OrderedDict()  # (level, tx, ty, factor) -> (PhotoImage, bytes)
+        photo_state = {"bytes": 0}
+        
         # Info frame at the top
         info_frame = tk.Frame(crop_dialog, bg=BG_COLOR)
         info_frame.pack(pady=10, fill="x")
@@ -265,7 +320,7 @@ def crop_image(app):
         
         instruction_label = tk.Label(
             info_frame,
-            text="Drag the handles or edges to adjust the crop area",
+            text="Drag the handles or edges to adjust the crop area\nScroll to zoom, right-drag to pan",
             font=(FONT_FAMILY, 10),
             bg=BG_COLOR,
             fg="#555555",
@@ -282,6 +337,24 @@ def crop_image(app):
         )
         selection_label.pack(pady=(5, 0))
         
+        # Lossless crop option (JPEG only): snaps the crop to MCU blocks
+        lossless_var = tk.BooleanVar(value=False)
+        if mcu_size is not None:
+            lossless_available = is_lossless_crop_available()
+            lossless_text = f"Lossless JPEG crop (snap to {mcu_size[0]}x{mcu_size[1]} blocks)"
+            if not lossless_available:
+                lossless_text += " - jpegtran not found"
+            tk.Checkbutton(
+                info_frame,
+                text=lossless_text,
+                variable=lossless_var,
+                command=lambda: update_overlay(),
+                state="normal" if lossless_available else "disabled",
+                font=(FONT_FAMILY, 9),
+                bg=BG_COLOR,
+                activebackground=BG_COLOR,
+            ).pack(pady=(5, 0))
+        
         # Canvas frame
         canvas_frame = tk.Frame(crop_dialog, bg="#333333", padx=2, pady=2)
         canvas_frame.pack(padx=20, pady=10)
@@ -297,75 +370,274 @@ def crop_image(app):
         canvas.pack()
         
         # Display the image on canvas
-        canvas.create_image(0, 0, anchor="nw", image=photo_img, tags="image")
+        image_item = canvas.create_image(0, 0, anchor="nw", image=photo_img, tags="image")
         canvas.image = photo_img  # Keep reference
         
+        def refine_preview():
+            """Compute the high quality preview (runs in a worker thread)"""
+            try:
+                preview_state["refined"] = load_preview(
+                    filepath, (display_width, display_height), high_quality=True)
+            except Exception:
+                pass  # Keep the draft preview
+        
+        def swap_in_refined_preview():
+            """Replace the draft preview once the worker has finished"""
+            if not crop_dialog.winfo_exists():
+                return
+            if refine_thread.is_alive():
+                crop_dialog.after(50, swap_in_refined_preview)
+                return
+            refined = preview_state["refined"]
+            if refined is None:
+                return
+            refined_photo = ImageTk.PhotoImage(refined)
+            canvas.itemconfigure(image_item, image=refined_photo)
+            canvas.image = refined_photo
+            preview_state["image"].close()
+            preview_state["image"] = refined
+            preview_state["refined"] = None
+        
+        if scale < 1.0:
+            refine_thread = threading.Thread(target=refine_preview, daemon=True)
+            refine_thread.start()
+            crop_dialog.after(50, swap_in_refined_preview)
+        
+        # Overlay, border and handle items are created once and then moved
+        # with canvas.coords() instead of being deleted and recreated on
+        # every motion event.
+        overlay_items = {
+            side: canvas.create_rectangle(
+                0, 0, 0, 0,
+                fill=OVERLAY_COLOR, stipple="gray50", state="hidden", tags="overlay")
+            for side in ("top", "bottom", "left", "right")
+        }
+        border_item = canvas.create_rectangle(
+            0, 0, 0, 0, outline=BORDER_COLOR, width=2, tags="border")
+        snap_item = canvas.create_rectangle(
+            0, 0, 0, 0, outline="white", dash=(4, 4), state="hidden", tags="border")
+        handle_items = {
+            handle_id: canvas.create_rectangle(
+                0, 0, 0, 0,
+                fill=HANDLE_COLOR, outline="white", width=1,
+                tags=("handles", f"handle_{handle_id}"))
+            for handle_id in ("nw", "ne", "sw", "se", "n", "s", "w", "e")
+        }
+        
+        def to_canvas(x, y):
+            """Convert original image coordinates to canvas coordinates"""
+            zoom = view_state["zoom"]
+            return (x - view_state["offset_x"]) * zoom, (y - view_state["offset_y"]) * zoom
+        
+        def get_canvas_rect():
+            """Return the crop rectangle in canvas coordinates"""
+            x1, y1 = to_canvas(crop_state["x1"], crop_state["y1"])
+            x2, y2 = to_canvas(crop_state["x2"], crop_state["y2"])
+            return x1, y1, x2, y2
+        
+        def clamp_view():
+            """Keep the visible area inside the image"""
+            zoom = view_state["zoom"]
+            max_x = max(0.0, original_width - display_width / zoom)
+            max_y = max(0.0, original_height - display_height / zoom)
+            view_state["offset_x"] = max(0.0, min(view_state["offset_x"], max_x))
+            view_state["offset_y"] = max(0.0, min(view_state["offset_y"], max_y))
+        
+        # Stretched preview shown while the pyramid level for a zoom decodes
+        placeholder_item = canvas.create_image(0, 0, anchor="nw", state="hidden", tags="tile")
+        
+        def show_placeholder():
+            """Fill the view with the matching part of the preview, blown up"""
+            zoom = view_state["zoom"]
+            preview = preview_state["image"]
+            preview_scale = preview.width / original_width
+            box = (
+                view_state["offset_x"] * preview_scale,
+                view_state["offset_y"] * preview_scale,
+                min(original_width, view_state["offset_x"] + display_width / zoom) * preview_scale,
+                min(original_height, view_state["offset_y"] + display_height / zoom) * preview_scale,
+            )
+            size = (
+                max(1, round((box[2] - box[0]) / preview_scale * zoom)),
+                max(1, round((box[3] - box[1]) / preview_scale * zoom)),
+            )
+            photo = ImageTk.PhotoImage(preview.resize(size, Image.Resampling.BILINEAR, box=box))
+            canvas.itemconfigure(placeholder_item, image=photo, state="normal")
+            canvas.placeholder = photo  # Keep reference
+        
+        def wait_for_level():
+            """Redraw once the pyramid level for the current zoom has decoded"""
+            view_state["level_poll"] = None
+            level = pyramid.level_for_zoom(view_state["zoom"])
+            if view_state["zoom"] <= scale * 1.0001:
+                return
+            if pyramid.is_level_ready(level):
+                schedule_overlay_update(view_changed=True)
+            else:
+                view_state["level_poll"] = crop_dialog.after(50, wait_for_level)
+        
+        def get_tile_photo(level, tx, ty, factor):
+            """Return the PhotoImage of a tile, or None while its level decodes"""
+            key = (level, tx, ty, factor)
+            if key in tile_photos:
+                tile_photos.move_to_end(key)
+                return tile_photos[key][0]
+            tile = pyramid.get_tile(level, tx, ty)
+            if tile is None:
+                return None
+            if factor > 1:
+                # Whole-number magnification: every image pixel becomes a block
+                tile = tile.resize((tile.width * factor, tile.height * factor), Image.Resampling.NEAREST)
+            photo = ImageTk.PhotoImage(tile)
+            nbytes = tile.width * tile.height * 4
+            tile_photos[key] = (photo, nbytes)
+            photo_state["bytes"] += nbytes
+            while photo_state["bytes"] > TILE_PHOTO_LIMIT and len(tile_photos) > 1:
+                old_key = next(iter(tile_photos))
+                if old_key in tile_items:
+                    break  # Never drop a photo that is on screen
+                photo_state["bytes"] -= tile_photos.pop(old_key)[1]
+            return photo
+        
+        def render_view():
+            """Show the preview at fit zoom, or the visible pyramid tiles when zoomed in"""
+            zoom = view_state["zoom"]
+            if zoom <= scale * 1.0001:
+                canvas.itemconfigure(image_item, state="normal")
+                canvas.itemconfigure(placeholder_item, state="hidden")
+                for item in tile_items.values():
+                    canvas.delete(item)
+                tile_items.clear()
+                return
+            
+            canvas.itemconfigure(image_item, state="hidden")
+            level = pyramid.level_for_zoom(zoom)
+            # Zoom is a power of two, so a tile spans a whole number of screen pixels
+            factor = max(1, round(zoom * 2 ** level))
+            screen_span = pyramid.tile_size * factor  # Tile size in screen pixels
+            view_x = round(view_state["offset_x"] * zoom)
+            view_y = round(view_state["offset_y"] * zoom)
+            visible_box = (
+                view_state["offset_x"],
+                view_state["offset_y"],
+                view_state["offset_x"] + display_width / zoom,
+                view_state["offset_y"] + display_height / zoom,
+            )
+            
+            if not pyramid.is_level_ready(level):
+                # Decode off the UI thread; show the stretched preview meanwhile
+                pyramid.request_level(level)
+                show_placeholder()
+                for item in tile_items.values():
+                    canvas.delete(item)
+                tile_items.clear()
+                if view_state["level_poll"] is None:
+                    view_state["level_poll"] = crop_dialog.after(50, wait_for_level)
+                canvas.tag_lower("tile")
+                return
+            
+            canvas.itemconfigure(placeholder_item, state="hidden")
+            visible = set()
+            for tx, ty in pyramid.tiles_in_box(level, visible_box):
+                key = (level, tx, ty, factor)
+                visible.add(key)
+                x = tx * screen_span - view_x
+                y = ty * screen_span - view_y
+                if key in tile_items:
+                    canvas.coords(tile_items[key], x, y)
+                    continue
+                # Only tiles that are on screen become PhotoImages
+                photo = get_tile_photo(level, tx, ty, factor)
+                if photo is not None:
+                    tile_items[key] = canvas.create_image(x, y, anchor="nw", image=photo, tags="tile")
+            
+            for key in [key for key in tile_items if key not in visible]:
+                canvas.delete(tile_items.pop(key))
+            canvas.tag_lower("tile")
+        
+        def place_overlay(side, visible, coords):
+            """Move an overlay rectangle, hiding it when it would be empty"""
+            item = overlay_items[side]
+            if visible:
+                canvas.coords(item, *coords)
+                canvas.itemconfigure(item, state="normal")
+            else:
+                canvas.itemconfigure(item, state="hidden")
+        
+        def get_crop_box():
+            """Return the crop rectangle in original image coordinates"""
+            # Round and clamp to image bounds
+            orig_x1 = max(0, min(int(crop_state["x1"]), original_width))
+            orig_y1 = max(0, min(int(crop_state["y1"]), original_height))
+            orig_x2 = max(0, min(int(crop_state["x2"]), original_width))
+            orig_y2 = max(0, min(int(crop_state["y2"]), original_height))
+            return orig_x1, orig_y1, orig_x2, orig_y2
+        
         def update_overlay():
             """Update the dark overlay and crop handles"""
-            canvas.delete("overlay")
-            canvas.delete("handles")
-            canvas.delete("border")
+            crop_state["redraw_pending"] = None
+            # Recorded when tracing is on, so drags can be checked against the
+            # 16 ms frame budget (see utils/tracing.py)
+            with span("crop_redraw", view_changed=view_state["dirty"]):
+                redraw_overlay()
+        
+        def redraw_overlay():
+            if view_state["dirty"]:
+                view_state["dirty"] = False
+                render_view()
             
-            x1, y1 = crop_state["x1"], crop_state["y1"]
-            x2, y2 = crop_state["x2"], crop_state["y2"]
+            x1, y1, x2, y2 = get_canvas_rect()
+            left, top = to_canvas(0, 0)
+            right, bottom = to_canvas(original_width, original_height)
             
-            # Create semi-transparent overlay for non-selected areas
-            # Top overlay
-            if y1 > 0:
-                canvas.create_rectangle(0, 0, display_width, y1, 
-                    fill=OVERLAY_COLOR, stipple="gray50", tags="overlay")
-            # Bottom overlay
-            if y2 < display_height:
-                canvas.create_rectangle(0, y2, display_width, display_height, 
-                    fill=OVERLAY_COLOR, stipple="gray50", tags="overlay")
-            # Left overlay
-            if x1 > 0:
-                canvas.create_rectangle(0, y1, x1, y2, 
-                    fill=OVERLAY_COLOR, stipple="gray50", tags="overlay")
-            # Right overlay
-            if x2 < display_width:
-                canvas.create_rectangle(x2, y1, display_width, y2, 
-                    fill=OVERLAY_COLOR, stipple="gray50", tags="overlay")
+            # Semi-transparent overlay for non-selected areas
+            place_overlay("top", y1 > top, (left, top, right, y1))
+            place_overlay("bottom", y2 < bottom, (left, y2, right, bottom))
+            place_overlay("left", x1 > left, (left, y1, x1, y2))
+            place_overlay("right", x2 < right, (x2, y1, right, y2))
             
-            # Draw crop border
-            canvas.create_rectangle(x1, y1, x2, y2, 
-                outline=BORDER_COLOR, width=2, tags="border")
+            # Crop border
+            canvas.coords(border_item, x1, y1, x2, y2)
             
-            # Draw handles at corners and edges
+            # Handles at corners and edge midpoints
             hs = HANDLE_SIZE // 2
-            
-            # Corner handles
+            mid_x, mid_y = (x1 + x2) // 2, (y1 + y2) // 2
             handles = {
                 "nw": (x1, y1),
                 "ne": (x2, y1),
                 "sw": (x1, y2),
                 "se": (x2, y2),
+                "n": (mid_x, y1),
+                "s": (mid_x, y2),
+                "w": (x1, mid_y),
+                "e": (x2, mid_y),
             }
-            
-            # Edge handles (midpoints)
-            handles.update({
-                "n": ((x1 + x2) // 2, y1),
-                "s": ((x1 + x2) // 2, y2),
-                "w": (x1, (y1 + y2) // 2),
-                "e": (x2, (y1 + y2) // 2),
-            })
-            
             for handle_id, (hx, hy) in handles.items():
-                canvas.create_rectangle(
-                    hx - hs, hy - hs, hx + hs, hy + hs,
-                    fill=HANDLE_COLOR, outline="white", width=1,
-                    tags=("handles", f"handle_{handle_id}")
-                )
+                canvas.coords(handle_items[handle_id], hx - hs, hy - hs, hx + hs, hy + hs)
             
-            # Update selection label
-            crop_w = int((x2 - x1) / scale)
-            crop_h = int((y2 - y1) / scale)
-            selection_label.config(text=f"Crop Size: {crop_w} x {crop_h} px")
+            # Update selection label, showing the MCU-snapped size for lossless crops
+            crop_box = get_crop_box()
+            if lossless_var.get():
+                crop_box = snap_box_to_mcu(crop_box, mcu_size)
+                canvas.coords(snap_item, *to_canvas(crop_box[0], crop_box[1]), x2, y2)
+                canvas.itemconfigure(snap_item, state="normal")
+            else:
+                canvas.itemconfigure(snap_item, state="hidden")
+            crop_w = crop_box[2] - crop_box[0]
+            crop_h = crop_box[3] - crop_box[1]
+            zoom_percent = view_state["zoom"] * 100
+            selection_label.config(text=f"Crop Size: {crop_w} x {crop_h} px | Zoom: {zoom_percent:.0f}%")
+        
+        def schedule_overlay_update(view_changed=False):
+            """Coalesce motion events into at most one redraw per idle cycle"""
+            if view_changed:
+                view_state["dirty"] = True
+            if crop_state["redraw_pending"] is None:
+                crop_state["redraw_pending"] = canvas.after_idle(update_overlay)
         
         def get_handle_at(x, y):
             """Determine which handle or edge is at the given coordinates"""
-            x1, y1 = crop_state["x1"], crop_state["y1"]
-            x2, y2 = crop_state["x2"], crop_state["y2"]
+            x1, y1, x2, y2 = get_canvas_rect()
             hs = HANDLE_SIZE
             
             # Check corners first (higher priority)
@@ -441,11 +713,13 @@ def crop_image(app):
             if not crop_state["dragging"]:
                 return
             
-            dx = event.x - crop_state["drag_start_x"]
-            dy = event.y - crop_state["drag_start_y"]
+            # Mouse movement converted to original image pixels
+            zoom = view_state["zoom"]
+            dx = (event.x - crop_state["drag_start_x"]) / zoom
+            dy = (event.y - crop_state["drag_start_y"]) / zoom
             handle = crop_state["dragging"]
             
-            min_size = 20  # Minimum crop size
+            min_size = 20 / zoom  # Minimum crop size (20 screen pixels)
             
             # Calculate new positions based on which handle is being dragged
             new_x1, new_y1 = crop_state["orig_x1"], crop_state["orig_y1"]
@@ -453,8 +727,8 @@ def crop_image(app):
             
             if handle == "move":
                 # Move entire selection
-                new_x1 = max(0, min(crop_state["orig_x1"] + dx, display_width - (new_x2 - new_x1)))
-                new_y1 = max(0, min(crop_state["orig_y1"] + dy, display_height - (new_y2 - new_y1)))
+                new_x1 = max(0, min(crop_state["orig_x1"] + dx, original_width - (new_x2 - new_x1)))
+                new_y1 = max(0, min(crop_state["orig_y1"] + dy, original_height - (new_y2 - new_y1)))
                 width = crop_state["orig_x2"] - crop_state["orig_x1"]
                 height = crop_state["orig_y2"] - crop_state["orig_y1"]
                 new_x2 = new_x1 + width
@@ -464,53 +738,83 @@ def crop_image(app):
                 if "w" in handle:
                     new_x1 = max(0, min(crop_state["orig_x1"] + dx, new_x2 - min_size))
                 if "e" in handle:
-                    new_x2 = max(new_x1 + min_size, min(crop_state["orig_x2"] + dx, display_width))
+                    new_x2 = max(new_x1 + min_size, min(crop_state["orig_x2"] + dx, original_width))
                 if "n" in handle:
                     new_y1 = max(0, min(crop_state["orig_y1"] + dy, new_y2 - min_size))
                 if "s" in handle:
-                    new_y2 = max(new_y1 + min_size, min(crop_state["orig_y2"] + dy, display_height))
+                    new_y2 = max(new_y1 + min_size, min(crop_state["orig_y2"] + dy, original_height))
             
             crop_state["x1"] = new_x1
             crop_state["y1"] = new_y1
             crop_state["x2"] = new_x2
             crop_state["y2"] = new_y2
             
-            update_overlay()
+            schedule_overlay_update()
         
         def on_mouse_release(event):
             """Handle mouse release"""
             crop_state["dragging"] = None
         
+        def zoom_at(x, y, steps):
+            """Zoom by ``steps`` zoom levels, keeping the image point under (x, y) in place"""
+            old_zoom = view_state["zoom"]
+            index = min(range(len(ZOOM_LEVELS)), key=lambda i: abs(ZOOM_LEVELS[i] - old_zoom))
+            new_zoom = ZOOM_LEVELS[max(0, min(index + steps, len(ZOOM_LEVELS) - 1))]
+            if new_zoom == old_zoom:
+                return
+            view_state["offset_x"] += x / old_zoom - x / new_zoom
+            view_state["offset_y"] += y / old_zoom - y / new_zoom
+            view_state["zoom"] = new_zoom
+            clamp_view()
+            schedule_overlay_update(view_changed=True)
+        
+        def on_mouse_wheel(event):
+            """Zoom in/out with the mouse wheel"""
+            if getattr(event, "delta", 0) > 0 or event.num == 4:
+                zoom_at(event.x, event.y, 1)
+            else:
+                zoom_at(event.x, event.y, -1)
+        
+        def on_pan_start(event):
+            """Start panning the zoomed view"""
+            view_state["pan_start"] = (event.x, event.y, view_state["offset_x"], view_state["offset_y"])
+        
+        def on_pan_drag(event):
+            """Pan the zoomed view"""
+            start_x, start_y, start_offset_x, start_offset_y = view_state["pan_start"]
+            zoom = view_state["zoom"]
+            view_state["offset_x"] = start_offset_x - (event.x - start_x) / zoom
+            view_state["offset_y"] = start_offset_y - (event.y - start_y) / zoom
+            clamp_view()
+            schedule_overlay_update(view_changed=True)
+        
         # Bind mouse events
         canvas.bind("<Motion>", update_cursor)
         canvas.bind("<ButtonPress-1>", on_mouse_press)
         canvas.bind("<B1-Motion>", on_mouse_drag)
         canvas.bind("<ButtonRelease-1>", on_mouse_release)
+        canvas.bind("<MouseWheel>", on_mouse_wheel)  # Windows / macOS
+        canvas.bind("<Button-4>", on_mouse_wheel)  # Linux scroll up
+        canvas.bind("<Button-5>", on_mouse_wheel)  # Linux scroll down
+        for button in ("2", "3"):  # Middle or right button drag pans
+            canvas.bind(f"<ButtonPress-{button}>", on_pan_start)
+            canvas.bind(f"<B{button}-Motion>", on_pan_drag)
         
         def reset_selection():
-            """Reset crop to full image"""
+            """Reset crop to full image and zoom back out"""
             crop_state["x1"] = 0
             crop_state["y1"] = 0
-            crop_state["x2"] = display_width
-            crop_state["y2"] = display_height
+            crop_state["x2"] = original_width
+            crop_state["y2"] = original_height
+            view_state["zoom"] = scale
+            view_state["offset_x"] = 0.0
+            view_state["offset_y"] = 0.0
+            view_state["dirty"] = True
             update_overlay()
         
         def perform_crop():
             """Crop and save the image"""
-            x1, y1 = crop_state["x1"], crop_state["y1"]
-            x2, y2 = crop_state["x2"], crop_state["y2"]
-            
-            # Convert to original image coordinates
-            orig_x1 = int(x1 / scale)
-            orig_y1 = int(y1 / scale)
-            orig_x2 = int(x2 / scale)
-            orig_y2 = int(y2 / scale)
-            
-            # Clamp to image bounds
-            orig_x1 = max(0, min(orig_x1, original_width))
-            orig_y1 = max(0, min(orig_y1, original_height))
-            orig_x2 = max(0, min(orig_x2, original_width))
-            orig_y2 = max(0, min(orig_y2, original_height))
+            crop_box = get_crop_box()
             
             # Get output path
             file_ext = os.path.splitext(filepath)[1].lower()
@@ -525,15 +829,10 @@ def crop_image(app):
                 return
             
             try:
-                cropped_img = original_img.crop((orig_x1, orig_y1, orig_x2, orig_y2))
-                
-                if output_path.lower().endswith(('.jpg', '.jpeg')) and cropped_img.mode in ('RGBA', 'P'):
-                    cropped_img = cropped_img.convert('RGB')
-                
-                cropped_img.save(output_path)
-                cropped_img.close()
-                original_img.close()
-                display_img.close()
+                orig_x1, orig_y1, orig_x2, orig_y2 = crop_image_file(
+                    filepath, output_path, crop_box, lossless=lossless_var.get())
+                preview_state["image"].close()
+                pyramid.clear()
                 
                 crop_width = orig_x2 - orig_x1
                 crop_height = orig_y2 - orig_y1
@@ -546,10 +845,27 @@ def crop_image(app):
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save cropped image.\n\n{e}")
         
+        def save_template():
+            """Save the current crop rectangle as a reusable batch template"""
+            template_path = filedialog.asksaveasfilename(
+                title="Save crop template as",
+                defaultextension=".json",
+                filetypes=[("Crop templates", "*.json")],
+                initialfile="crop_template.json",
+                parent=crop_dialog,
+            )
+            if not template_path:
+                return
+            try:
+                save_crop_template(template_path, make_crop_template(get_crop_box(), (original_width, original_height)))
+                messagebox.showinfo("Success", f"Crop template saved to:\n{template_path}", parent=crop_dialog)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save crop template.\n\n{e}", parent=crop_dialog)
+        
         def cancel_crop():
             """Close dialog without saving"""
-            original_img.close()
-            display_img.close()
+            preview_state["image"].close()
+            pyramid.clear()
             crop_dialog.destroy()
         
         # Button frame
@@ -576,6 +892,22 @@ def crop_image(app):
         crop_btn = create_primary_button(btn_frame, text="Crop & Save", command=perform_crop)
         crop_btn.pack(side="left", padx=10)
         
+        # Save Template button
+        template_btn = tk.Button(
+            btn_frame,
+            text="Save Template",
+            command=save_template,
+            font=(FONT_FAMILY, 11),
+            bg="#e0e0e0",
+            fg="#333333",
+            activebackground="#c0c0c0",
+            relief="flat",
+            padx=15,
+            pady=8,
+            cursor="hand2",
+        )
+        template_btn.pack(side="left", padx=10)
+        
         # Cancel button
         cancel_btn = tk.Button(
             btn_frame,
@@ -592,12 +924,25 @@ def crop_image(app):
         )
         cancel_btn.pack(side="left", padx=10)
         
+        def cancel_pending_redraw(event):
+            """Drop a queued redraw or level poll when the dialog closes"""
+            if event.widget is not crop_dialog:
+                return
+            if crop_state["redraw_pending"] is not None:
+                crop_dialog.after_cancel(crop_state["redraw_pending"])
+                crop_state["redraw_pending"] = None
+            if view_state["level_poll"] is not None:
+                crop_dialog.after_cancel(view_state["level_poll"])
+                view_state["level_poll"] = None
+        
+        crop_dialog.bind("<Destroy>", cancel_pending_redraw)
+        
         # Initialize overlay and handles
         update_overlay()
         
         # Set window size
-        window_width = max(display_width + 60, 500)
-        window_height = display_height + 180
+        window_width = max(display_width + 60, 640)
+        window_height = display_height + (230 if mcu_size is not None else 200)
         center_dialog(crop_dialog, window_width, window_height)
         crop_dialog.resizable(False, False)
         
@@ -605,16 +950,205 @@ def crop_image(app):
         messagebox.showerror("Error", f"Failed to open image.\n\n{e}")
 
 
+def batch_crop_images(app):
+    """Apply a saved crop template to every image in a folder."""
+    template_path = filedialog.askopenfilename(
+        title="Select a crop template",
+        filetypes=[("Crop templates", "*.json")],
+    )
+    if not template_path:
+        return
+    
+    try:
+        template = load_crop_template(template_path)
+    except Exception as e:
+        messagebox.showerror("Error", f"Failed to load crop template.\n\n{e}")
+        return
+    
+    input_dir = filedialog.askdirectory(title="Select a folder of images to crop")
+    if not input_dir:
+        return
+    
+    filepaths = list_image_files(input_dir)
+    if not filepaths:
+        messagebox.showerror("Error", "No images found in the selected folder.")
+        return
+    
+    # Create batch crop dialog window
+    batch_dialog = tk.Toplevel(app)
+    batch_dialog.title("Batch Crop")
+    batch_dialog.configure(bg=BG_COLOR)
+    batch_dialog.transient(app)
+    batch_dialog.grab_set()
+    
+    # Info frame at the top
+    info_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    info_frame.pack(pady=(15, 5), padx=20, fill="x")
+    
+    x1, y1, x2, y2 = template["box"]
+    template_width, template_height = template["image_size"]
+    tk.Label(
+        info_frame,
+        text=f"Template: {os.path.basename(template_path)} | "
+             f"{x2 - x1} x {y2 - y1} px from a {template_width} x {template_height} image",
+        font=(FONT_FAMILY, 10, "bold"),
+        bg=BG_COLOR,
+        fg="#333333",
+    ).pack()
+    
+    tk.Label(
+        info_frame,
+        text=f"Folder: {input_dir} ({len(filepaths)} images)",
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        fg="#0078d4",
+    ).pack(pady=(5, 0))
+    
+    # Options
+    options_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    options_frame.pack(pady=5)
+    
+    relative_var = tk.BooleanVar(value=True)
+    tk.Radiobutton(
+        options_frame,
+        text="Relative (scale to each image)",
+        variable=relative_var,
+        value=True,
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        activebackground=BG_COLOR,
+    ).pack(side="left", padx=10)
+    tk.Radiobutton(
+        options_frame,
+        text="Absolute (same pixels)",
+        variable=relative_var,
+        value=False,
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        activebackground=BG_COLOR,
+    ).pack(side="left", padx=10)
+    
+    lossless_available = is_lossless_crop_available()
+    lossless_var = tk.BooleanVar(value=lossless_available)
+    tk.Checkbutton(
+        batch_dialog,
+        text="Lossless JPEG crop (snap to MCU blocks)"
+             + ("" if lossless_available else " - jpegtran not found"),
+        variable=lossless_var,
+        state="normal" if lossless_available else "disabled",
+        font=(FONT_FAMILY, 9),
+        bg=BG_COLOR,
+        activebackground=BG_COLOR,
+    ).pack()
+    
+    # Per-file results
+    results_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    results_frame.pack(pady=10, padx=20, fill="both", expand=True)
+    
+    results_text = tk.Text(results_frame, font=(FONT_FAMILY, 9), height=12, state="disabled")
+    results_scrollbar = tk.Scrollbar(results_frame, orient="vertical", command=results_text.yview)
+    results_text.configure(yscrollcommand=results_scrollbar.set)
+    results_text.pack(side="left", fill="both", expand=True)
+    results_scrollbar.pack(side="right", fill="y")
+    
+    status_label = tk.Label(
+        batch_dialog,
+        text="",
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        fg="#0078d4",
+    )
+    status_label.pack()
+    
+    batch_state = {"done": 0, "failed": 0, "finished": False}
+    results_queue = queue.Queue()
+    
+    def add_result_line(line):
+        results_text.config(state="normal")
+        results_text.insert(tk.END, line + "\n")
+        results_text.see(tk.END)
+        results_text.config(state="disabled")
+    
+    def run_batch(output_dir, relative, lossless):
+        """Crop every file on the process pool (runs in a worker thread)"""
+        try:
+            for result in iter_batch_crop(filepaths, template, output_dir, relative=relative, lossless=lossless):
+                results_queue.put(result)
+        except Exception as e:
+            results_queue.put({"ok": False, "input": input_dir, "error": str(e)})
+        results_queue.put(None)
+    
+    def poll_results():
+        """Show per-file results as the workers finish them"""
+        if not batch_dialog.winfo_exists():
+            return
+        while not results_queue.empty():
+            result = results_queue.get()
+            if result is None:
+                batch_state["finished"] = True
+                break
+            name = os.path.basename(result["input"])
+            if result["ok"]:
+                batch_state["done"] += 1
+                add_result_line(f"✓ {name} → {result['width']} x {result['height']}")
+            else:
+                batch_state["failed"] += 1
+                add_result_line(f"✕ {name}: {result['error']}")
+        
+        status_label.config(
+            text=f"Processed {batch_state['done'] + batch_state['failed']} of {len(filepaths)} images",
+        )
+        if not batch_state["finished"]:
+            batch_dialog.after(100, poll_results)
+            return
+        
+        close_btn.config(state="normal")
+        messagebox.showinfo(
+            "Batch Crop",
+            f"Cropped {batch_state['done']} image(s), {batch_state['failed']} failed.",
+            parent=batch_dialog,
+        )
+    
+    def perform_batch_crop():
+        output_dir = filedialog.askdirectory(title="Select output folder", parent=batch_dialog)
+        if not output_dir:
+            return
+        
+        crop_btn.config(state="disabled")
+        close_btn.config(state="disabled")
+        status_label.config(text="Cropping... Please wait.")
+        threading.Thread(
+            target=run_batch,
+            args=(output_dir, relative_var.get(), lossless_var.get()),
+            daemon=True,
+        ).start()
+        batch_dialog.after(100, poll_results)
+    
+    # Buttons
+    btn_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    btn_frame.pack(pady=15)
+    
+    crop_btn = create_primary_button(btn_frame, text="Crop All", command=perform_batch_crop)
+    crop_btn.pack(side="left", padx=10)
+    
+    close_btn = create_secondary_button(btn_frame, text="Close", command=batch_dialog.destroy)
+    close_btn.pack(side="left", padx=10)
+    
+    # Size and center
+    center_dialog(batch_dialog, 600, 480)
+
+
 def compress_image(app):
     """Upload and compress an image file to a target size."""
     # Select an image file
     filepath = filedialog.askopenfilename(
         title="Select an image to compress",
         filetypes=[
-            ("Image files", "*.jpg *.jpeg *.png *.bmp"),
+            ("Image files", "*.jpg *.jpeg *.png *.bmp *.webp"),
             ("JPEG files", "*.jpg *.jpeg"),
             ("PNG files", "*.png"),
             ("BMP files", "*.bmp"),
+            ("WebP files", "*.webp"),
         ],
     )
     
@@ -632,13 +1166,13 @@ def compress_image(app):
         compress_dialog = tk.Toplevel(app)
         compress_dialog.title("Compress Image")
         compress_dialog.configure(bg=BG_COLOR)
-        compress_dialog.geometry("450x400")
+        compress_dialog.geometry("450x510")
         compress_dialog.resizable(False, False)
         compress_dialog.transient(app)
         compress_dialog.grab_set()
         
         # Center the dialog
-        center_dialog(compress_dialog, 450, 400)
+        center_dialog(compress_dialog, 450, 510)
         
         # Title
         title_label = tk.Label(
@@ -683,15 +1217,16 @@ def compress_image(app):
         
         # Target size input
         target_frame = tk.Frame(compress_dialog, bg=BG_COLOR)
-        target_frame.pack(pady=20)
+        target_frame.pack(pady=(20, 5))
         
-        tk.Label(
+        target_label = tk.Label(
             target_frame,
             text="Target Size:",
             font=(FONT_FAMILY, 11, "bold"),
             bg=BG_COLOR,
             anchor="e",
-        ).pack(side="left", padx=(0, 10))
+        )
+        target_label.pack(side="left", padx=(0, 10))
         
         target_entry = tk.Entry(target_frame, font=(FONT_FAMILY, 11), width=10)
         # Default to 50% of original size, minimum 10 KB
@@ -699,23 +1234,212 @@ def compress_image(app):
         target_entry.insert(0, str(default_target))
         target_entry.pack(side="left")
         
-        tk.Label(
+        unit_label = tk.Label(
             target_frame,
             text="KB",
             font=(FONT_FAMILY, 11, "bold"),
             bg=BG_COLOR,
+        )
+        unit_label.pack(side="left", padx=5)
+        
+        # Target mode: a file size, or a minimum SSIM against the original
+        mode_frame = tk.Frame(compress_dialog, bg=BG_COLOR)
+        mode_frame.pack(pady=(0, 10))
+        
+        ssim_available = is_ssim_available()
+        mode_var = tk.StringVar(value="size")
+        mode_state = {"mode": "size", "values": {"size": str(default_target), "ssim": "0.95"}}
+        
+        def switch_mode():
+            # Remember the value typed for the old mode and restore the new one
+            mode_state["values"][mode_state["mode"]] = target_entry.get()
+            mode_state["mode"] = mode_var.get()
+            target_entry.delete(0, tk.END)
+            target_entry.insert(0, mode_state["values"][mode_state["mode"]])
+            if mode_state["mode"] == "ssim":
+                target_label.config(text="Minimum SSIM:")
+                unit_label.config(text="(0 - 1)")
+            else:
+                target_label.config(text="Target Size:")
+                unit_label.config(text="KB")
+            update_info_label()
+            schedule_prediction()
+        
+        tk.Radiobutton(
+            mode_frame,
+            text="Target size",
+            variable=mode_var,
+            value="size",
+            command=switch_mode,
+            font=(FONT_FAMILY, 9),
+            bg=BG_COLOR,
+            activebackground=BG_COLOR,
         ).pack(side="left", padx=5)
+        tk.Radiobutton(
+            mode_frame,
+            text="Minimum quality (SSIM)" + ("" if ssim_available else " - NumPy not found"),
+            variable=mode_var,
+            value="ssim",
+            command=switch_mode,
+            state="normal" if ssim_available else "disabled",
+            font=(FONT_FAMILY, 9),
+            bg=BG_COLOR,
+            activebackground=BG_COLOR,
+        ).pack(side="left", padx=5)
+        
+        # Output format choice: label -> compression options
+        format_choices = get_format_choices()
+        
+        format_frame = tk.Frame(compress_dialog, bg=BG_COLOR)
+        format_frame.pack(pady=(0, 10))
+        
+        tk.Label(
+            format_frame,
+            text="Format:",
+            font=(FONT_FAMILY, 11, "bold"),
+            bg=BG_COLOR,
+        ).pack(side="left", padx=(0, 10))
+        
+        # Keep PNGs (screenshots, line art, transparency) as PNG by default
+        format_var = tk.StringVar(value="PNG" if img.format == "PNG" else "JPEG")
+        format_menu = tk.OptionMenu(
+            format_frame,
+            format_var,
+            *format_choices,
+            command=lambda _: [update_info_label(), schedule_prediction()],
+        )
+        format_menu.config(font=(FONT_FAMILY, 10), bg=BG_COLOR, relief="flat", highlightthickness=0)
+        format_menu.pack(side="left")
         
         # Info label
         info_label = tk.Label(
             compress_dialog,
-            text="Image will be resized proportionally to achieve target size\nwithout losing image quality.",
+            text="",
             font=(FONT_FAMILY, 9),
             bg=BG_COLOR,
             fg="#666666",
         )
         info_label.pack(pady=5)
         
+        def is_lossy(options):
+            return OUTPUT_FORMATS[options["fmt"]]["min_quality"] is not None and not options.get("lossless")
+        
+        def update_info_label():
+            options = format_choices[format_var.get()]
+            fmt = options["fmt"]
+            if mode_var.get() == "ssim":
+                if is_lossy(options):
+                    text = ("Picks the smallest file whose SSIM against the original stays at or\n"
+                            "above the minimum (1.0 is identical). The image is never resized.")
+                else:
+                    text = "Minimum quality mode needs a lossy format (JPEG, WebP or AVIF)."
+            elif fmt == "PNG":
+                text = (f"PNG is saved losslessly if it fits, otherwise reduced to a palette of "
+                        f"{PNG_PALETTE_SIZES[0]} down to\n{PNG_PALETTE_SIZES[-1]} colors, then resized. "
+                        f"Transparency is kept; metadata is stripped.")
+            elif options.get("lossless"):
+                text = "Lossless WebP keeps every pixel (and transparency); the image\nis resized proportionally to achieve the target size."
+            else:
+                min_quality = OUTPUT_FORMATS[fmt]["min_quality"]
+                text = (f"{OUTPUT_FORMATS[fmt]['label']} quality is lowered first (down to {min_quality}), then the image is\n"
+                        f"resized proportionally to achieve the target size.")
+                if OUTPUT_FORMATS[fmt]["alpha"]:
+                    text += " Transparency is kept."
+            info_label.config(text=text)
+        
+        update_info_label()
+        
+        # Predicted result, refreshed in the background as the user types
+        prediction_label = tk.Label(
+            compress_dialog,
+            text="",
+            font=(FONT_FAMILY, 9, "bold"),
+            bg=BG_COLOR,
+            fg="#333333",
+        )
+        prediction_label.pack()
+        
+        PREDICT_DELAY_MS = 250  # Debounce typing before asking for a prediction
+        prediction_state = {"after_id": None, "request_id": 0}
+        prediction_requests = queue.Queue()
+        prediction_results = queue.Queue()
+        
+        def run_predictions():
+            """Answer prediction requests (runs in a worker thread)
+            
+            Size models are built once per format from a draft decode of the
+            file, so every later prediction only evaluates the model.
+            """
+            models = {}
+            while True:
+                request = prediction_requests.get()
+                # Only the newest request matters
+                while request is not None and not prediction_requests.empty():
+                    request = prediction_requests.get()
+                if request is None:
+                    return
+                request_id, target_bytes, fmt, lossless = request
+                try:
+                    if (fmt, lossless) not in models:
+                        models[(fmt, lossless)] = build_size_model(filepath, fmt, lossless)
+                    prediction_results.put((request_id, models[(fmt, lossless)].preview(target_bytes)))
+                except Exception as e:
+                    prediction_results.put((request_id, e))
+        
+        def request_prediction():
+            prediction_state["after_id"] = None
+            options = format_choices[format_var.get()]
+            if mode_var.get() == "ssim" or options["fmt"] == "PNG":
+                prediction_label.config(text="")
+                return
+            try:
+                target_kb = int(target_entry.get())
+                if target_kb <= 0:
+                    raise ValueError
+            except ValueError:
+                prediction_label.config(text="")
+                return
+            prediction_state["request_id"] += 1
+            prediction_label.config(text="Predicting...")
+            prediction_requests.put((
+                prediction_state["request_id"],
+                target_kb * 1024,
+                options["fmt"],
+                bool(options.get("lossless")),
+            ))
+        
+        def schedule_prediction():
+            if prediction_state["after_id"] is not None:
+                compress_dialog.after_cancel(prediction_state["after_id"])
+            prediction_state["after_id"] = compress_dialog.after(PREDICT_DELAY_MS, request_prediction)
+        
+        def poll_predictions():
+            if not compress_dialog.winfo_exists():
+                return
+            while not prediction_results.empty():
+                request_id, prediction = prediction_results.get()
+                if request_id != prediction_state["request_id"]:
+                    continue  # Stale answer to an older input
+                if isinstance(prediction, Exception):
+                    prediction_label.config(text="Prediction unavailable")
+                    continue
+                text = (f"Predicted: {prediction['width']} x {prediction['height']}, "
+                        f"about {prediction['size'] / 1024:.0f} KB")
+                if not format_choices[format_var.get()].get("lossless"):
+                    text += f", quality {prediction['quality']}"
+                prediction_label.config(text=text)
+            compress_dialog.after(100, poll_predictions)
+        
+        def stop_predictions(event):
+            if event.widget is compress_dialog:
+                prediction_requests.put(None)
+        
+        threading.Thread(target=run_predictions, daemon=True).start()
+        compress_dialog.bind("<Destroy>", stop_predictions)
+        target_entry.bind("<KeyRelease>", lambda _: schedule_prediction())
+        schedule_prediction()
+        compress_dialog.after(100, poll_predictions)
+        
         # Status label
         status_label = tk.Label(
             compress_dialog,
@@ -726,105 +1450,36 @@ def compress_image(app):
         )
         status_label.pack(pady=5)
         
-        # Function to compress image to target size using smart resizing
-        def compress_to_target_size(image, target_kb, output_path):
-            """Compress image to target size by proportional resizing."""
-            target_bytes = target_kb * 1024
-            
-            # Convert image to RGB if needed (for JPEG output)
-            working_img = image.copy()
-            if working_img.mode in ('RGBA', 'P'):
-                working_img = working_img.convert('RGB')
-            
-            current_width, current_height = working_img.size
-            
-            # First, check current size at high quality (85)
-            buffer = io.BytesIO()
-            working_img.save(buffer, format='JPEG', quality=85, optimize=True)
-            current_size = buffer.tell()
-            
-            # If already under target, save with high quality
-            if current_size <= target_bytes:
-                working_img.save(output_path, format='JPEG', quality=85, optimize=True)
-                return os.path.getsize(output_path), current_width, current_height
-            
-            # Calculate scale factor based on file size ratio
-            # File size roughly proportional to number of pixels
-            size_ratio = target_bytes / current_size
-            # Use square root because file size is proportional to area (width * height)
-            scale_factor = math.sqrt(size_ratio) * 0.95  # 5% margin for safety
-            
-            # Apply scaling iteratively to reach target size
-            best_img = None
-            best_size = current_size
-            
-            for attempt in range(10):
-                # Calculate new dimensions
-                new_width = max(50, int(current_width * scale_factor))
-                new_height = max(50, int(current_height * scale_factor))
-                
-                # Resize with high-quality LANCZOS resampling
-                resized = working_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Check size at quality 85 (good balance of quality and size)
-                buffer = io.BytesIO()
-                resized.save(buffer, format='JPEG', quality=85, optimize=True)
-                new_size = buffer.tell()
-                
-                if new_size <= target_bytes:
-                    best_img = resized
-                    best_size = new_size
-                    
-                    # Try to get a bit larger while still under target
-                    scale_factor *= 1.05
-                else:
-                    # Need to reduce more
-                    scale_factor *= 0.9
-                
-                # Stop if we're close enough (within 5% of target)
-                if best_img is not None and best_size >= target_bytes * 0.90:
-                    break
-                
-                # Prevent too small images
-                if new_width <= 50 or new_height <= 50:
-                    if best_img is None:
-                        best_img = resized
-                        best_size = new_size
-                    break
-            
-            # If we still don't have a valid image, use the smallest we got
-            if best_img is None:
-                # Last resort: reduce to minimum size
-                min_width = max(50, int(current_width * 0.1))
-                min_height = max(50, int(current_height * 0.1))
-                best_img = working_img.resize((min_width, min_height), Image.Resampling.LANCZOS)
-            
-            # Save the result
-            best_img.save(output_path, format='JPEG', quality=85, optimize=True)
-            final_size = os.path.getsize(output_path)
-            final_width, final_height = best_img.size
-            
-            working_img.close()
-            best_img.close()
-            
-            return final_size, final_width, final_height
-        
         # Function to perform the compression
         def perform_compress():
             try:
-                target_kb = int(target_entry.get())
-                if target_kb <= 0:
-                    messagebox.showerror("Error", "Target size must be a positive number.")
-                    return
+                options = format_choices[format_var.get()]
+                fmt = options["fmt"]
+                ssim_mode = mode_var.get() == "ssim"
+                if ssim_mode:
+                    min_ssim = float(target_entry.get())
+                    if not 0 < min_ssim < 1:
+                        messagebox.showerror("Error", "Minimum SSIM must be between 0 and 1.")
+                        return
+                    if not is_lossy(options):
+                        messagebox.showerror("Error", "Minimum quality mode needs JPEG, WebP or AVIF.")
+                        return
+                else:
+                    target_kb = int(target_entry.get())
+                    if target_kb <= 0:
+                        messagebox.showerror("Error", "Target size must be a positive number.")
+                        return
+                
+                extension = OUTPUT_FORMATS[fmt]["extension"]
                 
                 # Get output path
                 output_path = filedialog.asksaveasfilename(
                     title="Save compressed image as",
-                    defaultextension=".jpg",
+                    defaultextension=extension,
                     filetypes=[
-                        ("JPEG files", "*.jpg *.jpeg"),
+                        (f"{OUTPUT_FORMATS[fmt]['label']} files", f"*{extension}" + (" *.jpeg" if fmt == "JPEG" else "")),
                     ],
-                    initialfile=f"compressed_{os.path.splitext(filename)[0]}.jpg",
+                    initialfile=f"compressed_{os.path.splitext(filename)[0]}{extension}",
                 )
                 
                 if not output_path:
@@ -833,24 +1488,43 @@ def compress_image(app):
                 status_label.config(text="Compressing... Please wait.", fg="#0078d4")
                 compress_dialog.update()
                 
-                final_size, final_width, final_height = compress_to_target_size(img, target_kb, output_path)
+                # Decode through the shared cache, so a photo that was just
+                # resized or cropped is not decoded again
+                with open_decoded(filepath) as decoded_img:
+                    if ssim_mode:
+                        result = compress_to_quality(decoded_img, min_ssim, output_path, fmt=fmt)
+                    else:
+                        result = compress_to_target_size(decoded_img, target_kb, output_path, **options)
+                final_size, final_width, final_height = result["size"], result["width"], result["height"]
                 final_size_kb = final_size / 1024
                 
                 img.close()
                 compress_dialog.destroy()
                 
+                if result.get("colors"):
+                    detail = f", {result['colors']} colors"
+                elif result["lossless"]:
+                    detail = ""
+                else:
+                    detail = f", quality {result['quality']}"
+                if ssim_mode:
+                    detail += f", SSIM {result['ssim']:.4f}"
+                    if not result["reached"]:
+                        detail += f" - below {min_ssim} even at the highest quality"
                 reduction = ((original_size_bytes - final_size) / original_size_bytes) * 100
                 messagebox.showinfo(
                     "Success",
                     f"Image compressed successfully!\n\n"
                     f"Original: {original_size_kb:.2f} KB ({original_width} x {original_height})\n"
-                    f"Compressed: {final_size_kb:.2f} KB ({final_width} x {final_height})\n"
+                    f"Compressed: {final_size_kb:.2f} KB ({final_width} x {final_height}, "
+                    f"{format_var.get()}{detail})\n"
                     f"Reduction: {reduction:.1f}%\n\n"
                     f"Saved to:\n{output_path}",
                 )
                 
             except ValueError:
-                messagebox.showerror("Error", "Please enter a valid numeric value for target size.")
+                messagebox.showerror("Error", "Please enter a valid numeric value for "
+                                     + ("minimum SSIM." if mode_var.get() == "ssim" else "target size."))
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to compress image.\n\n{e}")
         
@@ -872,3 +1546,217 @@ def compress_image(app):
         
     except Exception as e:
         messagebox.showerror("Error", f"Failed to open image.\n\n{e}")
+
+
+def batch_compress_images(app):
+    """Compress every image in a folder to a target size and write a report."""
+    input_dir = filedialog.askdirectory(title="Select a folder of images to compress")
+    if not input_dir:
+        return
+    
+    # Create batch compress dialog window
+    batch_dialog = tk.Toplevel(app)
+    batch_dialog.title("Batch Compress")
+    batch_dialog.configure(bg=BG_COLOR)
+    batch_dialog.transient(app)
+    batch_dialog.grab_set()
+    
+    # Info frame at the top
+    info_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    info_frame.pack(pady=(15, 5), padx=20, fill="x")
+    
+    folder_label = tk.Label(
+        info_frame,
+        text="",
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        fg="#0078d4",
+    )
+    folder_label.pack()
+    
+    # Options
+    options_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    options_frame.pack(pady=5)
+    
+    tk.Label(
+        options_frame,
+        text="Target Size:",
+        font=(FONT_FAMILY, 10, "bold"),
+        bg=BG_COLOR,
+    ).pack(side="left", padx=(0, 5))
+    
+    target_entry = tk.Entry(options_frame, font=(FONT_FAMILY, 10), width=8)
+    target_entry.insert(0, "200")
+    target_entry.pack(side="left")
+    
+    tk.Label(
+        options_frame,
+        text="KB",
+        font=(FONT_FAMILY, 10, "bold"),
+        bg=BG_COLOR,
+    ).pack(side="left", padx=(5, 15))
+    
+    # Output format choice: label -> compression options
+    format_choices = get_format_choices()
+    
+    format_var = tk.StringVar(value="JPEG")
+    format_menu = tk.OptionMenu(options_frame, format_var, *format_choices)
+    format_menu.config(font=(FONT_FAMILY, 10), bg=BG_COLOR, relief="flat", highlightthickness=0)
+    format_menu.pack(side="left")
+    
+    recursive_var = tk.BooleanVar(value=False)
+    
+    def update_folder_label():
+        count = len(list_image_files(input_dir, recursive=recursive_var.get()))
+        folder_label.config(text=f"Folder: {input_dir} ({count} images)")
+    
+    tk.Checkbutton(
+        batch_dialog,
+        text="Include sub-folders",
+        variable=recursive_var,
+        command=update_folder_label,
+        font=(FONT_FAMILY, 9),
+        bg=BG_COLOR,
+        activebackground=BG_COLOR,
+    ).pack()
+    
+    update_folder_label()
+    
+    tk.Label(
+        batch_dialog,
+        text="Images already under the target are copied unchanged. A CSV and\n"
+             "JSON report is written to the output folder.",
+        font=(FONT_FAMILY, 9),
+        bg=BG_COLOR,
+        fg="#666666",
+    ).pack(pady=5)
+    
+    # Per-file results
+    results_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    results_frame.pack(pady=10, padx=20, fill="both", expand=True)
+    
+    results_text = tk.Text(results_frame, font=(FONT_FAMILY, 9), height=12, state="disabled")
+    results_scrollbar = tk.Scrollbar(results_frame, orient="vertical", command=results_text.yview)
+    results_text.configure(yscrollcommand=results_scrollbar.set)
+    results_text.pack(side="left", fill="both", expand=True)
+    results_scrollbar.pack(side="right", fill="y")
+    
+    status_label = tk.Label(
+        batch_dialog,
+        text="",
+        font=(FONT_FAMILY, 10),
+        bg=BG_COLOR,
+        fg="#0078d4",
+    )
+    status_label.pack()
+    
+    batch_state = {"results": [], "total": 0, "finished": False, "output_dir": None}
+    results_queue = queue.Queue()
+    
+    def add_result_line(line):
+        results_text.config(state="normal")
+        results_text.insert(tk.END, line + "\n")
+        results_text.see(tk.END)
+        results_text.config(state="disabled")
+    
+    def run_batch(filepaths, target_kb, output_dir, options):
+        """Compress every file on the process pool (runs in a worker thread)"""
+        try:
+            for result in iter_batch_compress(filepaths, target_kb, output_dir, input_dir=input_dir, **options):
+                results_queue.put(result)
+        except Exception as e:
+            results_queue.put({"status": "failed", "input": input_dir, "error": str(e)})
+        results_queue.put(None)
+    
+    def poll_results():
+        """Show per-file results as the workers finish them"""
+        if not batch_dialog.winfo_exists():
+            return
+        while not results_queue.empty():
+            result = results_queue.get()
+            if result is None:
+                batch_state["finished"] = True
+                break
+            batch_state["results"].append(result)
+            name = os.path.relpath(result["input"], input_dir)
+            if result["status"] == "failed":
+                add_result_line(f"✕ {name}: {result['error']}")
+            elif result["status"] == "skipped":
+                add_result_line(f"– {name}: already {result['final_size'] / 1024:.1f} KB, copied")
+            else:
+                add_result_line(
+                    f"✓ {name}: {result['original_size'] / 1024:.1f} KB → {result['final_size'] / 1024:.1f} KB "
+                    f"({result['width']} x {result['height']}) in {result['seconds']:.1f}s"
+                )
+        
+        status_label.config(
+            text=f"Processed {len(batch_state['results'])} of {batch_state['total']} images",
+        )
+        if not batch_state["finished"]:
+            batch_dialog.after(100, poll_results)
+            return
+        
+        results = sorted(batch_state["results"], key=lambda r: r["input"])
+        counts = {status: 0 for status in ("compressed", "skipped", "failed")}
+        for result in results:
+            counts[result["status"]] += 1
+        
+        summary = (f"Compressed {counts['compressed']} image(s), skipped {counts['skipped']} "
+                   f"already under the target, {counts['failed']} failed.")
+        try:
+            for report_name in ("compress_report.csv", "compress_report.json"):
+                write_report(results, os.path.join(batch_state["output_dir"], report_name))
+            summary += f"\n\nReport saved to:\n{batch_state['output_dir']}"
+        except Exception as e:
+            summary += f"\n\nFailed to write the report.\n\n{e}"
+        
+        compress_btn.config(state="normal")
+        close_btn.config(state="normal")
+        messagebox.showinfo("Batch Compress", summary, parent=batch_dialog)
+    
+    def perform_batch_compress():
+        try:
+            target_kb = int(target_entry.get())
+            if target_kb <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a positive number for the target size.", parent=batch_dialog)
+            return
+        
+        filepaths = list_image_files(input_dir, recursive=recursive_var.get())
+        if not filepaths:
+            messagebox.showerror("Error", "No images found in the selected folder.", parent=batch_dialog)
+            return
+        
+        output_dir = filedialog.askdirectory(title="Select output folder", parent=batch_dialog)
+        if not output_dir:
+            return
+        
+        options = format_choices[format_var.get()]
+        batch_state.update(results=[], total=len(filepaths), finished=False, output_dir=output_dir)
+        results_text.config(state="normal")
+        results_text.delete("1.0", tk.END)
+        results_text.config(state="disabled")
+        
+        compress_btn.config(state="disabled")
+        close_btn.config(state="disabled")
+        status_label.config(text="Compressing... Please wait.")
+        threading.Thread(
+            target=run_batch,
+            args=(filepaths, target_kb, output_dir, options),
+            daemon=True,
+        ).start()
+        batch_dialog.after(100, poll_results)
+    
+    # Buttons
+    btn_frame = tk.Frame(batch_dialog, bg=BG_COLOR)
+    btn_frame.pack(pady=15)
+    
+    compress_btn = create_primary_button(btn_frame, text="Compress All", command=perform_batch_compress)
+    compress_btn.pack(side="left", padx=10)
+    
+    close_btn = create_secondary_button(btn_frame, text="Close", command=batch_dialog.destroy)
+    close_btn.pack(side="left", padx=10)
+    
+    # Size and center
+    center_dialog(batch_dialog, 600, 520)
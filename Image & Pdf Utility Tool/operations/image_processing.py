@@ -0,0 +1,175 @@
+"""
+Image processing helpers for the Image & PDF Utility Tool.
+
+These functions work on files and Pillow images only and never touch
+tkinter, so they can be shared by the dialogs and run in worker threads.
+"""
+import shutil
+import subprocess
+
+from PIL import Image
+
+from operations.image_cache import cached_image, open_decoded
+from utils.tracing import span, traced
+
+
+def load_preview(filepath, size, high_quality=False):
+    """Load a reduced copy of an image that is exactly ``size`` pixels.
+
+    The fast path asks the decoder for a draft (JPEGs are decoded at a
+    reduced DCT scale) and finishes with a bilinear resize, so a preview of
+    a very large photo is available almost immediately. The high quality
+    path decodes at twice the preview size and finishes with LANCZOS.
+    An image already in the shared image cache is resized without decoding.
+    """
+    width, height = size
+    cached = cached_image(filepath)
+    if cached is not None:
+        with span("resize", input=filepath, size=size, high_quality=high_quality):
+            if high_quality:
+                return cached.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            return cached.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    with span("decode", input=filepath, size=size, high_quality=high_quality), Image.open(filepath) as img:
+        if high_quality:
+            img.draft(None, (width * 2, height * 2))
+            return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        img.draft(None, size)
+        return img.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+@traced("resize_image")
+def resize_image_file(filepath, output_path, size, reduced_decode=False):
+    """Resize an image file to ``size`` with LANCZOS and save it.
+
+    The decoded image comes from the shared image cache, so resizing a file
+    that was just cropped or compressed does not decode it again. With
+    ``reduced_decode`` set, JPEGs are instead decoded at the smallest DCT
+    scale that is still at least ``size``, for images too big to decode whole.
+    """
+    if reduced_decode:
+        opened = Image.open(filepath)
+        opened.draft(None, size)
+    else:
+        opened = open_decoded(filepath)
+    with opened as img:
+        with span("resize", size=size):
+            resized_img = img.resize(size, Image.Resampling.LANCZOS)
+    # Convert if needed for JPEG
+    if output_path.lower().endswith(('.jpg', '.jpeg')) and resized_img.mode in ('RGBA', 'P'):
+        converted = resized_img.convert('RGB')
+        resized_img.close()
+        resized_img = converted
+    with span("write", output=output_path):
+        resized_img.save(output_path)
+    resized_img.close()
+
+
+def get_jpeg_mcu_size(img):
+    """Return the (width, height) of a JPEG's MCU blocks, or None.
+
+    Only the header is inspected; ``img`` must be an opened JPEG image.
+    """
+    if img.format != "JPEG" or not getattr(img, "layer", None):
+        return None
+    if len(img.layer) == 1:
+        return 8, 8
+    h_samp = max(component[1] for component in img.layer)
+    v_samp = max(component[2] for component in img.layer)
+    return 8 * h_samp, 8 * v_samp
+
+
+def snap_box_to_mcu(box, mcu_size):
+    """Move the top-left corner of ``box`` onto the MCU grid.
+
+    The bottom-right corner is kept, matching how jpegtran handles crops.
+    """
+    x1, y1, x2, y2 = box
+    mcu_w, mcu_h = mcu_size
+    return x1 - x1 % mcu_w, y1 - y1 % mcu_h, x2, y2
+
+
+def is_lossless_crop_available():
+    """Return True if jpegtran is installed for lossless JPEG crops."""
+    return shutil.which("jpegtran") is not None
+
+
+def crop_jpeg_lossless(filepath, output_path, box):
+    """Crop a JPEG by copying DCT coefficients with jpegtran.
+
+    The crop box is snapped to the MCU grid first, so no pixels are decoded
+    or re-encoded. Returns the snapped box that was actually written.
+    """
+    with Image.open(filepath) as img:
+        mcu_size = get_jpeg_mcu_size(img)
+    if mcu_size is None:
+        raise ValueError("Lossless crop is only available for JPEG images.")
+
+    x1, y1, x2, y2 = snap_box_to_mcu(box, mcu_size)
+    with span("write", input=filepath, output=output_path, tool="jpegtran"):
+        subprocess.run(
+            [
+                "jpegtran",
+                "-copy", "all",
+                "-crop", f"{x2 - x1}x{y2 - y1}+{x1}+{y1}",
+                "-outfile", output_path,
+                filepath,
+            ],
+            check=True,
+            capture_output=True,
+        )
+    return x1, y1, x2, y2
+
+
+@traced("crop_image")
+def crop_image_file(filepath, output_path, box, lossless=False):
+    """Crop an image file and save the result.
+
+    With ``lossless`` set, JPEG to JPEG crops go through jpegtran when it
+    is installed; otherwise the image is cropped with Pillow. Returns the
+    box that was actually written, which may be MCU-snapped.
+    """
+    is_jpeg_output = output_path.lower().endswith(('.jpg', '.jpeg'))
+    if lossless and is_jpeg_output and is_lossless_crop_available():
+        # Only the header is read to check the file can be cropped losslessly
+        with Image.open(filepath) as img:
+            can_copy_blocks = get_jpeg_mcu_size(img) is not None
+        if can_copy_blocks:
+            # Copy DCT coefficients - no decode/re-encode round trip
+            return crop_jpeg_lossless(filepath, output_path, box)
+
+    with open_decoded(filepath) as img:
+        with span("crop", box=tuple(box)):
+            cropped_img = img.crop(box)
+    if is_jpeg_output and cropped_img.mode in ('RGBA', 'P'):
+        cropped_img = cropped_img.convert('RGB')
+    with span("write", output=output_path):
+        cropped_img.save(output_path)
+    cropped_img.close()
+    return tuple(box)
+
+
+def make_crop_template(box, image_size):
+    """Build a reusable crop template from a crop box and its image size."""
+    return {"box": list(box), "image_size": list(image_size)}
+
+
+def resolve_crop_template(template, image_size, relative=True):
+    """Return the pixel crop box of ``template`` for an image of ``image_size``.
+
+    Relative templates scale the box to the image; absolute templates use
+    the saved pixel coordinates. Either way the box is clamped to the image.
+    """
+    x1, y1, x2, y2 = template["box"]
+    width, height = image_size
+    if relative:
+        template_width, template_height = template["image_size"]
+        x1, x2 = x1 * width / template_width, x2 * width / template_width
+        y1, y2 = y1 * height / template_height, y2 * height / template_height
+
+    x1 = max(0, min(int(round(x1)), width))
+    y1 = max(0, min(int(round(y1)), height))
+    x2 = max(x1, min(int(round(x2)), width))
+    y2 = max(y1, min(int(round(y2)), height))
+    if x2 - x1 < 1 or y2 - y1 < 1:
+        raise ValueError("Crop template lies outside the image.")
+    return x1, y1, x2, y2
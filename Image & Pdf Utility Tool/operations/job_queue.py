@@ -0,0 +1,270 @@
+"""
+Persistent, resumable job queue for long batches.
+
+Every file-level job of a batch is stored as a task row in an SQLite
+database with its operation, inputs, output, parameters and status, so a
+batch that is interrupted (a crash, a reboot, Ctrl+C) can be resumed and
+only runs the tasks that did not finish.
+
+Runners claim tasks with a lease: a claimed task belongs to its runner
+until the lease expires, and the runner renews the leases of the tasks it
+is working on. Tasks whose lease ran out, or whose runner process is gone,
+can be claimed again, so several runners can share one database. A task
+that fails is retried until it has been attempted ``max_attempts`` times.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from operations.jobs import init_worker, resolve_params, run_job
+
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+TASK_STATUSES = ("pending", "running", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    description TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    operation TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    output TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, lease_expires);
+"""
+
+
+def _runner_id():
+    """Identify this process, so leases of dead runners can be recognised."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _is_dead_local_runner(owner):
+    """Return True if ``owner`` was a process on this host that has exited."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    # A killed runner stays a zombie until its parent reaps it
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            return f.read().rpartition(")")[2].split()[0] == "Z"
+    except (OSError, IndexError):
+        return False
+
+
+class JobQueue:
+    """Batches of tasks stored in an SQLite database."""
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit; transactions are opened explicitly where needed
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.owner = _runner_id()
+
+    def close(self):
+        self._db.close()
+
+    def add_batch(self, jobs, description=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Store ``(operation, inputs, output_path, params)`` jobs as a new batch.
+
+        Returns the batch id.
+        """
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN")
+            batch_id = self._db.execute(
+                "INSERT INTO batches (description, created) VALUES (?, ?)", (description, now)).lastrowid
+            self._db.executemany(
+                "INSERT INTO tasks (batch_id, operation, inputs, output, params, max_attempts, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (batch_id, operation, json.dumps(list(inputs)), output_path, json.dumps(params or {}),
+                     max_attempts, now)
+                    for operation, inputs, output_path, params in jobs
+                ],
+            )
+        return batch_id
+
+    def claim(self, batch_id=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease the next runnable task to this runner and return it, or None.
+
+        Runnable tasks are pending ones and running ones whose lease has
+        expired or whose runner has exited. Each claim counts as an attempt,
+        so a file that crashes its runner is not retried forever.
+        """
+        now = time.time()
+        batch_filter = "" if batch_id is None else " AND batch_id = ?"
+        batch_args = () if batch_id is None else (batch_id,)
+        with self._db:
+            # IMMEDIATE takes the write lock up front, so two runners cannot
+            # claim the same task
+            self._db.execute("BEGIN IMMEDIATE")
+            for row in self._db.execute(
+                    "SELECT id, lease_owner FROM tasks WHERE status = 'running' AND lease_expires > ?" + batch_filter,
+                    (now, *batch_args)).fetchall():
+                if _is_dead_local_runner(row["lease_owner"]):
+                    self._db.execute("UPDATE tasks SET lease_expires = 0 WHERE id = ?", (row["id"],))
+            # Tasks whose lease ran out on their last attempt have failed
+            self._db.execute(
+                "UPDATE tasks SET status = 'failed', error = 'Lease expired on the last attempt.', updated = ?"
+                " WHERE status = 'running' AND lease_expires <= ? AND attempts >= max_attempts" + batch_filter,
+                (now, now, *batch_args))
+            row = self._db.execute(
+                "SELECT * FROM tasks WHERE (status = 'pending' OR (status = 'running' AND lease_expires <= ?))"
+                + batch_filter + " ORDER BY id LIMIT 1",
+                (now, *batch_args)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE tasks SET status = 'running', attempts = attempts + 1, lease_owner = ?,"
+                " lease_expires = ?, updated = ? WHERE id = ?",
+                (self.owner, now + lease_seconds, now, row["id"]))
+        return self._task(row, attempts=row["attempts"] + 1)
+
+    def renew(self, task_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend this runner's leases on ``task_ids``."""
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                [(now + lease_seconds, task_id, self.owner) for task_id in task_ids])
+
+    def finish(self, task_id, result):
+        """Record a task's result; failed tasks go back to pending if they have attempts left.
+
+        Returns the task's new status, or None if this runner lost its lease.
+        """
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._db.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (task_id, self.owner)).fetchone()
+            if row is None:
+                return None
+            if result["status"] == "done":
+                status = "done"
+            else:
+                status = "pending" if row["attempts"] < row["max_attempts"] else "failed"
+            self._db.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = ?, lease_owner = NULL, lease_expires = NULL,"
+                " updated = ? WHERE id = ?",
+                (status, json.dumps(result), result.get("error"), now, task_id))
+        return status
+
+    def release(self, task_ids):
+        """Give back leases without counting the attempt, e.g. on Ctrl+C."""
+        with self._db:
+            self._db.executemany(
+                "UPDATE tasks SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_owner = NULL,"
+                " lease_expires = NULL WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                [(task_id, self.owner) for task_id in task_ids])
+
+    def progress(self, batch_id=None):
+        """Return the number of tasks per status."""
+        counts = dict.fromkeys(TASK_STATUSES, 0)
+        query = "SELECT status, COUNT(*) FROM tasks"
+        args = ()
+        if batch_id is not None:
+            query += " WHERE batch_id = ?"
+            args = (batch_id,)
+        for status, count in self._db.execute(query + " GROUP BY status", args):
+            counts[status] = count
+        return counts
+
+    def batches(self):
+        """Return every batch with its task counts, oldest first."""
+        rows = self._db.execute("SELECT * FROM batches ORDER BY id").fetchall()
+        return [dict(row, **self.progress(row["id"])) for row in rows]
+
+    @staticmethod
+    def _task(row, attempts):
+        return {
+            "id": row["id"],
+            "batch_id": row["batch_id"],
+            "operation": row["operation"],
+            "inputs": json.loads(row["inputs"]),
+            "output": row["output"],
+            "params": json.loads(row["params"]),
+            "attempts": attempts,
+        }
+
+
+def _run_task(task, cache_dir=None):
+    """Run one claimed task (in a worker process) and return its result."""
+    try:
+        params = resolve_params(task["params"])
+    except ValueError as e:
+        return {"operation": task["operation"], "inputs": task["inputs"], "output": task["output"],
+                "status": "failed", "error": str(e), "seconds": 0}
+    return run_job(task["operation"], task["inputs"], task["output"], params, cache_dir)
+
+
+def iter_queue(queue, batch_id=None, max_workers=1, lease_seconds=DEFAULT_LEASE_SECONDS, cache_dir=None):
+    """Run the queue's runnable tasks on a process pool until none are left.
+
+    Yields each task's result, with its ``task_id``, ``attempt`` and the
+    status it was given (a failed task that will be retried is "pending").
+    On KeyboardInterrupt, unfinished tasks are given back to the queue.
+    """
+    renew_every = lease_seconds / 3
+    running = {}  # future -> task
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(max_workers,)) as executor:
+        try:
+            last_renewal = time.monotonic()
+            while True:
+                # Keep one task per worker in flight
+                while len(running) < max_workers:
+                    task = queue.claim(batch_id, lease_seconds)
+                    if task is None:
+                        break
+                    running[executor.submit(_run_task, task, cache_dir)] = task
+                if not running:
+                    return
+                done, _ = wait(running, timeout=renew_every, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"operation": task["operation"], "inputs": task["inputs"],
+                                  "output": task["output"], "status": "failed", "error": str(e)}
+                    status = queue.finish(task["id"], result)
+                    yield dict(result, task_id=task["id"], attempt=task["attempts"], queue_status=status)
+                if running and time.monotonic() - last_renewal >= renew_every:
+                    queue.renew([task["id"] for task in running.values()], lease_seconds)
+                    last_renewal = time.monotonic()
+        except (KeyboardInterrupt, GeneratorExit):
+            queue.release([task["id"] for task in running.values()])
+            for future in running:
+                future.cancel()
+            raise
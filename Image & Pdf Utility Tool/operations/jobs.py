@@ -0,0 +1,271 @@
+"""
+Headless jobs for the Image & PDF Utility Tool.
+
+A job is one operation applied to a list of input files with a dict of
+parameters, producing one output file. ``run_job`` takes only plain values
+and returns a plain result dict, so jobs can be run on worker processes and
+their results printed as JSON. Nothing here imports tkinter.
+"""
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from operations.compression import compress_to_quality, compress_to_target_size, OUTPUT_FORMATS
+from operations.image_cache import configure_worker as configure_image_cache, open_decoded
+from operations.image_processing import crop_image_file, resize_image_file, resolve_crop_template
+from operations.memory_governor import configure_worker as configure_governor, get_governor
+from operations.pdf_processing import (
+    images_to_pdf_file,
+    lock_pdf_file,
+    merge_pdf_files,
+    split_pdf_file,
+    unlock_pdf_file,
+)
+from operations.result_cache import cache_key, is_cacheable, open_cache
+
+
+def _merge(inputs, output_path, params):
+    return {"pages": merge_pdf_files(inputs, output_path)}
+
+
+def _split(inputs, output_path, params):
+    ranges = [tuple(page_range) for page_range in params["ranges"]]
+    return {"pages": split_pdf_file(inputs[0], ranges, output_path)}
+
+
+def _images_to_pdf(inputs, output_path, params):
+    return {"pages": images_to_pdf_file(inputs, output_path, streaming=params.get("streaming", False))}
+
+
+def _lock(inputs, output_path, params):
+    return {"pages": lock_pdf_file(inputs[0], output_path, params["password"])}
+
+
+def _unlock(inputs, output_path, params):
+    return {"pages": unlock_pdf_file(inputs[0], output_path, params["password"])}
+
+
+def _resize(inputs, output_path, params):
+    width, height = params.get("width"), params.get("height")
+    if not width and not height:
+        raise ValueError("Please give a width, a height or both.")
+    if not width or not height:
+        # Keep the aspect ratio for the missing side
+        with Image.open(inputs[0]) as img:
+            original_width, original_height = img.size
+        if not width:
+            width = max(1, round(original_width * height / original_height))
+        else:
+            height = max(1, round(original_height * width / original_width))
+    if width <= 0 or height <= 0:
+        raise ValueError("Width and height must be positive.")
+    resize_image_file(inputs[0], output_path, (width, height), reduced_decode=params.get("reduced_decode", False))
+    return {"width": width, "height": height}
+
+
+def _crop(inputs, output_path, params):
+    if params.get("template"):
+        # A crop template saved by the crop dialog, resolved for this image
+        with Image.open(inputs[0]) as img:
+            box = resolve_crop_template(params["template"], img.size, relative=params.get("relative", True))
+    else:
+        box = tuple(params["box"])
+    box = crop_image_file(inputs[0], output_path, box, lossless=params.get("lossless", False))
+    return {"box": list(box)}
+
+
+def _compress(inputs, output_path, params):
+    fmt = params.get("format", "JPEG")
+    if params.get("draft_scale"):
+        # Decode a JPEG at a reduced DCT scale, for images too big to decode whole
+        opened = Image.open(inputs[0])
+        scale = params["draft_scale"]
+        opened.draft(None, (-(-opened.width // scale), -(-opened.height // scale)))
+    else:
+        opened = open_decoded(inputs[0])
+    with opened as img:
+        if params.get("min_ssim") is not None:
+            result = compress_to_quality(
+                img, params["min_ssim"], output_path, fmt=fmt, max_workers=params.get("max_workers"))
+        else:
+            result = compress_to_target_size(
+                img,
+                params["target_kb"],
+                output_path,
+                fmt=fmt,
+                lossless=params.get("lossless", False),
+                dither=params.get("dither", False),
+                max_workers=params.get("max_workers"),
+            )
+    return result
+
+
+# Operation name -> (runner, takes many inputs, default output prefix)
+JOB_OPERATIONS = {
+    "merge": (_merge, True, "merged_"),
+    "split": (_split, False, "split_"),
+    "img2pdf": (_images_to_pdf, True, "converted_"),
+    "lock": (_lock, False, "locked_"),
+    "unlock": (_unlock, False, "unlocked_"),
+    "resize": (_resize, False, "resized_"),
+    "crop": (_crop, False, "cropped_"),
+    "compress": (_compress, False, "compressed_"),
+}
+
+
+def takes_many_inputs(operation):
+    """Return True if ``operation`` combines all its inputs into one output."""
+    return JOB_OPERATIONS[operation][1]
+
+
+def default_output_path(operation, filepath, output_dir=None, params=None):
+    """Return the output path the dialogs would suggest for ``filepath``.
+
+    PDF-producing operations that combine files always write a ``.pdf``;
+    compression uses the extension of its output format.
+    """
+    prefix = JOB_OPERATIONS[operation][2]
+    name, extension = os.path.splitext(os.path.basename(filepath))
+    if operation in ("merge", "img2pdf"):
+        extension = ".pdf"
+    elif operation == "compress":
+        extension = OUTPUT_FORMATS[(params or {}).get("format", "JPEG")]["extension"]
+    folder = output_dir if output_dir is not None else os.path.dirname(filepath)
+    return os.path.join(folder, f"{prefix}{name}{extension}")
+
+
+def unique_output_paths(filepaths, output_paths):
+    """Return ``output_paths`` renamed so that no two inputs share an output.
+
+    Inputs that would clash (``a.jpg`` and ``a.png`` both compress to
+    ``compressed_a.jpg``) keep their extension in the name instead:
+    ``compressed_a_jpg.jpg`` and ``compressed_a_png.jpg``. Any that still
+    clash, such as same-named files from different folders, are numbered.
+    """
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    counts = {}
+    for output_path in output_paths:
+        counts[key(output_path)] = counts.get(key(output_path), 0) + 1
+    renamed = []
+    for filepath, output_path in zip(filepaths, output_paths):
+        if counts[key(output_path)] > 1:
+            stem, extension = os.path.splitext(output_path)
+            source_extension = os.path.splitext(filepath)[1].lstrip(".").lower()
+            output_path = f"{stem}_{source_extension}{extension}" if source_extension else output_path
+        renamed.append(output_path)
+
+    seen = set()
+    unique = []
+    for output_path in renamed:
+        stem, extension = os.path.splitext(output_path)
+        number = 1
+        while key(output_path) in seen:
+            number += 1
+            output_path = f"{stem}_{number}{extension}"
+        seen.add(key(output_path))
+        unique.append(output_path)
+    return unique
+
+
+def resolve_params(params):
+    """Return ``params`` with ``password_env`` replaced by the password.
+
+    Queued tasks and pipeline definitions name the environment variable
+    holding a password instead of storing the password itself.
+    """
+    if "password_env" not in params:
+        return params
+    params = dict(params)
+    name = params.pop("password_env")
+    params["password"] = os.environ.get(name)
+    if not params["password"]:
+        raise ValueError(f"{name} is not set.")
+    return params
+
+
+def init_worker(workers):
+    """Initializer for process pools running jobs on ``workers`` processes.
+
+    Each worker admits jobs against its share of the memory budget, and
+    does not keep decoded images around (see operations/image_cache.py).
+    """
+    configure_governor(workers)
+    configure_image_cache()
+
+
+def run_job(operation, inputs, output_path, params=None, cache_dir=None):
+    """Run one job and return its result dict; never raises.
+
+    The result holds the ``operation``, ``inputs``, ``output``, ``status``
+    ("done" or "failed"), ``seconds`` and ``error``, plus whatever the
+    operation reports (page count, final size, dimensions...). With a
+    ``cache_dir``, a job that was already run on identical inputs copies
+    the earlier output instead and its result has ``cached`` set (see
+    operations/result_cache.py). Jobs are admitted by the process's memory
+    governor, which records under ``memory`` whether the job ran as is,
+    waited for memory, ran a cheaper degraded path or was refused (see
+    operations/memory_governor.py).
+    """
+    start = time.perf_counter()
+    result = {"operation": operation, "inputs": list(inputs), "output": output_path, "status": "done"}
+    try:
+        if operation not in JOB_OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        if not inputs:
+            raise ValueError("Please select at least one file.")
+        runner, _, _ = JOB_OPERATIONS[operation]
+        cache = key = None
+        if cache_dir and is_cacheable(operation):
+            cache = open_cache(cache_dir)
+            key = cache_key(operation, inputs, output_path, params)
+            stored = cache.get(key, output_path)
+            if stored is not None:
+                result.update(stored, cached=True)
+                result["seconds"] = round(time.perf_counter() - start, 3)
+                return result
+        with get_governor().admit(operation, inputs, output_path, params or {}, result) as run_params:
+            result.update(runner(list(inputs), output_path, run_params))
+        # A degraded output is not what the job asked for; do not reuse it
+        if cache is not None and result.get("memory", {}).get("decision") != "degraded":
+            result["cached"] = False
+            cache.put(key, output_path, result)
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_chain(steps, filepath, output_dir, cache_dir=None):
+    """Run ``steps`` one after another on ``filepath``; never raises.
+
+    Each step is a dict with an ``operation`` and its parameters, and takes
+    the previous step's output as its single input. Intermediate files go
+    to a temporary folder; the last step writes to ``output_dir`` under the
+    name it would give the original file. Returns a result dict with the
+    ``input``, final ``output``, ``status``, ``seconds`` and the result of
+    every step that ran.
+    """
+    result = {"input": filepath, "output": None, "status": "done", "steps": []}
+    current = filepath
+    with tempfile.TemporaryDirectory(prefix="image_pdf_tool_") as work_dir:
+        for index, step in enumerate(steps):
+            operation = step["operation"]
+            params = {key: value for key, value in step.items() if key != "operation"}
+            if index == len(steps) - 1:
+                output_path = default_output_path(operation, filepath, output_dir, params)
+            else:
+                output_path = default_output_path(operation, current, work_dir, params)
+            step_result = run_job(operation, [current], output_path, params, cache_dir)
+            result["steps"].append(step_result)
+            if step_result["status"] != "done":
+                result.update(status="failed", error=f"{operation}: {step_result['error']}")
+                break
+            current = output_path
+        else:
+            result["output"] = current
+    result["seconds"] = round(sum(step["seconds"] for step in result["steps"]), 3)
+    return result
@@ -0,0 +1,234 @@
+"""
+Memory governor for jobs.
+
+Before a job runs, the memory it will need is estimated from its inputs'
+headers: width x height x bands of every image, and the size and page count
+of every PDF. Each process has a memory budget, shared by the jobs it runs
+at the same time. A job that fits the budget runs, or waits until running
+jobs have released enough of it. A job that needs more than the whole
+budget switches to a cheaper path when its operation has one:
+
+- resize and compress decode JPEGs at a reduced DCT scale (draft mode)
+- crop copies JPEG blocks with jpegtran instead of decoding
+- img2pdf appends one image at a time to the PDF instead of holding them all
+
+Otherwise it is refused. The decision is recorded in the job's result
+under ``memory``.
+
+The budget is IMAGE_PDF_TOOL_MEMORY_MB megabytes, or half the physical
+memory when that is not set. Pool workers each hold an equal share of it
+(see ``configure_worker``). Decoded images kept by the image cache count
+against the budget too: the cache is trimmed to what admitted jobs leave
+free.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+from operations.image_cache import estimate_image_bytes, get_image_cache
+from operations.image_processing import is_lossless_crop_available, resolve_crop_template
+from operations.pdf_processing import get_page_count
+
+
+MEMORY_ENV = "IMAGE_PDF_TOOL_MEMORY_MB"
+QUEUE_TIMEOUT = 300
+DRAFT_SCALES = (2, 4, 8)
+# Parsed PyPDF2 objects take a few times the size of the file they came from
+PDF_BYTES_FACTOR = 3
+PDF_PAGE_BYTES = 64 * 1024
+MB = 1024 * 1024
+
+
+def default_budget(workers=1):
+    """Return the memory budget in bytes of one of ``workers`` processes sharing it.
+
+    Returns None if the budget cannot be determined.
+    """
+    workers = max(1, workers)
+    value = os.environ.get(MEMORY_ENV)
+    if value:
+        try:
+            return max(0, int(float(value) * MB)) // workers
+        except ValueError:
+            pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2 // workers
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _image_header(filepath):
+    """Return the format, size and decoded byte count of an image, from its header."""
+    with Image.open(filepath) as img:
+        return img.format, img.size, estimate_image_bytes(img), len(img.getbands())
+
+
+def _draft_scale(size, needed_size):
+    """Return the largest JPEG draft scale that still decodes at least ``needed_size``."""
+    width, height = size
+    for scale in reversed(DRAFT_SCALES):
+        if width / scale >= needed_size[0] and height / scale >= needed_size[1]:
+            return scale
+    return 1
+
+
+def _pdf_bytes(filepath, budget):
+    """Estimate the memory PyPDF2 needs to read and rewrite a PDF."""
+    estimate = os.path.getsize(filepath) * PDF_BYTES_FACTOR
+    # Counting pages means parsing the page tree; only worth it for big files
+    if budget is not None and estimate > budget / 10:
+        try:
+            estimate += get_page_count(filepath) * PDF_PAGE_BYTES
+        except Exception:
+            pass
+    return estimate
+
+
+def estimate_job(operation, inputs, output_path, params, budget=None):
+    """Return the ways ``operation`` can run, with the memory each needs.
+
+    Returns a list of (bytes, param overrides, description) tuples, the
+    normal path first (with no overrides and no description) and cheaper
+    degraded paths after it.
+    """
+    if operation in ("merge", "split", "lock", "unlock"):
+        return [(sum(_pdf_bytes(path, budget) for path in inputs), {}, None)]
+
+    if operation == "img2pdf":
+        per_image = []
+        for path in inputs:
+            _, size, nbytes, bands = _image_header(path)
+            # RGBA and palette images are converted to RGB first
+            per_image.append(nbytes + (size[0] * size[1] * 3 if bands != 3 else 0))
+        return [
+            (sum(per_image), {}, None),
+            (max(per_image), {"streaming": True}, "one image at a time"),
+        ]
+
+    fmt, size, nbytes, bands = _image_header(inputs[0])
+    if operation == "resize":
+        width, height = params.get("width"), params.get("height")
+        if not width or not height:
+            width = width or max(1, round(size[0] * height / size[1]))
+            height = height or max(1, round(size[1] * width / size[0]))
+        output_bytes = width * height * bands
+        paths = [(nbytes + output_bytes, {}, None)]
+        scale = _draft_scale(size, (width, height))
+        if fmt == "JPEG" and scale > 1:
+            paths.append((nbytes // scale ** 2 + output_bytes, {"reduced_decode": True},
+                          f"JPEG decoded at 1/{scale} scale"))
+        return paths
+
+    if operation == "crop":
+        if params.get("template"):
+            box = resolve_crop_template(params["template"], size, relative=params.get("relative", True))
+        else:
+            box = params["box"]
+        output_bytes = max(0, box[2] - box[0]) * max(0, box[3] - box[1]) * bands
+        paths = [(nbytes + output_bytes, {}, None)]
+        if (fmt == "JPEG" and output_path.lower().endswith((".jpg", ".jpeg"))
+                and not params.get("lossless") and is_lossless_crop_available()):
+            paths.append((0, {"lossless": True}, "lossless JPEG crop with jpegtran"))
+        return paths
+
+    if operation == "compress":
+        # The decoded image plus a converted or resized working copy
+        paths = [(nbytes * 2, {}, None)]
+        # SSIM mode may not change the dimensions, so it has no cheaper path
+        if fmt == "JPEG" and params.get("min_ssim") is None:
+            for scale in DRAFT_SCALES:
+                paths.append((nbytes * 2 // scale ** 2, {"draft_scale": scale},
+                              f"JPEG decoded at 1/{scale} scale"))
+        return paths
+
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+class MemoryGovernor:
+    """Admits jobs while the memory they are estimated to need fits the budget."""
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self._reserved = 0
+        self._condition = threading.Condition()
+
+    def _choose(self, paths):
+        """Return the most faithful path that fits the budget, or None."""
+        for path in paths:
+            if path[0] <= self.budget:
+                return path
+        return None
+
+    @contextmanager
+    def admit(self, operation, inputs, output_path, params, result, timeout=QUEUE_TIMEOUT):
+        """Reserve memory for a job for the duration of the block.
+
+        Yields the job's parameters, with the overrides of a degraded path
+        applied. Records the decision in ``result["memory"]`` and raises
+        ValueError if the job is refused.
+        """
+        if self.budget is None:
+            yield params
+            return
+        try:
+            paths = estimate_job(operation, inputs, output_path, params, self.budget)
+        except Exception:
+            # Unreadable headers; let the operation report the real problem
+            yield params
+            return
+
+        report = {"estimate_mb": round(paths[0][0] / MB, 1), "budget_mb": round(self.budget / MB, 1)}
+        result["memory"] = report
+        chosen = self._choose(paths)
+        if chosen is None:
+            report["decision"] = "refused"
+            raise ValueError(
+                f"{operation} needs about {report['estimate_mb']} MB, "
+                f"more than the memory budget of {report['budget_mb']} MB.")
+        nbytes, overrides, description = chosen
+        report["decision"] = "ok"
+        if description is not None:
+            report.update(decision="degraded", path=description, degraded_mb=round(nbytes / MB, 1))
+
+        start = time.monotonic()
+        with self._condition:
+            if self._reserved + nbytes > self.budget:
+                if description is None:
+                    report["decision"] = "queued"
+                if not self._condition.wait_for(lambda: self._reserved + nbytes <= self.budget, timeout):
+                    report["decision"] = "refused"
+                    raise ValueError(
+                        f"Waited {timeout} s for {round(nbytes / MB, 1)} MB of the memory budget.")
+                report["waited"] = round(time.monotonic() - start, 3)
+            self._reserved += nbytes
+            # Cached decodes are memory too; keep them within what is left
+            get_image_cache().trim(self.budget - self._reserved)
+        try:
+            yield dict(params, **overrides)
+        finally:
+            with self._condition:
+                self._reserved -= nbytes
+                self._condition.notify_all()
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return this process's MemoryGovernor, creating it once."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = MemoryGovernor(default_budget())
+        return _governor
+
+
+def configure_worker(workers):
+    """Give this process, one of ``workers`` pool workers, its share of the budget."""
+    global _governor
+    with _governor_lock:
+        _governor = MemoryGovernor(default_budget(workers))
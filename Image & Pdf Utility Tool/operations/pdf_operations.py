@@ -4,9 +4,16 @@ PDF operations for the Image & PDF Utility Tool.
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image
 import PyPDF2
 
+from operations.pdf_processing import (
+    merge_pdf_files,
+    validate_page_ranges,
+    split_pdf_file,
+    images_to_pdf_file,
+    lock_pdf_file,
+    unlock_pdf_file,
+)
 from utils.helpers import center_dialog, get_pdf_filetypes
 from utils.ui_components import create_primary_button, create_secondary_button, BG_COLOR, FONT_FAMILY
 
@@ -30,14 +37,7 @@ def merge_pdfs(app):
         return
 
     try:
-        writer = PyPDF2.PdfWriter()  # writer will contain the merged pdf data
-        for path in filepaths:   
-            reader = PyPDF2.PdfReader(path)  # reader contain the pdf file data
-            for page in reader.pages:
-                writer.add_page(page)
-
-        with open(output_path, "wb") as fileobj:
-            writer.write(fileobj)  # create a new merged pdf file
+        merge_pdf_files(filepaths, output_path)
 
         # Show message in GUI
         messagebox.showinfo("Success", f"Merged {len(filepaths)} PDFs into:\n{output_path}")
@@ -319,22 +319,17 @@ def split_pdf(app):
                 try:
                     start = int(range_item["start_entry"].get())
                     end = int(range_item["end_entry"].get())
-                    
-                    if start < 1 or end < 1:
-                        messagebox.showerror("Error", f"Range {i + 1}: Page numbers must be positive.")
-                        return
-                    if start > total_pages or end > total_pages:
-                        messagebox.showerror("Error", f"Range {i + 1}: Page numbers cannot exceed {total_pages}.")
-                        return
-                    if start > end:
-                        messagebox.showerror("Error", f"Range {i + 1}: Start page cannot be greater than end page.")
-                        return
-                    
                     validated_ranges.append((start, end))
                 except ValueError:
                     messagebox.showerror("Error", f"Range {i + 1}: Please enter valid page numbers.")
                     return
             
+            try:
+                validate_page_ranges(validated_ranges, total_pages)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            
             # Get output path
             output_path = filedialog.asksaveasfilename(
                 title="Save split PDF as",
@@ -347,15 +342,8 @@ def split_pdf(app):
                 return
             
             try:
-                writer = PyPDF2.PdfWriter()
-                
                 # Add pages from each range in order
-                for start, end in validated_ranges:
-                    for page_num in range(start - 1, end):  # Convert to 0-indexed
-                        writer.add_page(reader.pages[page_num])
-                
-                with open(output_path, "wb") as output_file:
-                    writer.write(output_file)
+                split_pdf_file(filepath, validated_ranges, output_path)
                 
                 # Build summary of ranges
                 range_summary = ", ".join([f"{s}-{e}" for s, e in validated_ranges])
@@ -420,21 +408,7 @@ def images_to_pdf(app):
         return
 
     try:
-        images = []  # images data stored as list elements
-        for path in filepaths:
-            img = Image.open(path)  # path: directory of the file
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            images.append(img)
-        
-        # first - first element of the list images
-        # Rest - All elements of the list images except first
-        first, *rest = images
-        first.save(output_path, save_all=True, append_images=rest)
-
-        # Close images to free resources
-        for img in images:
-            img.close()
+        images_to_pdf_file(filepaths, output_path)
 
         messagebox.showinfo(
             "Success",
@@ -548,20 +522,7 @@ def lock_pdf(app):
             return
 
         try:
-            reader = PyPDF2.PdfReader(filepath)
-            writer = PyPDF2.PdfWriter()
-
-            for page in reader.pages:
-                writer.add_page(page)
-
-            # Copy metadata if present
-            if reader.metadata:
-                writer.add_metadata(reader.metadata)
-
-            writer.encrypt(password, use_128bit=True)
-
-            with open(output_path, "wb") as f:
-                writer.write(f)
+            lock_pdf_file(filepath, output_path, password)
 
             lock_dialog.destroy()
             messagebox.showinfo(
@@ -670,47 +631,17 @@ def unlock_pdf(app):
             messagebox.showerror("Error", "Password cannot be empty.", parent=unlock_dialog)
             return
 
-        try:
-            reader = PyPDF2.PdfReader(filepath)
-
-            # Check if the PDF is actually encrypted
-            if not reader.is_encrypted:
-                messagebox.showinfo(
-                    "Info",
-                    "This PDF is not password-protected.\nNo unlocking needed.",
-                    parent=unlock_dialog,
-                )
-                return
-
-            # Attempt decryption
-            result = reader.decrypt(password)
-            if result == 0:
-                messagebox.showerror(
-                    "Error",
-                    "Incorrect password. Please try again.",
-                    parent=unlock_dialog,
-                )
-                return
-
-            output_path = filedialog.asksaveasfilename(
-                title="Save unlocked PDF as",
-                defaultextension=".pdf",
-                filetypes=get_pdf_filetypes(),
-                initialfile=f"unlocked_{filename}",
-            )
-            if not output_path:
-                return
-
-            writer = PyPDF2.PdfWriter()
-            for page in reader.pages:
-                writer.add_page(page)
-
-            # Copy metadata if present
-            if reader.metadata:
-                writer.add_metadata(reader.metadata)
+        output_path = filedialog.asksaveasfilename(
+            title="Save unlocked PDF as",
+            defaultextension=".pdf",
+            filetypes=get_pdf_filetypes(),
+            initialfile=f"unlocked_{filename}",
+        )
+        if not output_path:
+            return
 
-            with open(output_path, "wb") as f:
-                writer.write(f)
+        try:
+            unlock_pdf_file(filepath, output_path, password)
 
             unlock_dialog.destroy()
             messagebox.showinfo(
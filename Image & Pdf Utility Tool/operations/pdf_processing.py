@@ -0,0 +1,145 @@
+"""
+PDF processing helpers for the Image & PDF Utility Tool.
+
+These functions work on files only and never touch tkinter, so they can be
+shared by the dialogs, benchmarks and worker threads.
+"""
+from PIL import Image
+import PyPDF2
+
+from utils.tracing import span, traced
+
+
+def get_page_count(filepath):
+    """Return the number of pages in a PDF file."""
+    return len(read_pdf(filepath).pages)
+
+
+def read_pdf(filepath):
+    """Open a PDF for reading."""
+    with span("parse", input=filepath):
+        return PyPDF2.PdfReader(filepath)
+
+
+def write_pdf(pages, output_path, metadata=None, password=None):
+    """Write ``pages`` to a new PDF, optionally encrypted with ``password``.
+
+    Returns the number of pages written.
+    """
+    writer = PyPDF2.PdfWriter()
+    count = 0
+    for page in pages:
+        writer.add_page(page)
+        count += 1
+
+    # Copy metadata if present
+    if metadata:
+        writer.add_metadata(metadata)
+
+    if password:
+        writer.encrypt(password, use_128bit=True)
+
+    with span("write", output=output_path, pages=count, encrypted=bool(password)):
+        with open(output_path, "wb") as f:
+            writer.write(f)
+    return count
+
+
+@traced("merge_pdfs")
+def merge_pdf_files(filepaths, output_path):
+    """Merge PDF files, in order, into one. Returns the page count."""
+    return write_pdf(
+        (page for path in filepaths for page in read_pdf(path).pages),
+        output_path,
+    )
+
+
+def validate_page_ranges(ranges, total_pages):
+    """Check 1-based inclusive (start, end) page ranges.
+
+    Raises ValueError describing the first invalid range.
+    """
+    if not ranges:
+        raise ValueError("Please add at least one page range.")
+    for i, (start, end) in enumerate(ranges):
+        if start < 1 or end < 1:
+            raise ValueError(f"Range {i + 1}: Page numbers must be positive.")
+        if start > total_pages or end > total_pages:
+            raise ValueError(f"Range {i + 1}: Page numbers cannot exceed {total_pages}.")
+        if start > end:
+            raise ValueError(f"Range {i + 1}: Start page cannot be greater than end page.")
+
+
+@traced("split_pdf")
+def split_pdf_file(filepath, ranges, output_path):
+    """Write the pages of 1-based inclusive ``ranges``, in order, to a new PDF.
+
+    Returns the number of pages written.
+    """
+    reader = read_pdf(filepath)
+    validate_page_ranges(ranges, len(reader.pages))
+    return write_pdf(
+        (reader.pages[page_num] for start, end in ranges for page_num in range(start - 1, end)),
+        output_path,
+    )
+
+
+@traced("images_to_pdf")
+def images_to_pdf_file(filepaths, output_path, streaming=False):
+    """Convert image files to a PDF with one page per image.
+
+    With ``streaming`` set, each image is decoded, appended to the PDF and
+    closed before the next one is opened, so only one image is held in
+    memory at a time. Returns the number of pages written.
+    """
+    if streaming:
+        for index, path in enumerate(filepaths):
+            with span("decode", input=path), Image.open(path) as img:
+                page = img.convert("RGB") if img.mode in ("RGBA", "P") else img
+                with span("write", output=output_path, page=index + 1):
+                    page.save(output_path, "PDF", append=index > 0)
+                if page is not img:
+                    page.close()
+        return len(filepaths)
+
+    images = []  # images data stored as list elements
+    try:
+        for path in filepaths:
+            with span("decode", input=path):
+                img = Image.open(path)
+                images.append(img)
+                if img.mode in ("RGBA", "P"):
+                    images[-1] = img.convert("RGB")
+                    img.close()
+                else:
+                    img.load()
+
+        first, *rest = images
+        with span("write", output=output_path, pages=len(images)):
+            first.save(output_path, save_all=True, append_images=rest)
+    finally:
+        # Close images to free resources
+        for img in images:
+            img.close()
+    return len(images)
+
+
+@traced("lock_pdf")
+def lock_pdf_file(filepath, output_path, password):
+    """Encrypt a PDF with ``password``. Returns the page count."""
+    reader = read_pdf(filepath)
+    return write_pdf(reader.pages, output_path, metadata=reader.metadata, password=password)
+
+
+@traced("unlock_pdf")
+def unlock_pdf_file(filepath, output_path, password):
+    """Decrypt a password-protected PDF. Returns the page count.
+
+    Raises ValueError if the PDF is not encrypted or the password is wrong.
+    """
+    reader = read_pdf(filepath)
+    if not reader.is_encrypted:
+        raise ValueError("This PDF is not password-protected.")
+    if reader.decrypt(password) == 0:
+        raise ValueError("Incorrect password.")
+    return write_pdf(reader.pages, output_path, metadata=reader.metadata)
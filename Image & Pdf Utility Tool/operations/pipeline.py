@@ -0,0 +1,392 @@
+"""
+In-memory pipelines of image and PDF operations.
+
+A pipeline is a list of steps, each an operation name from the command line
+(resize, crop, compress, img2pdf, merge, split, lock, unlock) with its
+parameters, e.g. in JSON:
+
+    {"steps": [{"operation": "resize", "width": 1600},
+               {"operation": "compress", "target_kb": 300},
+               {"operation": "img2pdf"}]}
+
+Each input is decoded (or parsed) once, passed from step to step as a
+Pillow image, encoded bytes or a list of PDF pages, and written once at
+the end. No intermediate files are written. Every step runs on its own
+thread and the steps are connected by bounded queues, so one file can be
+resized while the previous one is being compressed, and at most
+``queue_size`` items wait between two steps. Pillow releases the GIL while
+resizing and encoding, so the steps really overlap.
+
+Steps that combine their inputs (img2pdf, merge) wait for every item and
+produce a single output. After ``compress`` an image only exists as
+encoded bytes; only img2pdf may follow it, and it has to decode them.
+"""
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+from PIL import Image
+import PyPDF2
+
+from operations.compression import compress_to_quality, compress_to_target_size, OUTPUT_FORMATS
+from operations.image_processing import resolve_crop_template
+from operations.jobs import default_output_path, resolve_params
+from operations.pdf_processing import read_pdf, validate_page_ranges, write_pdf
+from utils.tracing import in_context, span, traced
+
+try:
+    import yaml
+except ImportError:  # YAML definitions are optional
+    yaml = None
+
+
+DEFAULT_QUEUE_SIZE = 2
+PDF_EXTENSIONS = (".pdf",)
+_DONE = object()  # End of stream marker passed through the queues
+
+
+def load_pipeline(path):
+    """Read a pipeline definition from a JSON or YAML file.
+
+    The file holds either a list of steps or a dict with ``steps`` (and
+    optionally ``output_dir``, ``output`` and ``queue_size``). Raises
+    ValueError if it is not a valid pipeline.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError("Reading YAML pipelines needs PyYAML (pip install pyyaml).")
+            definition = yaml.safe_load(f)
+        else:
+            definition = json.load(f)
+    if isinstance(definition, list):
+        definition = {"steps": definition}
+    if not isinstance(definition, dict) or not definition.get("steps"):
+        raise ValueError("A pipeline needs a list of steps.")
+    return definition
+
+
+def _image_item(item, image):
+    """Replace the item's image, closing the one it had."""
+    if item["image"] is not image:
+        item["image"].close()
+    item["image"] = image
+
+
+def _resize(item, params):
+    img = item["image"]
+    width, height = params.get("width"), params.get("height")
+    if not width and not height:
+        raise ValueError("Please give a width, a height or both.")
+    width = width or max(1, round(img.width * height / img.height))
+    height = height or max(1, round(img.height * width / img.width))
+    _image_item(item, img.resize((width, height), Image.Resampling.LANCZOS))
+    return {"width": width, "height": height}
+
+
+def _crop(item, params):
+    img = item["image"]
+    if params.get("template"):
+        box = resolve_crop_template(params["template"], img.size, relative=params.get("relative", True))
+    else:
+        box = tuple(params["box"])
+    _image_item(item, img.crop(box))
+    return {"box": list(box)}
+
+
+def _compress(item, params):
+    fmt = params.get("format", "JPEG")
+    buffer = io.BytesIO()
+    if params.get("min_ssim") is not None:
+        result = compress_to_quality(
+            item["image"], params["min_ssim"], buffer, fmt=fmt, max_workers=params.get("max_workers"))
+    else:
+        result = compress_to_target_size(
+            item["image"],
+            params["target_kb"],
+            buffer,
+            fmt=fmt,
+            lossless=params.get("lossless", False),
+            dither=params.get("dither", False),
+            max_workers=params.get("max_workers"),
+        )
+    item["image"].close()
+    item.update(kind="encoded", image=None, data=buffer.getvalue(), extension=OUTPUT_FORMATS[fmt]["extension"])
+    return result
+
+
+def _pdf_pages(item):
+    """Return the item's pages; a freshly parsed PDF stands for all of its pages."""
+    if item["pages"] is None:
+        item["pages"] = list(item["reader"].pages)
+    return item["pages"]
+
+
+def _split(item, params):
+    pages = _pdf_pages(item)
+    ranges = [tuple(page_range) for page_range in params["ranges"]]
+    validate_page_ranges(ranges, len(pages))
+    item["pages"] = [pages[page_num] for start, end in ranges for page_num in range(start - 1, end)]
+    return {"pages": len(item["pages"])}
+
+
+def _lock(item, params):
+    item["password"] = params["password"]
+    return {"pages": len(_pdf_pages(item))}
+
+
+def _unlock(item, params):
+    reader = item["reader"]
+    if reader is None or not reader.is_encrypted:
+        raise ValueError("This PDF is not password-protected.")
+    if reader.decrypt(params["password"]) == 0:
+        raise ValueError("Incorrect password.")
+    item.update(pages=None, password=None)
+    return {"pages": len(_pdf_pages(item))}
+
+
+def _images_to_pdf(items, params):
+    images = []
+    try:
+        for item in items:
+            if item["kind"] == "encoded":
+                img = Image.open(io.BytesIO(item["data"]))
+            else:
+                img = item["image"]
+            images.append(img.convert("RGB") if img.mode in ("RGBA", "P") else img)
+        buffer = io.BytesIO()
+        first, *rest = images
+        first.save(buffer, "PDF", save_all=True, append_images=rest)
+    finally:
+        for img in images:
+            img.close()
+        for item in items:
+            if item["image"] is not None:
+                item["image"].close()
+    reader = PyPDF2.PdfReader(buffer)
+    return {"kind": "pdf", "reader": reader, "pages": None, "metadata": None, "password": None}, {
+        "pages": len(reader.pages)}
+
+
+def _merge(items, params):
+    pages = [page for item in items for page in _pdf_pages(item)]
+    return {"kind": "pdf", "reader": None, "pages": pages, "metadata": None, "password": None}, {
+        "pages": len(pages)}
+
+
+# Operation -> (function, kinds it accepts, kind it produces, combines items)
+PIPELINE_STEPS = {
+    "resize": (_resize, ("image",), "image", False),
+    "crop": (_crop, ("image",), "image", False),
+    "compress": (_compress, ("image",), "encoded", False),
+    "img2pdf": (_images_to_pdf, ("image", "encoded"), "pdf", True),
+    "merge": (_merge, ("pdf",), "pdf", True),
+    "split": (_split, ("pdf",), "pdf", False),
+    "lock": (_lock, ("pdf",), "pdf", False),
+    "unlock": (_unlock, ("pdf",), "pdf", False),
+}
+
+
+# At least one parameter of each group is required
+STEP_REQUIRED_PARAMS = {
+    "resize": [("width", "height")],
+    "crop": [("box", "template")],
+    "compress": [("target_kb", "min_ssim")],
+    "split": [("ranges",)],
+    "lock": [("password", "password_env")],
+    "unlock": [("password", "password_env")],
+}
+
+
+def _input_kind(filepath):
+    return "pdf" if filepath.lower().endswith(PDF_EXTENSIONS) else "image"
+
+
+def validate_pipeline(steps, inputs):
+    """Check that every step has its parameters and accepts what the step before it produces.
+
+    Raises ValueError describing the first problem found.
+    """
+    kinds = {_input_kind(path) for path in inputs}
+    if len(kinds) > 1:
+        raise ValueError("A pipeline's inputs must all be images or all be PDFs.")
+    kind = kinds.pop() if kinds else "image"
+    for index, step in enumerate(steps):
+        operation = step.get("operation")
+        if operation not in PIPELINE_STEPS:
+            raise ValueError(f"Step {index + 1}: unknown operation {operation}")
+        for group in STEP_REQUIRED_PARAMS.get(operation, []):
+            if not any(step.get(name) is not None for name in group):
+                raise ValueError(f"Step {index + 1}: {operation} needs {' or '.join(group)}.")
+        if operation == "compress" and step.get("format", "JPEG") not in OUTPUT_FORMATS:
+            raise ValueError(f"Step {index + 1}: unknown output format {step['format']}")
+        _, accepts, produces, _ = PIPELINE_STEPS[operation]
+        if kind not in accepts:
+            if kind == "encoded":
+                raise ValueError(f"Step {index + 1}: {operation} cannot follow compress.")
+            raise ValueError(f"Step {index + 1}: {operation} does not work on {kind} files.")
+        kind = produces
+
+
+def _open_item(filepath):
+    """Decode an image or parse a PDF into a pipeline item."""
+    item = {
+        "name": filepath,
+        "inputs": [filepath],
+        "kind": _input_kind(filepath),
+        "image": None,
+        "data": None,
+        "extension": os.path.splitext(filepath)[1],
+        "reader": None,
+        "pages": None,
+        "metadata": None,
+        "password": None,
+        "steps": [],
+        "error": None,
+    }
+    try:
+        if item["kind"] == "pdf":
+            item["reader"] = read_pdf(filepath)
+            if not item["reader"].is_encrypted:
+                item["metadata"] = item["reader"].metadata
+        else:
+            with span("decode", input=filepath):
+                img = Image.open(filepath)
+                img.load()
+            item["image"] = img
+    except Exception as e:
+        item["error"] = f"{os.path.basename(filepath)}: {e}"
+    return item
+
+
+def _source(inputs, sink):
+    for filepath in inputs:
+        sink.put(_open_item(filepath))
+    sink.put(_DONE)
+
+
+def _run_step(operation, params, source, sink):
+    """Apply one step to every item from ``source`` and pass them on to ``sink``."""
+    function, _, _, combines = PIPELINE_STEPS[operation]
+    collected = []
+    try:
+        while (item := source.get()) is not _DONE:
+            if item["error"] is None and combines:
+                collected.append(item)
+                continue
+            if item["error"] is None:
+                start = time.perf_counter()
+                try:
+                    with span(operation, input=item["name"]):
+                        info = function(item, params)
+                    item["steps"].append(dict(info, operation=operation,
+                                              seconds=round(time.perf_counter() - start, 3)))
+                except Exception as e:
+                    item["error"] = f"{operation}: {e}"
+            sink.put(item)
+
+        if collected:
+            start = time.perf_counter()
+            combined = {
+                "name": collected[0]["name"],
+                "inputs": [path for item in collected for path in item["inputs"]],
+                "image": None,
+                "data": None,
+                "extension": ".pdf",
+                "steps": [step for item in collected for step in item["steps"]],
+                "error": None,
+            }
+            try:
+                with span(operation, inputs=len(collected)):
+                    fields, info = function(collected, params)
+                combined.update(fields)
+                combined["steps"].append(dict(info, operation=operation,
+                                              seconds=round(time.perf_counter() - start, 3)))
+            except Exception as e:
+                combined.update(kind="pdf", reader=None, pages=None, metadata=None, password=None,
+                                error=f"{operation}: {e}")
+            sink.put(combined)
+    finally:
+        sink.put(_DONE)
+
+
+def _write_item(item, output_path):
+    """Write a finished item to ``output_path``, the only write it gets."""
+    if item["kind"] == "pdf":
+        write_pdf(_pdf_pages(item), output_path, metadata=item["metadata"], password=item["password"])
+    elif item["kind"] == "encoded":
+        with span("write", output=output_path):
+            with open(output_path, "wb") as f:
+                f.write(item["data"])
+    else:
+        img = item["image"]
+        if output_path.lower().endswith((".jpg", ".jpeg")) and img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        with span("write", output=output_path):
+            img.save(output_path)
+        if img is not item["image"]:
+            img.close()
+
+
+def _close_item(item):
+    if item.get("image") is not None:
+        item["image"].close()
+        item["image"] = None
+
+
+@traced("pipeline")
+def run_pipeline(steps, inputs, output_dir=None, output=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """Run ``steps`` over ``inputs`` in memory and write each result once.
+
+    Outputs go to ``output_dir`` (default: next to each input) under the
+    name the last step would give them, or to ``output`` when the pipeline
+    produces a single file. Returns one result dict per output, with its
+    ``inputs``, ``output``, ``status``, ``error``, total ``seconds`` and
+    the result of every step. Raises ValueError for an invalid pipeline.
+    """
+    if not inputs:
+        raise ValueError("Please select at least one file.")
+    validate_pipeline(steps, inputs)
+    step_params = [resolve_params({key: value for key, value in step.items() if key != "operation"})
+                   for step in steps]
+    last = steps[-1]
+    single_output = PIPELINE_STEPS[last["operation"]][3] or len(inputs) == 1
+    if output and not single_output:
+        raise ValueError("This pipeline writes one file per input; give an output folder instead.")
+
+    start = time.perf_counter()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(steps) + 1)]
+    threads = [threading.Thread(target=in_context(_source), args=(inputs, queues[0]), daemon=True)]
+    threads += [
+        threading.Thread(target=in_context(_run_step), args=(step["operation"], params, queues[i], queues[i + 1]),
+                         daemon=True)
+        for i, (step, params) in enumerate(zip(steps, step_params))
+    ]
+    for thread in threads:
+        thread.start()
+
+    results = []
+    while (item := queues[-1].get()) is not _DONE:
+        result = {"operation": "pipeline", "inputs": item["inputs"], "output": None, "status": "done",
+                  "steps": item["steps"]}
+        try:
+            if item["error"] is not None:
+                raise ValueError(item["error"])
+            result["output"] = output or default_output_path(
+                last["operation"], item["name"], output_dir, step_params[-1])
+            _write_item(item, result["output"])
+        except Exception as e:
+            result.update(status="failed", output=None, error=str(e))
+        finally:
+            _close_item(item)
+        results.append(result)
+    for thread in threads:
+        thread.join()
+
+    elapsed = round(time.perf_counter() - start, 3)
+    for result in results:
+        result["seconds"] = elapsed
+    return results
@@ -0,0 +1,75 @@
+"""
+Perceptual quality metrics for the Image & PDF Utility Tool.
+
+SSIM is computed with NumPy on a downsampled luminance copy of the images,
+so scoring one compressed candidate takes milliseconds. NumPy is optional;
+``is_ssim_available`` reports whether it is installed.
+"""
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # SSIM mode is disabled without NumPy
+    np = None
+
+
+SSIM_SIZE = 512  # Longest side of the luminance downsample, in pixels
+SSIM_WINDOW = 7  # Side of the square window the local statistics use
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def is_ssim_available():
+    """Return True if NumPy is installed for SSIM scoring."""
+    return np is not None
+
+
+def luminance_array(img, size):
+    """Return the luminance of ``img`` resized to ``size`` as a float array."""
+    with img.convert("L") as gray:
+        with gray.resize(size, Image.Resampling.BOX) as small:
+            return np.asarray(small, dtype=np.float32)
+
+
+def window_mean(values, window=SSIM_WINDOW):
+    """Return the mean of every ``window`` x ``window`` block of ``values``.
+
+    Uses an integral image, so the cost does not depend on the window size.
+    Only windows that lie fully inside the array are returned.
+    """
+    integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=integral[1:, 1:])
+    sums = (integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window])
+    return (sums / (window * window)).astype(np.float32)
+
+
+class SSIMReference:
+    """Scores candidates against a reference image with mean SSIM.
+
+    The reference luminance and its local means and variances are
+    computed once, so each ``score`` only has to process the candidate.
+    """
+
+    def __init__(self, img, size=SSIM_SIZE, window=SSIM_WINDOW):
+        if np is None:
+            raise RuntimeError("SSIM scoring needs NumPy.")
+        scale = min(1.0, size / max(img.size))
+        self.window = window
+        self.size = (max(window, round(img.width * scale)), max(window, round(img.height * scale)))
+        self._x = luminance_array(img, self.size)
+        self._mu_x = window_mean(self._x, window)
+        self._mu_x_sq = self._mu_x * self._mu_x
+        self._var_x = window_mean(self._x * self._x, window) - self._mu_x_sq
+
+    def score(self, img):
+        """Return the mean SSIM of ``img`` against the reference (1.0 is identical)."""
+        y = luminance_array(img, self.size)
+        mu_y = window_mean(y, self.window)
+        mu_y_sq = mu_y * mu_y
+        mu_xy = self._mu_x * mu_y
+        var_y = window_mean(y * y, self.window) - mu_y_sq
+        covariance = window_mean(self._x * y, self.window) - mu_xy
+        ssim_map = ((2 * mu_xy + SSIM_C1) * (2 * covariance + SSIM_C2)) / (
+            (self._mu_x_sq + mu_y_sq + SSIM_C1) * (self._var_x + var_y + SSIM_C2))
+        return float(ssim_map.mean())
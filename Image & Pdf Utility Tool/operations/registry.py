@@ -0,0 +1,44 @@
+"""
+Registry of the operations shown in the main window.
+
+Each entry names the module and function that implement an operation
+instead of importing them, so the window can be shown before PyPDF2,
+Pillow, NumPy and the dialog modules are loaded. Modules are imported on
+first use, or ahead of time by ``prewarm_operations``.
+"""
+import importlib
+
+
+# Main window buttons, in grid order (three per row)
+OPERATIONS = [
+    {"label": "Merge PDFs", "module": "operations.pdf_operations", "function": "merge_pdfs"},
+    {"label": "Split PDF", "module": "operations.pdf_operations", "function": "split_pdf"},
+    {"label": "Resize Image", "module": "operations.image_operations", "function": "resize_image"},
+    {"label": "JPG to PDF", "module": "operations.pdf_operations", "function": "images_to_pdf"},
+    {"label": "Crop Image", "module": "operations.image_operations", "function": "crop_image"},
+    {"label": "Compress Image", "module": "operations.image_operations", "function": "compress_image"},
+    {"label": "Lock PDF", "module": "operations.pdf_operations", "function": "lock_pdf"},
+    {"label": "Unlock PDF", "module": "operations.pdf_operations", "function": "unlock_pdf"},
+    {"label": "Batch Crop", "module": "operations.image_operations", "function": "batch_crop_images"},
+    {"label": "Batch Compress", "module": "operations.image_operations", "function": "batch_compress_images"},
+]
+
+
+def load_operation(operation):
+    """Import an operation's module if needed and return its function."""
+    module = importlib.import_module(operation["module"])
+    return getattr(module, operation["function"])
+
+
+def prewarm_operations(operations=OPERATIONS):
+    """Import every operation module, ignoring ones that fail to import.
+
+    Meant to run on a background thread once the window is up, so the
+    first click does not wait for the import. A module that fails here
+    reports its error when its button is clicked.
+    """
+    for module_name in dict.fromkeys(operation["module"] for operation in operations):
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            pass
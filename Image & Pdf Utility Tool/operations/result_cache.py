@@ -0,0 +1,193 @@
+"""
+Content-addressed cache of operation results.
+
+A result is stored under the SHA-256 of the operation, its parameters,
+the output extension and the bytes of every input, so the same job on the
+same files is answered by copying the stored output instead of running it
+again, whatever the files are called. Outputs live in a cache folder next
+to an SQLite index holding their size, last use and result dict. When the
+folder grows past ``max_bytes`` the least recently used outputs are
+evicted. Hit, miss and eviction counts are kept in the index, so they add
+up across processes and runs.
+
+Lock and unlock are never cached: their keys would depend on the password
+and unlocked outputs would be kept on disk unencrypted.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+
+CACHE_ENV = "IMAGE_PDF_TOOL_CACHE"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+UNCACHED_OPERATIONS = ("lock", "unlock")
+# Parameters that change how a job runs but not what it asks for
+UNKEYED_PARAMS = ("max_workers",)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Result fields that describe the call rather than the output
+CALL_FIELDS = ("operation", "inputs", "output", "status", "seconds", "error", "cached", "memory")
+
+
+def is_cacheable(operation):
+    """Return True if results of ``operation`` may be cached."""
+    return operation not in UNCACHED_OPERATIONS
+
+
+def cache_key(operation, inputs, output_path, params):
+    """Return the cache key of a job: a hash of what determines its output."""
+    digest = hashlib.sha256()
+    header = {
+        "operation": operation,
+        "params": {name: value for name, value in (params or {}).items() if name not in UNKEYED_PARAMS},
+        "extension": os.path.splitext(output_path)[1].lower(),
+        "inputs": len(inputs),
+    }
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode("utf-8"))
+    for path in inputs:
+        # Length-prefix every input, so two files never hash like their concatenation
+        digest.update(os.path.getsize(path).to_bytes(8, "little"))
+        with open(path, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Size-capped, least recently used store of operation outputs."""
+
+    def __init__(self, folder, max_bytes=None):
+        """Open (or create) the cache in ``folder``.
+
+        ``max_bytes`` is saved in the index, so worker processes that open
+        the cache without it use the same cap.
+        """
+        self.folder = folder
+        os.makedirs(os.path.join(folder, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(folder, "index.sqlite"), timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if max_bytes is not None:
+            self._db.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('max_bytes', ?)", (max_bytes,))
+        row = self._db.execute("SELECT value FROM settings WHERE name = 'max_bytes'").fetchone()
+        self.max_bytes = row[0] if row else DEFAULT_MAX_BYTES
+
+    def close(self):
+        self._db.close()
+
+    def _object_path(self, key):
+        return os.path.join(self.folder, "objects", key[:2], key)
+
+    def _count(self, name, amount=1):
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount))
+
+    def get(self, key, output_path):
+        """Copy the output stored under ``key`` to ``output_path``.
+
+        Returns the stored result dict, or None on a miss.
+        """
+        row = self._db.execute("SELECT result FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            try:
+                shutil.copyfile(self._object_path(key), output_path)
+            except FileNotFoundError:
+                # Evicted by another process since the lookup
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+        if row is None:
+            self._count("misses")
+            return None
+        self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, key, output_path, result):
+        """Store the output at ``output_path`` and its result under ``key``."""
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return
+        object_path = self._object_path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # Copy under a temporary name and rename, so readers never see half a file
+        temp_path = f"{object_path}.{os.getpid()}.tmp"
+        shutil.copyfile(output_path, temp_path)
+        os.replace(temp_path, object_path)
+        stored = {name: value for name, value in result.items() if name not in CALL_FIELDS}
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, size, last_used, result) VALUES (?, ?, ?, ?)",
+            (key, size, time.time(), json.dumps(stored)))
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used outputs until the cache fits ``max_bytes``."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            try:
+                os.remove(self._object_path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def stats(self):
+        """Return hit/miss/eviction counts and the cache's current size."""
+        counters = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        """Delete every stored output and reset the counters."""
+        self._db.execute("DELETE FROM entries")
+        self._db.execute("DELETE FROM counters")
+        shutil.rmtree(os.path.join(self.folder, "objects"), ignore_errors=True)
+        os.makedirs(os.path.join(self.folder, "objects"), exist_ok=True)
+
+
+_caches = {}
+
+
+def open_cache(folder):
+    """Return this process's ResultCache for ``folder``, opening it once."""
+    if folder not in _caches:
+        _caches[folder] = ResultCache(folder)
+    return _caches[folder]
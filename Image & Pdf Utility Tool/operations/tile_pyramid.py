@@ -0,0 +1,226 @@
+"""
+Multi-resolution tile pyramid for the Image & PDF Utility Tool.
+
+Level 0 is the full resolution image and every following level halves its
+width and height. Levels are decoded on a background thread, with a draft
+decode where the format allows it (JPEGs are decoded straight at 1/2, 1/4
+or 1/8 scale, so a reduced level never materializes the full image). Full
+decodes go through the shared image cache, so a file that was just resized
+or is about to be cropped is only decoded once.
+Tiles cut from the decoded level are kept in an LRU cache. The decoded
+level and the cached tiles together are held under a memory cap, so
+zooming into a very large image only keeps what is needed on screen.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from operations.image_cache import cached_image, estimate_image_bytes, open_decoded
+from utils.tracing import span
+
+
+TILE_SIZE = 256
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024  # 256 MB
+
+
+class TilePyramid:
+    """Lazily generated image pyramid backed by a size-capped LRU cache."""
+
+    def __init__(self, filepath, tile_size=TILE_SIZE, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.filepath = filepath
+        self.tile_size = tile_size
+        self.memory_limit = memory_limit
+        with Image.open(filepath) as img:
+            self.size = img.size
+        self.max_level = max(0, math.ceil(math.log2(max(self.size) / tile_size)))
+        self._cache = OrderedDict()  # (level, tx, ty) -> (tile, nbytes)
+        self._cache_bytes = 0
+        self._level = None  # (level, image, nbytes, owned) of the decoded level
+        self._loading = None  # Level being decoded by the worker thread
+        self._lock = threading.Lock()
+
+    def level_for_zoom(self, zoom):
+        """Return the coarsest level that still has at least ``zoom`` detail."""
+        if zoom >= 1.0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1.0 / zoom) + 1e-9)))
+
+    def level_size(self, level):
+        """Return the (width, height) of a pyramid level."""
+        factor = 2 ** level
+        return math.ceil(self.size[0] / factor), math.ceil(self.size[1] / factor)
+
+    def tiles_in_box(self, level, box):
+        """Yield (tx, ty) for every tile of ``level`` intersecting ``box``.
+
+        ``box`` is (x1, y1, x2, y2) in full resolution image coordinates.
+        """
+        span = self.tile_size * 2 ** level
+        level_width, level_height = self.level_size(level)
+        cols = math.ceil(level_width / self.tile_size)
+        rows = math.ceil(level_height / self.tile_size)
+        x1, y1, x2, y2 = box
+        first_col = max(0, int(x1 // span))
+        first_row = max(0, int(y1 // span))
+        last_col = min(cols - 1, int(math.ceil(x2 / span)) - 1)
+        last_row = min(rows - 1, int(math.ceil(y2 / span)) - 1)
+        for ty in range(first_row, last_row + 1):
+            for tx in range(first_col, last_col + 1):
+                yield tx, ty
+
+    def is_level_ready(self, level):
+        """Return True if tiles of ``level`` can be returned without decoding."""
+        with self._lock:
+            return self._level is not None and self._level[0] == level
+
+    def request_level(self, level):
+        """Start decoding ``level`` on a worker thread unless it is ready or loading.
+
+        Poll ``is_level_ready`` (e.g. with ``after``) to know when it is done.
+        """
+        with self._lock:
+            if self._loading == level or (self._level is not None and self._level[0] == level):
+                return
+            self._loading = level
+        threading.Thread(target=self._load_level, args=(level,), daemon=True).start()
+
+    def get_tile(self, level, tx, ty):
+        """Return the tile at column ``tx``, row ``ty`` of ``level``, or None.
+
+        None means the level is not decoded yet; it is then requested.
+        """
+        key = (level, tx, ty)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry[0]
+            if self._level is None or self._level[0] != level:
+                level_img = None
+            else:
+                level_img = self._level[1]
+        if level_img is None:
+            self.request_level(level)
+            return None
+        left, top = tx * self.tile_size, ty * self.tile_size
+        tile = level_img.crop((
+            left,
+            top,
+            min(left + self.tile_size, level_img.width),
+            min(top + self.tile_size, level_img.height),
+        ))
+        self._cache_put(key, tile)
+        return tile
+
+    def clear(self):
+        """Drop the decoded level and every cached tile."""
+        with self._lock:
+            for tile, _ in self._cache.values():
+                tile.close()
+            self._cache.clear()
+            self._cache_bytes = 0
+            self._release_level()
+            self._loading = None
+
+    def _decode_level(self, level):
+        """Decode a whole pyramid level and return (image, owned).
+
+        Level 0 is the shared full decode from the image cache, which must
+        not be closed (``owned`` is False). Reduced levels are resized from
+        that decode when it is cached, or else from a JPEG draft decode;
+        formats without drafts are fully decoded (and cached) first.
+        """
+        size = self.level_size(level)
+        with span("decode", input=self.filepath, level=level, size=size):
+            if level == 0:
+                with open_decoded(self.filepath) as img:
+                    return img, False
+            source = cached_image(self.filepath)
+            if source is not None:
+                return self._reduce(source, size), True
+            with Image.open(self.filepath) as img:
+                if img.format == "JPEG":
+                    img.draft(None, size)
+                    img.load()
+                    return self._reduce(img, size), True
+            with open_decoded(self.filepath) as img:
+                return self._reduce(img, size), True
+
+    @staticmethod
+    def _reduce(img, size):
+        """Return a new copy of ``img`` scaled down to ``size``."""
+        if img.size == size:
+            return img.copy()
+        # Reduce by a whole factor first (a fast box filter), then finish
+        factor = min(img.width // size[0], img.height // size[1])
+        if factor > 1:
+            reduced = img.reduce(factor)
+            if reduced.size == size:
+                return reduced
+            with reduced:
+                return reduced.resize(size, Image.Resampling.BILINEAR)
+        return img.resize(size, Image.Resampling.BILINEAR)
+
+    def _load_level(self, level):
+        """Decode ``level`` (on a worker thread) and make it the held level.
+
+        Only one level is kept, since tiles are nearly always requested in
+        batches for a single zoom level.
+        """
+        try:
+            level_img, owned = self._decode_level(level)
+        except Exception:
+            with self._lock:
+                if self._loading == level:
+                    self._loading = None
+            return
+        nbytes = estimate_image_bytes(level_img)
+        with self._lock:
+            if self._loading != level:
+                # Cleared or superseded while decoding
+                if owned:
+                    level_img.close()
+                return
+            self._loading = None
+            self._release_level()
+            self._level = (level, level_img, nbytes, owned)
+            self._evict()
+
+    def _release_level(self):
+        """Drop the held level, closing it unless the image cache shares it."""
+        if self._level is not None and self._level[3]:
+            self._level[1].close()
+        self._level = None
+
+    def _cache_put(self, key, img):
+        nbytes = estimate_image_bytes(img)
+        with self._lock:
+            self._cache[key] = (img, nbytes)
+            self._cache_bytes += nbytes
+            self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        """Evict least recently used tiles until tiles and level fit the cap.
+
+        Called with the lock held. ``keep`` (the tile just added) is never
+        evicted, and neither is the held level, which tiles are cut from.
+        """
+        level_bytes = self._level[2] if self._level is not None else 0
+        while self._cache and self._cache_bytes + level_bytes > self.memory_limit:
+            key = next(iter(self._cache))
+            if key == keep:
+                if len(self._cache) == 1:
+                    break
+                self._cache.move_to_end(key)
+                continue
+            evicted, evicted_bytes = self._cache.pop(key)
+            self._cache_bytes -= evicted_bytes
+            evicted.close()
+
+    @property
+    def memory_bytes(self):
+        """Memory held by the decoded level and the cached tiles."""
+        with self._lock:
+            return self._cache_bytes + (self._level[2] if self._level is not None else 0)
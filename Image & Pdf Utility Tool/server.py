@@ -0,0 +1,400 @@
+"""
+Local HTTP service for the Image & PDF Utility Tool.
+
+Runs the command-line operations for other programs on this machine:
+
+    python main.py serve [--port 8765] [--workers N] [--queue-depth M]
+
+    POST /<operation>?<params>   e.g. /compress?target_kb=200&format=WEBP
+                                      /split?ranges=1-3,7
+                                      /resize?width=800
+    GET  /status                 workers, jobs in flight and counters
+
+The request body is the input file. Operations that combine files (merge,
+img2pdf) also accept an ``application/x-tar`` body whose members are the
+inputs, in order. Bodies may be sent with Content-Length or chunked, and
+are streamed to a temporary folder rather than held in memory. Passwords
+for lock/unlock go in the ``X-Password`` header so they stay out of logs.
+
+The optional ``X-Filename`` header names a single-file upload; the output
+is named after it. Without an extension there, the type of the upload is
+taken from its ``Content-Type``, or else from its contents (a PDF or any
+image Pillow can open). Uploads whose type cannot be told are refused
+with 400.
+
+Jobs run on a process pool of ``--workers`` processes. At most
+``--queue-depth`` further jobs may wait for a worker; beyond that requests
+are refused with 429 and a Retry-After header before their body is read.
+The output file is streamed back as the response body, with the job result
+(minus local paths) as JSON in the ``X-Result`` header. With ``--cache``,
+repeated jobs are answered from the result cache. Failed jobs return
+422 with the result as a JSON body. The server only binds to loopback
+addresses.
+"""
+import ipaddress
+import json
+import mimetypes
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from PIL import Image
+
+from operations.jobs import JOB_OPERATIONS, default_output_path, init_worker, run_job, takes_many_inputs
+from utils.arguments import (
+    DEFAULT_HOST,
+    DEFAULT_MAX_UPLOAD_MB,
+    DEFAULT_PORT,
+    DEFAULT_QUEUE_DEPTH,
+    parse_box,
+    parse_page_ranges,
+)
+
+
+CHUNK_SIZE = 64 * 1024
+RETRY_AFTER_SECONDS = 1
+
+
+def _flag(value):
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+# Query string parameters accepted per operation, with their parsers
+PARAM_PARSERS = {
+    "split": {"ranges": parse_page_ranges},
+    "resize": {"width": int, "height": int},
+    "crop": {"box": parse_box, "lossless": _flag},
+    "compress": {"target_kb": int, "min_ssim": float, "format": str.upper, "lossless": _flag, "dither": _flag},
+}
+
+# At least one parameter of each group is required
+REQUIRED_PARAMS = {
+    "split": [("ranges",)],
+    "resize": [("width", "height")],
+    "crop": [("box",)],
+    "compress": [("target_kb", "min_ssim")],
+}
+
+
+class RequestError(Exception):
+    """A request that cannot be run, with the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_params(operation, query, headers):
+    """Return job parameters from the query string and headers.
+
+    Raises RequestError for unknown, malformed or missing parameters.
+    """
+    parsers = PARAM_PARSERS.get(operation, {})
+    params = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name not in parsers:
+            raise RequestError(400, f"Unknown parameter for {operation}: {name}")
+        try:
+            params[name] = parsers[name](value)
+        except Exception:
+            raise RequestError(400, f"Invalid value for {name}: {value}") from None
+    if operation in ("lock", "unlock"):
+        if not headers.get("X-Password"):
+            raise RequestError(400, "Please send the password in the X-Password header.")
+        params["password"] = headers["X-Password"]
+    for group in REQUIRED_PARAMS.get(operation, []):
+        if not any(params.get(name) is not None for name in group):
+            raise RequestError(400, f"{operation} needs {' or '.join(group)}.")
+    if operation == "compress":
+        # The pool already runs one job per process
+        params["max_workers"] = 1
+    return params
+
+
+class JobLimiter:
+    """Counts jobs in flight and refuses new ones past the pool's capacity."""
+
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"accepted": 0, "rejected": 0, "done": 0, "failed": 0}
+
+    def acquire(self):
+        """Reserve a slot; returns False when the queue is full."""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.stats["rejected"] += 1
+                return False
+            self.in_flight += 1
+            self.stats["accepted"] += 1
+            return True
+
+    def release(self, status=None):
+        with self._lock:
+            self.in_flight -= 1
+            if status in self.stats:
+                self.stats[status] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.workers),
+                **self.stats,
+            }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Handles one request; the server holds the pool and the limiter."""
+
+    server_version = "ImagePdfTool"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip("/") != "/status":
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_json(200, self.server.limiter.snapshot())
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        operation = url.path.strip("/")
+        try:
+            if operation not in JOB_OPERATIONS:
+                raise RequestError(404, f"Unknown operation: {operation}")
+            params = parse_params(operation, url.query, self.headers)
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)}, close=True)
+            return
+
+        # Refuse before reading the body, so a full queue costs clients nothing
+        if not self.server.limiter.acquire():
+            self._send_json(429, {"error": "Too many jobs queued, try again later."},
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}, close=True)
+            return
+
+        status = None
+        work_dir = tempfile.mkdtemp(prefix="image_pdf_tool_")
+        try:
+            inputs = self._receive_inputs(operation, work_dir)
+            output_path = default_output_path(operation, inputs[0], work_dir, params)
+            future = self.server.executor.submit(
+                run_job, operation, inputs, output_path, params, self.server.cache_dir)
+            result = future.result()
+            status = result["status"]
+            public_result = {key: value for key, value in result.items() if key not in ("inputs", "output")}
+            if status != "done":
+                self._send_json(422, public_result)
+            else:
+                self._send_file(output_path, public_result)
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)}, close=True)
+        except (ConnectionError, TimeoutError):
+            self.close_connection = True
+        finally:
+            self.server.limiter.release(status)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _iter_body(self):
+        """Yield the request body in chunks, with or without chunked encoding."""
+        limit = self.server.max_upload_bytes
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                received += size
+                if received > limit:
+                    raise RequestError(413, "Upload too large.")
+                remaining = size
+                while remaining:
+                    data = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        raise ConnectionError("Client closed the connection mid-upload.")
+                    remaining -= len(data)
+                    yield data
+                self.rfile.readline()
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0:
+                raise RequestError(411, "Please send a request body with Content-Length or chunked encoding.")
+            if length > limit:
+                raise RequestError(413, "Upload too large.")
+            remaining = length
+            while remaining:
+                data = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise ConnectionError("Client closed the connection mid-upload.")
+                remaining -= len(data)
+                yield data
+
+    def _receive_inputs(self, operation, work_dir):
+        """Stream the body into ``work_dir`` and return the input paths."""
+        name = os.path.basename(self.headers.get("X-Filename") or "") or "input"
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/x-tar":
+            path = os.path.join(work_dir, name)
+            with open(path, "wb") as f:
+                for data in self._iter_body():
+                    f.write(data)
+            if not os.path.splitext(name)[1]:
+                # The operations tell file types apart by their extension
+                extension = detect_extension(path, content_type)
+                if extension is None:
+                    raise RequestError(400, "Could not tell the type of the upload; please name it "
+                                            "in the X-Filename header, e.g. X-Filename: photo.jpg.")
+                os.replace(path, path + extension)
+                path += extension
+            return [path]
+
+        if not takes_many_inputs(operation):
+            raise RequestError(400, f"{operation} takes a single file, not a tar archive.")
+        body = _ChunkReader(self._iter_body())
+        inputs = []
+        try:
+            # Stream mode reads the archive once, front to back
+            with tarfile.open(fileobj=body, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    # One folder per member keeps names that repeat across folders apart
+                    folder = os.path.join(work_dir, f"{len(inputs):04d}")
+                    os.makedirs(folder)
+                    path = os.path.join(folder, os.path.basename(member.name))
+                    with archive.extractfile(member) as source, open(path, "wb") as f:
+                        shutil.copyfileobj(source, f, CHUNK_SIZE)
+                    inputs.append(path)
+            # Drain any padding after the archive so the connection stays usable
+            for _ in body.chunks:
+                pass
+        except tarfile.TarError as e:
+            raise RequestError(400, f"Invalid tar archive: {e}") from None
+        if not inputs:
+            raise RequestError(400, "The tar archive holds no files.")
+        return inputs
+
+    def _send_file(self, path, result):
+        filename = os.path.basename(path)
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.send_header("X-Result", json.dumps(result))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def _send_json(self, status, payload, headers=None, close=False):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if close:
+            # The body may not have been read, so the connection cannot be reused
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class _ChunkReader:
+    """Minimal read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            data = next(self.chunks, None)
+            if data is None:
+                break
+            self._buffer += data
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def detect_extension(path, content_type=None):
+    """Return the extension for the file at ``path``, or None if it is unknown.
+
+    ``content_type`` is trusted when it names a specific type; otherwise
+    the file is recognized as a PDF by its signature or opened with Pillow.
+    """
+    if content_type and content_type != "application/octet-stream":
+        extension = mimetypes.guess_extension(content_type)
+        if extension is not None:
+            return extension
+    with open(path, "rb") as f:
+        if f.read(5) == b"%PDF-":
+            return ".pdf"
+    try:
+        with Image.open(path) as img:
+            return mimetypes.guess_extension(img.get_format_mimetype() or "")
+    except Exception:
+        return None
+
+
+def is_loopback(host):
+    """Return True if ``host`` only resolves to loopback addresses."""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_depth=DEFAULT_QUEUE_DEPTH,
+          max_upload_mb=DEFAULT_MAX_UPLOAD_MB, quiet=False, cache_dir=None):
+    """Run the service until interrupted."""
+    if not is_loopback(host):
+        raise ValueError(f"{host} is not a loopback address; the service only runs on localhost.")
+    workers = workers or os.cpu_count() or 1
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.limiter = JobLimiter(workers, queue_depth)
+    server.max_upload_bytes = max_upload_mb * 1024 * 1024
+    server.quiet = quiet
+    server.cache_dir = cache_dir
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Stop cleanly on SIGTERM too, so the workers are shut down
+    signal.signal(signal.SIGTERM, stop)
+    # Spawned workers do not inherit the listening socket, which would keep
+    # the port bound if the service were killed
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(workers,)) as executor:
+        server.executor = executor
+        print(f"Serving on http://{host}:{server.server_address[1]} "
+              f"({workers} workers, queue depth {queue_depth})", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
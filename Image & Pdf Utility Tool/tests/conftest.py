@@ -0,0 +1,20 @@
+"""Shared fixtures for the tests; run with ``python -m pytest tests`` from this folder."""
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+# The modules import each other as top-level packages (operations, utils)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    """Return a function writing a small gradient image and returning its path."""
+    def make(name="image.jpg", size=(64, 48), color=(200, 80, 40)):
+        path = str(tmp_path / name)
+        img = Image.linear_gradient("L").resize(size)
+        Image.merge("RGB", [img.point(lambda v, c=c: v * c // 255) for c in color]).save(path)
+        return path
+    return make
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import operations.async_jobs as async_jobs
+from operations.async_jobs import AsyncJobs
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(4) as executor:
+        yield executor
+
+
+@pytest.fixture
+def blocking_jobs(monkeypatch):
+    """Replace run_job with one that writes its output once released."""
+    state = {"started": [], "release": threading.Event()}
+
+    def run_job(operation, inputs, output_path, params=None, cache_dir=None):
+        state["started"].append(output_path)
+        state["release"].wait(10)
+        with open(output_path, "wb") as f:
+            f.write(b"output")
+        return {"operation": operation, "inputs": inputs, "output": output_path, "status": "done"}
+
+    monkeypatch.setattr(async_jobs, "run_job", run_job)
+    return state
+
+
+def test_resize_writes_the_output_and_no_partial_file(executor, make_image, tmp_path):
+    output_path = str(tmp_path / "small.jpg")
+    result = asyncio.run(AsyncJobs(executor=executor).resize(make_image(), output_path, width=16))
+    assert result["status"] == "done"
+    assert result["output"] == output_path
+    assert sorted(os.listdir(tmp_path)) == ["image.jpg", "small.jpg"]
+
+
+def test_failed_job_leaves_nothing_behind(executor, tmp_path):
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not an image")
+    result = asyncio.run(AsyncJobs(executor=executor).resize(str(bad), str(tmp_path / "out.jpg"), width=16))
+    assert result["status"] == "failed"
+    assert os.listdir(tmp_path) == ["bad.jpg"]
+
+
+def test_cancelled_running_job_keeps_its_slot_and_leaves_no_output(executor, blocking_jobs, tmp_path):
+    async def scenario():
+        jobs = AsyncJobs(max_concurrency=1, executor=executor)
+        first = asyncio.create_task(jobs.resize("a.jpg", str(tmp_path / "a.jpg"), width=16))
+        while not blocking_jobs["started"]:
+            await asyncio.sleep(0.01)
+        first.cancel()
+        second = asyncio.create_task(jobs.resize("b.jpg", str(tmp_path / "b.jpg"), width=16))
+        await asyncio.sleep(0.2)
+        # The cancelled job still runs in its worker, so the second must wait
+        assert len(blocking_jobs["started"]) == 1
+        blocking_jobs["release"].set()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result
+
+    result = asyncio.run(scenario())
+    assert result["status"] == "done"
+    assert os.listdir(tmp_path) == ["b.jpg"]
+
+
+def test_output_that_cannot_be_written_is_reported(executor, blocking_jobs, tmp_path):
+    blocking_jobs["release"].set()
+    # A folder in the way makes the final rename fail
+    output_path = tmp_path / "out.jpg"
+    output_path.mkdir()
+    result = asyncio.run(AsyncJobs(executor=executor).resize("a.jpg", str(output_path), width=16))
+    assert result["status"] == "failed"
+    assert "Could not write" in result["error"]
+    assert os.listdir(tmp_path) == ["out.jpg"]
+
+
+def test_compress_needs_exactly_one_target(executor):
+    with pytest.raises(ValueError):
+        asyncio.run(AsyncJobs(executor=executor).compress("a.jpg", "b.jpg"))
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from cli import expand_inputs, main
+
+
+def results(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_expand_inputs_sorts_globs_reads_lists_and_drops_duplicates(make_image, tmp_path):
+    b, a = make_image("b.jpg"), make_image("a.jpg")
+    listing = tmp_path / "files.txt"
+    listing.write_text(f"{b}\n\n{a}\n")
+    assert expand_inputs([str(tmp_path / "*.jpg"), f"@{listing}"]) == [a, b]
+
+
+def test_glob_without_matches_is_an_error(tmp_path):
+    with pytest.raises(ValueError, match="No files match"):
+        expand_inputs([str(tmp_path / "*.pdf")])
+
+
+def test_resize_prints_one_result_per_job(make_image, tmp_path, capsys):
+    inputs = [make_image("a.jpg"), make_image("b.jpg")]
+    output_dir = tmp_path / "out"
+    assert main(["resize", *inputs, "--width", "20", "--output-dir", str(output_dir), "--jobs", "2"]) == 0
+    printed = results(capsys)
+    assert sorted(os.path.basename(result["output"]) for result in printed) == ["resized_a.jpg", "resized_b.jpg"]
+    for result in printed:
+        with Image.open(result["output"]) as img:
+            assert img.width == 20
+
+
+def test_inputs_sharing_an_output_name_get_distinct_outputs(make_image, tmp_path, capsys):
+    inputs = [make_image("photo.jpg"), make_image("photo.png")]
+    output_dir = tmp_path / "out"
+    assert main(["compress", *inputs, "--target-kb", "50", "--output-dir", str(output_dir)]) == 0
+    outputs = sorted(os.path.basename(result["output"]) for result in results(capsys))
+    assert outputs == ["compressed_photo_jpg.jpg", "compressed_photo_png.jpg"]
+    assert sorted(os.listdir(output_dir)) == outputs
+
+
+def test_failed_job_sets_the_exit_status(tmp_path, capsys):
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not an image")
+    assert main(["resize", str(bad), "--width", "20", "--output-dir", str(tmp_path)]) == 1
+    assert results(capsys)[0]["status"] == "failed"
+
+
+def test_resize_without_a_size_is_a_usage_error(make_image):
+    with pytest.raises(SystemExit) as error:
+        main(["resize", make_image()])
+    assert error.value.code == 2
@@ -0,0 +1,118 @@
+import io
+
+import pytest
+from PIL import Image
+
+from benchmarks.corpus import make_photo_like_image
+from operations.compression import (
+    OUTPUT_FORMATS,
+    PNG_PALETTE_SIZES,
+    TARGET_TOLERANCE,
+    compress_to_target_size,
+    get_available_formats,
+)
+
+
+@pytest.fixture(scope="module")
+def photo():
+    return make_photo_like_image(1600, 1200, 0)
+
+
+@pytest.mark.parametrize("target_kb", [60, 200])
+def test_parallel_search_needs_no_more_full_encodes(photo, target_kb):
+    sequential = compress_to_target_size(photo, target_kb, io.BytesIO(), max_workers=1)
+    parallel = compress_to_target_size(photo, target_kb, io.BytesIO(), max_workers=4)
+    assert parallel["encodes"] <= max(2, sequential["encodes"])
+    assert parallel["size"] <= target_kb * 1024
+
+
+def _image_in_mode(mode):
+    gradient = Image.linear_gradient("L").resize((200, 150))
+    if mode in ("I;16", "I"):
+        # 16-bit samples spanning the whole range
+        return gradient.convert("I").point(lambda value: value * 257).convert(mode)
+    if mode == "F":
+        return gradient.convert("F")
+    if mode == "LA":
+        return Image.merge("LA", [gradient, gradient])
+    if mode == "PA":
+        return Image.merge("LA", [gradient, gradient]).convert("PA")
+    return gradient.convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["LA", "PA", "I;16", "I", "F", "RGBA", "P", "1", "CMYK"])
+def test_jpeg_output_accepts_every_input_mode(mode):
+    output = io.BytesIO()
+    result = compress_to_target_size(_image_in_mode(mode), 20, output)
+    assert result["size"] <= 20 * 1024
+    with Image.open(output) as img:
+        assert img.mode in ("RGB", "L", "CMYK")
+        if mode in ("I;16", "I"):
+            # Scaled down to 8 bits, not clipped to white: mid-gray stays mid-gray
+            assert 100 < img.convert("L").getpixel((100, 75)) < 160
+
+
+@pytest.mark.parametrize("mode", ["LA", "I;16", "F"])
+def test_webp_output_accepts_high_bit_depth_and_gray_alpha(mode):
+    if "WEBP" not in get_available_formats():
+        pytest.skip("Pillow was built without WebP")
+    output = io.BytesIO()
+    compress_to_target_size(_image_in_mode(mode), 20, output, fmt="WEBP")
+    with Image.open(output) as img:
+        assert img.mode in ("RGB", "RGBA")
+        if mode == "I;16":
+            assert 100 < img.convert("L").getpixel((100, 75)) < 160
+
+
+@pytest.mark.parametrize("target_kb", [60, 200])
+def test_target_is_met_within_tolerance_in_one_or_two_full_encodes(photo, target_kb):
+    output = io.BytesIO()
+    result = compress_to_target_size(photo, target_kb, output, max_workers=1)
+    assert TARGET_TOLERANCE * target_kb * 1024 <= result["size"] <= target_kb * 1024
+    assert result["size"] == len(output.getvalue())
+    assert result["encodes"] <= 2
+
+
+def test_image_is_shrunk_once_quality_alone_cannot_fit(photo):
+    result = compress_to_target_size(photo, 60, io.BytesIO(), max_workers=1)
+    assert result["size"] <= 60 * 1024
+    assert result["quality"] == OUTPUT_FORMATS["JPEG"]["min_quality"]
+    assert result["width"] < photo.width
+    assert result["width"] / result["height"] == pytest.approx(photo.width / photo.height, rel=0.02)
+
+
+def test_png_falls_back_to_a_palette_keeping_alpha():
+    rgba = make_photo_like_image(400, 300, 1).convert("RGBA")
+    rgba.putalpha(Image.linear_gradient("L").resize(rgba.size))
+    lossless = io.BytesIO()
+    rgba.save(lossless, "PNG")
+    target_kb = lossless.tell() // 1024 // 2
+    output = io.BytesIO()
+    result = compress_to_target_size(rgba, target_kb, output, fmt="PNG")
+    assert result["size"] <= target_kb * 1024
+    assert result["colors"] in PNG_PALETTE_SIZES
+    with Image.open(output) as img:
+        assert img.mode in ("P", "PA", "RGBA")
+        assert img.convert("RGBA").getextrema()[3][0] < 20
+
+
+def test_png_keeps_grayscale_in_mode_l():
+    gray = make_photo_like_image(300, 200, 2).convert("L")
+    output = io.BytesIO()
+    compress_to_target_size(gray, 1000, output, fmt="PNG")
+    with Image.open(output) as img:
+        assert img.mode == "L"
+
+
+def test_png_input_is_never_made_bigger(tmp_path):
+    path = str(tmp_path / "input.png")
+    make_photo_like_image(300, 200, 3).quantize(16).save(path, optimize=True)
+    with open(path, "rb") as f:
+        original = f.read()
+    output_path = str(tmp_path / "output.png")
+    with Image.open(path) as img:
+        result = compress_to_target_size(img, 1000, output_path, fmt="PNG")
+    with open(output_path, "rb") as f:
+        written = f.read()
+    assert len(written) <= len(original)
+    assert result["size"] == len(written)
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from PIL import Image
+
+import operations.image_cache as image_cache
+from operations.image_cache import DecodedImageCache, cached_image, open_decoded
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Give the test its own process-wide cache with a 1 MB cap."""
+    cache = DecodedImageCache(1024 * 1024)
+    monkeypatch.setattr(image_cache, "_shared_cache", cache)
+    return cache
+
+
+def test_second_open_is_served_from_the_cache(cache, make_image):
+    path = make_image()
+    with open_decoded(path) as first:
+        pass
+    with open_decoded(path) as second:
+        assert second is first
+        assert second.format == "JPEG"
+    assert cache.stats()["hits"] == 1
+    assert cached_image(path) is first
+
+
+def test_changed_file_is_decoded_again(cache, make_image):
+    path = make_image()
+    with open_decoded(path) as first:
+        pass
+    make_image(color=(10, 200, 90))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    with open_decoded(path) as second:
+        assert second is not first
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_images_are_evicted(cache, make_image):
+    # Each 400x300 RGB decode takes 360 KB, so two fit the cap
+    paths = [make_image(f"{name}.jpg", size=(400, 300)) for name in "abc"]
+    for path in paths[:2]:
+        with open_decoded(path):
+            pass
+    with open_decoded(paths[0]):
+        pass
+    with open_decoded(paths[2]):
+        pass
+    assert cached_image(paths[1]) is None
+    assert cached_image(paths[0]) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_image_larger_than_the_cap_is_not_kept(cache, make_image):
+    path = make_image(size=(1000, 1000))
+    with open_decoded(path) as img:
+        assert img.size == (1000, 1000)
+    assert cache.stats()["entries"] == 0
+
+
+def test_cached_image_never_decodes(cache, make_image):
+    assert cached_image(make_image()) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_trim_evicts_down_to_the_given_size(cache, make_image):
+    for name in "ab":
+        with open_decoded(make_image(f"{name}.jpg", size=(400, 300))):
+            pass
+    cache.trim(400 * 300 * 3)
+    assert cache.stats()["entries"] == 1
+
+
+def test_pool_workers_turn_the_cache_off_unless_it_is_sized(monkeypatch, make_image):
+    monkeypatch.setattr(image_cache, "_shared_cache", None)
+    monkeypatch.delenv(image_cache.IMAGE_CACHE_ENV, raising=False)
+    image_cache.configure_worker()
+    path = make_image()
+    with open_decoded(path):
+        pass
+    assert cached_image(path) is None
+    monkeypatch.setenv(image_cache.IMAGE_CACHE_ENV, "8")
+    image_cache.configure_worker()
+    assert image_cache.get_image_cache().max_bytes == 8 * 1024 * 1024
+
+
+def test_open_decoded_matches_a_plain_decode(cache, make_image):
+    path = make_image()
+    with open_decoded(path) as cached, Image.open(path) as plain:
+        assert cached.tobytes() == plain.tobytes()
@@ -0,0 +1,71 @@
+import os
+import signal
+import subprocess
+import sys
+
+from operations.job_queue import JobQueue
+
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Claims one task in another process and dies without finishing it
+CLAIM_AND_DIE = """
+import os, signal, sys
+sys.path.insert(0, sys.argv[2])
+from operations.job_queue import JobQueue
+assert JobQueue(sys.argv[1]).claim() is not None
+os.kill(os.getpid(), signal.SIGKILL)
+"""
+
+
+def claim_in_killed_runner(db_path):
+    process = subprocess.run([sys.executable, "-c", CLAIM_AND_DIE, db_path, TOOL_DIR])
+    assert process.returncode == -signal.SIGKILL
+
+
+def add_task(queue, max_attempts):
+    return queue.add_batch([("resize", ["in.jpg"], "out.jpg", {"width": 10})], max_attempts=max_attempts)
+
+
+def test_task_of_killed_runner_is_claimed_again_with_attempt_counted(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    queue = JobQueue(db_path)
+    add_task(queue, max_attempts=3)
+
+    claim_in_killed_runner(db_path)
+    task = queue.claim()
+    assert task is not None
+    assert task["attempts"] == 2
+    assert queue.finish(task["id"], {"status": "done"}) == "done"
+    assert queue.progress()["done"] == 1
+
+
+def test_task_fails_once_its_runner_dies_on_the_last_attempt(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    queue = JobQueue(db_path)
+    add_task(queue, max_attempts=2)
+
+    claim_in_killed_runner(db_path)
+    claim_in_killed_runner(db_path)
+    assert queue.claim() is None
+    assert queue.progress() == {"pending": 0, "running": 0, "done": 0, "failed": 1}
+
+
+def test_failed_task_is_retried_until_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    add_task(queue, max_attempts=2)
+
+    first = queue.claim()
+    assert queue.finish(first["id"], {"status": "failed", "error": "boom"}) == "pending"
+    second = queue.claim()
+    assert second["attempts"] == 2
+    assert queue.finish(second["id"], {"status": "failed", "error": "boom"}) == "failed"
+    assert queue.claim() is None
+
+
+def test_release_does_not_count_the_attempt(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    add_task(queue, max_attempts=1)
+
+    task = queue.claim()
+    queue.release([task["id"]])
+    assert queue.claim()["attempts"] == 1
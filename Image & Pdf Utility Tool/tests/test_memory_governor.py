@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from operations.memory_governor import MB, MemoryGovernor
+
+
+def admit(governor, params, result, path, operation="resize", timeout=5):
+    return governor.admit(operation, [path], "out.jpg", params, result, timeout=timeout)
+
+
+def test_job_within_budget_runs_as_asked(make_image):
+    path = make_image(size=(100, 100))
+    result = {}
+    with admit(MemoryGovernor(10 * MB), {"width": 50, "height": 50}, result, path) as params:
+        assert params == {"width": 50, "height": 50}
+    assert result["memory"]["decision"] == "ok"
+
+
+def test_job_over_budget_with_a_cheaper_path_is_degraded(make_image):
+    # 1000x1000 RGB needs ~3 MB decoded; a 1/8 draft needs ~47 KB
+    path = make_image(size=(1000, 1000))
+    result = {}
+    with admit(MemoryGovernor(MB // 2), {"width": 100, "height": 100}, result, path) as params:
+        assert params["reduced_decode"] is True
+    assert result["memory"]["decision"] == "degraded"
+
+
+def test_job_over_budget_without_a_cheaper_path_is_refused(make_image):
+    path = make_image("image.png", size=(1000, 1000))
+    result = {}
+    with pytest.raises(ValueError, match="memory budget"):
+        with admit(MemoryGovernor(MB // 2), {"width": 100, "height": 100}, result, path):
+            pass
+    assert result["memory"]["decision"] == "refused"
+
+
+def test_job_waits_for_running_jobs_to_release_memory(make_image):
+    # Each job needs ~1.2 MB: one fits the budget, two do not
+    path = make_image("image.png", size=(500, 500))
+    governor = MemoryGovernor(2 * MB)
+    first, second = {}, {}
+    entered = threading.Event()
+
+    def run_first():
+        with admit(governor, {"width": 400, "height": 400}, first, path):
+            entered.set()
+            time.sleep(0.3)
+
+    thread = threading.Thread(target=run_first)
+    thread.start()
+    assert entered.wait(5)
+    with admit(governor, {"width": 400, "height": 400}, second, path):
+        pass
+    thread.join()
+    assert second["memory"]["decision"] == "queued"
+    assert second["memory"]["waited"] >= 0.2
+
+
+def test_queued_job_is_refused_after_the_timeout(make_image):
+    path = make_image("image.png", size=(500, 500))
+    governor = MemoryGovernor(2 * MB)
+    result = {}
+    with admit(governor, {"width": 400, "height": 400}, {}, path):
+        with pytest.raises(ValueError, match="Waited"):
+            with admit(governor, {"width": 400, "height": 400}, result, path, timeout=0.05):
+                pass
+    assert result["memory"]["decision"] == "refused"
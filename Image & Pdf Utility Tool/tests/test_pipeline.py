@@ -0,0 +1,55 @@
+import pytest
+
+from operations.pipeline import run_pipeline, validate_pipeline
+
+
+def test_resize_then_compress_is_valid():
+    validate_pipeline([{"operation": "resize", "width": 10}, {"operation": "compress", "target_kb": 5}],
+                      ["a.jpg"])
+
+
+def test_compress_then_resize_is_rejected():
+    with pytest.raises(ValueError, match="cannot follow compress"):
+        validate_pipeline([{"operation": "compress", "target_kb": 5}, {"operation": "resize", "width": 10}],
+                          ["a.jpg"])
+
+
+def test_image_step_on_pdf_is_rejected():
+    with pytest.raises(ValueError, match="does not work on pdf"):
+        validate_pipeline([{"operation": "resize", "width": 10}], ["a.pdf"])
+
+
+def test_mixed_inputs_are_rejected():
+    with pytest.raises(ValueError, match="all be images or all be PDFs"):
+        validate_pipeline([{"operation": "img2pdf"}], ["a.jpg", "b.pdf"])
+
+
+def test_pipeline_writes_only_the_last_step(make_image, tmp_path):
+    path = make_image()
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    steps = [{"operation": "resize", "width": 32}, {"operation": "compress", "target_kb": 5}]
+    results = run_pipeline(steps, [path], output_dir=str(output_dir))
+    assert [result["status"] for result in results] == ["done"]
+    assert len(list(output_dir.iterdir())) == 1
+
+
+def test_step_without_its_parameters_is_rejected():
+    with pytest.raises(ValueError, match="Step 2: compress needs target_kb or min_ssim"):
+        validate_pipeline([{"operation": "resize", "width": 10}, {"operation": "compress"}], ["a.jpg"])
+
+
+def test_unknown_output_format_is_rejected_before_any_step_runs():
+    with pytest.raises(ValueError, match="unknown output format TIFF"):
+        run_pipeline([{"operation": "compress", "target_kb": 5, "format": "TIFF"}], ["a.jpg"])
+
+
+def test_failing_file_is_reported_without_stopping_the_others(make_image, tmp_path):
+    good = make_image("good.jpg")
+    bad = str(tmp_path / "bad.jpg")
+    with open(bad, "wb") as f:
+        f.write(b"not an image")
+    results = run_pipeline([{"operation": "resize", "width": 16}], [good, bad], output_dir=str(tmp_path))
+    assert sorted(result["status"] for result in results) == ["done", "failed"]
+    failed = next(result for result in results if result["status"] == "failed")
+    assert failed["output"] is None
@@ -0,0 +1,21 @@
+import pytest
+from PIL import Image
+
+from operations.compression import compress_to_quality
+from operations.quality_metrics import SSIMReference, is_ssim_available
+
+pytestmark = pytest.mark.skipif(not is_ssim_available(), reason="NumPy is not installed")
+
+
+def test_identical_image_scores_one(make_image):
+    with Image.open(make_image(size=(200, 150))) as img:
+        assert SSIMReference(img).score(img) == pytest.approx(1.0)
+
+
+def test_min_ssim_mode_meets_the_threshold(make_image, tmp_path):
+    output_path = str(tmp_path / "out.jpg")
+    with Image.open(make_image(size=(300, 200))) as img:
+        result = compress_to_quality(img, 0.95, output_path, max_workers=1)
+        assert result["ssim"] >= 0.95
+        with Image.open(output_path) as compressed:
+            assert SSIMReference(img).score(compressed) == pytest.approx(result["ssim"], abs=1e-3)
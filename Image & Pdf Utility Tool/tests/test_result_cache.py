@@ -0,0 +1,40 @@
+import shutil
+
+from operations.jobs import run_job
+from operations.result_cache import cache_key
+
+
+def test_cache_key_ignores_max_workers(make_image):
+    path = make_image()
+    params = {"target_kb": 10, "format": "JPEG"}
+    assert (cache_key("compress", [path], "out.jpg", dict(params, max_workers=1))
+            == cache_key("compress", [path], "out.jpg", dict(params, max_workers=4)))
+
+
+def test_cache_key_changes_with_params_and_extension(make_image):
+    path = make_image()
+    key = cache_key("resize", [path], "out.jpg", {"width": 10})
+    assert cache_key("resize", [path], "out.jpg", {"width": 11}) != key
+    assert cache_key("resize", [path], "out.png", {"width": 10}) != key
+
+
+def test_cache_key_follows_input_bytes_not_names(make_image, tmp_path):
+    path = make_image("a.jpg")
+    copy = str(tmp_path / "b.jpg")
+    shutil.copyfile(path, copy)
+    other = make_image("c.jpg", color=(10, 200, 90))
+    key = cache_key("resize", [path], "out.jpg", {"width": 10})
+    assert cache_key("resize", [copy], "out.jpg", {"width": 10}) == key
+    assert cache_key("resize", [other], "out.jpg", {"width": 10}) != key
+
+
+def test_repeated_job_is_answered_from_the_cache(make_image, tmp_path):
+    path = make_image()
+    cache_dir = str(tmp_path / "cache")
+    first = run_job("resize", [path], str(tmp_path / "1.jpg"), {"width": 16}, cache_dir)
+    second = run_job("resize", [path], str(tmp_path / "2.jpg"), {"width": 16}, cache_dir)
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert (second["width"], second["height"]) == (first["width"], first["height"])
+    # The memory decision belongs to the run, not to the stored result
+    assert "memory" not in second
@@ -0,0 +1,104 @@
+import http.client
+import io
+import json
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from server import JobLimiter, RequestHandler
+
+
+@pytest.fixture
+def server():
+    """Run the request handler on a free port, with jobs on a thread pool."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    httpd.daemon_threads = True
+    httpd.limiter = JobLimiter(1, 0)
+    httpd.max_upload_bytes = 10 * 1024 * 1024
+    httpd.quiet = True
+    httpd.cache_dir = None
+    with ThreadPoolExecutor(1) as executor:
+        httpd.executor = executor
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        yield httpd
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def post(server, path, body, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+    try:
+        connection.request("POST", path, body=body, headers=headers or {},
+                           encode_chunked=not isinstance(body, bytes))
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_resize_streams_the_output_back(server, make_image):
+    status, headers, body = post(server, "/resize?width=16", read(make_image()), {"X-Filename": "photo.jpg"})
+    assert status == 200
+    assert json.loads(headers["X-Result"])["width"] == 16
+    assert headers["Content-Disposition"] == 'attachment; filename="resized_photo.jpg"'
+    with Image.open(io.BytesIO(body)) as img:
+        assert img.width == 16
+
+
+def test_chunked_upload_is_accepted(server, make_image):
+    data = read(make_image())
+    chunks = (data[i:i + 1000] for i in range(0, len(data), 1000))
+    status, _, body = post(server, "/resize?width=16", chunks, {"X-Filename": "photo.jpg"})
+    assert status == 200
+    with Image.open(io.BytesIO(body)) as img:
+        assert img.width == 16
+
+
+def test_upload_without_a_filename_is_typed_from_its_contents(server, make_image):
+    status, headers, _ = post(server, "/crop?box=0,0,10,10", read(make_image("image.png")))
+    assert status == 200
+    assert headers["Content-Disposition"] == 'attachment; filename="cropped_input.png"'
+
+
+def test_upload_of_unknown_type_is_refused(server):
+    status, _, body = post(server, "/resize?width=16", b"not an image")
+    assert status == 400
+    assert "X-Filename" in json.loads(body)["error"]
+
+
+def test_tar_upload_merges_its_members_in_order(server, make_image):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name in ("b.jpg", "a.jpg"):
+            tar.add(make_image(name), arcname=name)
+    status, headers, body = post(server, "/img2pdf", archive.getvalue(), {"Content-Type": "application/x-tar"})
+    assert status == 200
+    assert json.loads(headers["X-Result"])["pages"] == 2
+    assert body.startswith(b"%PDF-")
+
+
+def test_full_queue_is_refused_before_the_body_is_read(server, make_image):
+    assert server.limiter.acquire()
+    try:
+        status, headers, _ = post(server, "/resize?width=16", read(make_image()), {"X-Filename": "photo.jpg"})
+    finally:
+        server.limiter.release()
+    assert status == 429
+    assert headers["Retry-After"] == "1"
+    assert server.limiter.snapshot()["rejected"] == 1
+
+
+def test_failed_job_returns_422_with_the_result(server):
+    status, _, body = post(server, "/resize?width=16", b"garbage", {"X-Filename": "photo.jpg"})
+    assert status == 422
+    assert json.loads(body)["status"] == "failed"
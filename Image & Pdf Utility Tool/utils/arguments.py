@@ -0,0 +1,52 @@
+"""
+Command-line argument types and options shared by cli.py and server.py.
+
+Only the standard library is imported here, so building the command-line
+parser stays fast and does not load Pillow, PyPDF2 or the HTTP service.
+"""
+import argparse
+import os
+
+from operations.result_cache import CACHE_ENV
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_DEPTH = 8
+DEFAULT_MAX_UPLOAD_MB = 512
+
+
+def parse_page_ranges(text):
+    """Parse ``"1-3,5,7-9"`` into 1-based inclusive (start, end) ranges."""
+    ranges = []
+    for part in text.split(","):
+        start, _, end = part.strip().partition("-")
+        try:
+            ranges.append((int(start), int(end or start)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid page range: {part.strip()}") from None
+    return ranges
+
+
+def parse_box(text):
+    """Parse ``"left,top,right,bottom"`` into a crop box."""
+    try:
+        box = tuple(int(value) for value in text.split(","))
+    except ValueError:
+        box = ()
+    if len(box) != 4:
+        raise argparse.ArgumentTypeError("Crop box must be left,top,right,bottom")
+    return box
+
+
+def add_serve_arguments(parser):
+    """Add the ``serve`` command's options to ``parser``."""
+    parser.add_argument("--host", default=DEFAULT_HOST, help="loopback address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="jobs allowed to wait for a worker before answering 429")
+    parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_MB)
+    parser.add_argument("--quiet", action="store_true", help="do not log requests")
+    parser.add_argument("--cache", metavar="DIR", default=os.environ.get(CACHE_ENV),
+                        help="answer repeated jobs from this result cache folder")
@@ -0,0 +1,241 @@
+"""
+Opt-in tracing for the Image & PDF Utility Tool.
+
+Set IMAGE_PDF_TOOL_TRACE to a file path to record a span for every
+operation and for its decode, resize, encode, parse and write stages, with
+durations, bytes in/out and tracemalloc peaks. Spans are appended as JSON
+lines, or as Chrome trace events (open the file in chrome://tracing or
+Perfetto) with IMAGE_PDF_TOOL_TRACE_FORMAT=chrome. Set
+IMAGE_PDF_TOOL_TRACE_MEMORY=0 to skip tracemalloc, which slows down
+allocation-heavy code such as PDF parsing.
+
+When the variable is not set, ``traced`` returns functions unchanged and
+``span`` returns a shared no-op object, so tracing costs nothing.
+Attributes that take work to compute should only be computed when
+``is_enabled()`` is true.
+
+A span's parent is the span open in the current context. Work handed to
+other threads should be wrapped with ``in_context`` when it is submitted,
+so its spans attach to the span that submitted it.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+TRACE_ENV = "IMAGE_PDF_TOOL_TRACE"
+TRACE_FORMAT_ENV = "IMAGE_PDF_TOOL_TRACE_FORMAT"
+TRACE_MEMORY_ENV = "IMAGE_PDF_TOOL_TRACE_MEMORY"
+TRACE_FORMATS = ("jsonl", "chrome")
+
+
+class _NullSpan:
+    """Stand-in returned by ``span`` while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class _Tracer:
+    """Writes finished spans to the trace file."""
+
+    def __init__(self, path, fmt="jsonl", memory=True):
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format: {fmt}")
+        self.path = path
+        self.format = fmt
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._epoch = time.time() - time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def enter(self, span):
+        """Make ``span`` the current span and return its parent."""
+        parent = _current_span.get()
+        span._token = _current_span.set(span)
+        return parent
+
+    def exit(self, span):
+        """Make ``span``'s parent the current span again."""
+        _current_span.reset(span._token)
+
+    def write(self, record):
+        if self.format == "chrome":
+            args = {key: value for key, value in record.items()
+                    if key not in ("name", "category", "start", "duration_ms", "pid", "tid")}
+            event = {
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": round((record["start"] - self._epoch) * 1e6),
+                "dur": round(record["duration_ms"] * 1e3),
+                "pid": record["pid"],
+                "tid": record["tid"],
+                "args": args,
+            }
+            # JSON array format; Chrome accepts the array without its closing
+            # bracket, so several processes can append to one file
+            line = json.dumps(event, default=str) + ",\n"
+        else:
+            line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self.format == "chrome" and f.tell() == 0:
+                    f.write("[\n")
+                f.write(line)
+
+
+class Span:
+    """A timed section of work; use through ``span`` or ``traced``."""
+
+    def __init__(self, tracer, name, category, attrs):
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes, such as ``bytes_in`` or ``bytes_out``, to the span."""
+        self.attrs.update(attrs)
+
+    def _add_file_sizes(self):
+        # File sizes are looked up here, so callers can pass paths for free
+        for key, size_key in (("input", "bytes_in"), ("output", "bytes_out")):
+            paths = self.attrs.get(key)
+            if paths is None or size_key in self.attrs:
+                continue
+            if isinstance(paths, str):
+                paths = [paths]
+            try:
+                self.attrs[size_key] = sum(os.path.getsize(path) for path in paths)
+            except (OSError, TypeError):
+                pass
+
+    def __enter__(self):
+        self._parent = self._tracer.enter(self)
+        if self._tracer.memory:
+            # tracemalloc has one global peak; fold it into the parent before
+            # resetting it, so nested spans all see their own peak
+            current, peak = tracemalloc.get_traced_memory()
+            if self._parent is not None:
+                self._parent._peak_memory = max(self._parent._peak_memory, peak)
+            tracemalloc.reset_peak()
+            self._start_memory = current
+            self._peak_memory = current
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        self._tracer.exit(self)
+        record = {
+            "name": self.name,
+            "category": self.category,
+            "start": self._tracer._epoch + self._start,
+            "duration_ms": round(duration * 1000, 3),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "parent": self._parent.name if self._parent is not None else None,
+        }
+        if self._tracer.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(self._peak_memory, peak)
+            record["memory_peak_bytes"] = peak - self._start_memory
+            if self._parent is not None:
+                self._parent._peak_memory = max(self._parent._peak_memory, peak)
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        self._add_file_sizes()
+        record.update(self.attrs)
+        self._tracer.write(record)
+        return False
+
+
+_tracer = None
+
+
+def configure(path=None, fmt=None, memory=None):
+    """Turn tracing on (or off, with no ``path``) for this process.
+
+    Arguments default to the environment variables. Functions decorated
+    with ``traced`` before tracing was turned on stay untraced.
+    """
+    global _tracer
+    path = path or os.environ.get(TRACE_ENV)
+    if not path:
+        _tracer = None
+        return
+    fmt = fmt or os.environ.get(TRACE_FORMAT_ENV, "jsonl")
+    if memory is None:
+        memory = os.environ.get(TRACE_MEMORY_ENV, "1") != "0"
+    _tracer = _Tracer(path, fmt, memory)
+
+
+def is_enabled():
+    """Return True if spans are being recorded."""
+    return _tracer is not None
+
+
+def span(name, **attrs):
+    """Return a context manager timing a stage of an operation.
+
+    ``input`` and ``output`` attributes (a path or a list of paths) are
+    turned into ``bytes_in`` and ``bytes_out`` when the span ends. Use
+    ``set`` on the returned span to record sizes of in-memory data or any
+    other attribute.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, "stage", attrs)
+
+
+def in_context(func):
+    """Return ``func`` bound to the current span, to run on another thread.
+
+    Spans that ``func`` opens get the span open here as their parent. Each
+    call runs in its own copy of the context, so the result can be mapped
+    over a thread pool.
+    """
+    if _tracer is None:
+        return func
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def traced(name):
+    """Decorate an operation so every call is recorded as a span.
+
+    Stages run inside the operation are recorded with it as their parent.
+    """
+    def decorator(func):
+        if _tracer is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(_tracer, name, "operation", {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+configure()
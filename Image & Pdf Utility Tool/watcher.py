@@ -0,0 +1,356 @@
+"""
+Watch-folder daemon for the Image & PDF Utility Tool.
+
+Files dropped into a watched folder are run through that folder's pipeline
+of operations and written to its output folder:
+
+    python main.py watch watch.json [--once] [--poll]
+
+    {
+        "workers": 2,
+        "settle_seconds": 2,
+        "state": "watch_state.json",
+        "folders": [
+            {"path": "scans/photos", "output_dir": "scans/photos/done",
+             "pipeline": [{"operation": "resize", "width": 2000},
+                          {"operation": "compress", "target_kb": 300}]},
+            {"path": "scans/pages", "pipeline": [{"operation": "img2pdf"}]}
+        ]
+    }
+
+Folders are watched with inotify on Linux (through ctypes, no extra
+packages) and polled every ``poll_seconds`` elsewhere. Either way a file is
+only picked up once its size and modification time have not changed for
+``settle_seconds``, so files still being copied are left alone. Files run
+on a process pool, one file per worker. Every finished file is recorded in
+the state file with its size and modification time, so a restart skips
+files that were already processed unless they have changed since. Failed
+files are recorded too and retried only when they change. If a worker
+process dies, the pool is replaced and the files that were in flight are
+run again; a file that has taken down ``MAX_CRASHES`` pools is recorded as
+failed. A ``cache``
+folder reuses the results of steps already run on identical files (see
+operations/result_cache.py).
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from operations.jobs import JOB_OPERATIONS, init_worker, run_chain
+
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 1.0
+DEFAULT_STATE_FILE = "watch_state.json"
+MAX_CRASHES = 2  # Worker crashes a file may cause before it is recorded as failed
+IMAGE_PATTERNS = ["*.jpg", "*.jpeg", "*.png", "*.bmp", "*.gif", "*.webp"]
+PDF_OPERATIONS = ("merge", "split", "lock", "unlock")
+# Names used by copy tools and editors for files that are still being written
+IGNORED_PATTERNS = [".*", "*.tmp", "*.part", "*.crdownload", "*~"]
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def load_config(path):
+    """Read and check a watch configuration file.
+
+    Raises ValueError describing the first problem found.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    folders = config.get("folders") or []
+    if not folders:
+        raise ValueError("The configuration lists no folders to watch.")
+    for folder in folders:
+        if "path" not in folder:
+            raise ValueError("Every watched folder needs a path.")
+        # Relative paths are relative to the configuration file
+        folder["path"] = os.path.normpath(os.path.join(base_dir, folder["path"]))
+        if not os.path.isdir(folder["path"]):
+            raise ValueError(f"Not a folder: {folder['path']}")
+        pipeline = folder.get("pipeline") or []
+        if not pipeline:
+            raise ValueError(f"{folder['path']}: the pipeline is empty.")
+        for step in pipeline:
+            if step.get("operation") not in JOB_OPERATIONS:
+                raise ValueError(f"{folder['path']}: unknown operation {step.get('operation')}")
+        folder["output_dir"] = os.path.normpath(
+            os.path.join(base_dir, folder.get("output_dir") or os.path.join(folder["path"], "processed")))
+        if "patterns" not in folder:
+            folder["patterns"] = ["*.pdf"] if pipeline[0]["operation"] in PDF_OPERATIONS else IMAGE_PATTERNS
+    config["state"] = os.path.join(base_dir, config.get("state", DEFAULT_STATE_FILE))
+    if config.get("cache"):
+        config["cache"] = os.path.join(base_dir, config["cache"])
+    return config
+
+
+class ProcessedState:
+    """Processed files, kept in a JSON file so restarts skip them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.records = json.load(f)
+
+    def is_processed(self, filepath, stat):
+        record = self.records.get(filepath)
+        return record is not None and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns
+
+    def record(self, filepath, stat, result):
+        self.records[filepath] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "status": result["status"],
+            "output": result.get("output"),
+            "error": result.get("error"),
+            "finished": time.time(),
+        }
+        # Write a new file and swap it in, so a crash never leaves half a state file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, indent=1)
+        os.replace(temp_path, self.path)
+
+
+class InotifyWatcher:
+    """Reports files written or moved into folders, using Linux inotify."""
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._folders = {}
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        for folder in folders:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(folder), mask)
+            if wd < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), f"Cannot watch {folder}")
+            self._folders[wd] = folder
+
+    def wait(self, timeout):
+        """Return the paths changed within ``timeout`` seconds (maybe none).
+
+        Returns None if events were lost and the folders must be rescanned.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name and wd in self._folders:
+                paths.append(os.path.join(self._folders[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: rescans the folders."""
+
+    def __init__(self, folders, interval=DEFAULT_POLL_SECONDS):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return None
+
+    def close(self):
+        pass
+
+
+def make_watcher(folders, poll=False, interval=DEFAULT_POLL_SECONDS):
+    """Return an inotify watcher where possible, else a polling one."""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folders, interval)
+
+
+class WatchDaemon:
+    """Runs newly settled files in watched folders through their pipelines."""
+
+    def __init__(self, config, poll=False):
+        self.folders = {folder["path"]: folder for folder in config["folders"]}
+        self.settle_seconds = config.get("settle_seconds", DEFAULT_SETTLE_SECONDS)
+        self.poll_seconds = config.get("poll_seconds", DEFAULT_POLL_SECONDS)
+        self.workers = config.get("workers") or os.cpu_count() or 1
+        self.state = ProcessedState(config["state"])
+        self.poll = poll
+        self.cache_dir = config.get("cache")
+        self.pending = {}  # path -> (size, mtime_ns, time the file last changed)
+        self.running = {}  # future -> (path, stat)
+        self.crashes = {}  # path -> worker crashes it was in flight for
+        self._pool_broken = False
+        self._stopping = False
+
+    def _matches(self, filepath):
+        folder = self.folders.get(os.path.dirname(filepath))
+        if folder is None:
+            return False
+        name = os.path.basename(filepath)
+        if any(fnmatch.fnmatch(name, pattern) for pattern in IGNORED_PATTERNS):
+            return False
+        return any(fnmatch.fnmatch(name.lower(), pattern.lower()) for pattern in folder["patterns"])
+
+    def scan(self):
+        """Queue every matching file currently in the watched folders."""
+        for folder in self.folders:
+            for name in sorted(os.listdir(folder)):
+                self.note(os.path.join(folder, name))
+
+    def note(self, filepath):
+        """Start (or restart) the settle timer of a possibly changed file."""
+        if not self._matches(filepath) or any(path == filepath for path, _ in self.running.values()):
+            return
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            self.pending.pop(filepath, None)
+            return
+        if not os.path.isfile(filepath) or self.state.is_processed(filepath, stat):
+            return
+        previous = self.pending.get(filepath)
+        if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+            self.pending[filepath] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def _submit_settled(self, executor):
+        """Submit pending files whose size and mtime have stopped changing."""
+        now = time.monotonic()
+        for filepath, (size, mtime_ns, changed) in list(self.pending.items()):
+            if now - changed < self.settle_seconds:
+                continue
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                del self.pending[filepath]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                # Still being written
+                self.pending[filepath] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            folder = self.folders[os.path.dirname(filepath)]
+            os.makedirs(folder["output_dir"], exist_ok=True)
+            try:
+                future = executor.submit(run_chain, folder["pipeline"], filepath, folder["output_dir"],
+                                         self.cache_dir)
+            except BrokenProcessPool:
+                # Leave the file pending; it is submitted to the next pool
+                self._pool_broken = True
+                return
+            del self.pending[filepath]
+            self.running[future] = (filepath, stat)
+
+    def _collect(self, futures):
+        """Record finished files and print their results as JSON lines."""
+        for future in futures:
+            filepath, stat = self.running.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                # A worker died and took every file in flight with it
+                self._pool_broken = True
+                if self._retry_after_crash(filepath, stat):
+                    continue
+                result = {"input": filepath, "output": None, "status": "failed", "error": str(e)}
+            except Exception as e:
+                result = {"input": filepath, "output": None, "status": "failed", "error": str(e)}
+            self.crashes.pop(filepath, None)
+            self.state.record(filepath, stat, result)
+            print(json.dumps(result), flush=True)
+
+    def _retry_after_crash(self, filepath, stat):
+        """Put a file lost in a worker crash back in line, unless it keeps crashing workers."""
+        self.crashes[filepath] = self.crashes.get(filepath, 0) + 1
+        if self.crashes[filepath] >= MAX_CRASHES:
+            return False
+        # Not processed; it has already settled, so it runs as soon as there is a pool
+        self.pending[filepath] = (stat.st_size, stat.st_mtime_ns, time.monotonic() - self.settle_seconds)
+        return True
+
+    def _start_pool(self):
+        self._pool_broken = False
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker, initargs=(self.workers,))
+
+    def _next_timeout(self):
+        """Seconds until the earliest pending file may have settled."""
+        if not self.pending:
+            return self.poll_seconds
+        earliest = min(changed for _, _, changed in self.pending.values())
+        return max(0.05, min(self.poll_seconds, earliest + self.settle_seconds - time.monotonic()))
+
+    def stop(self, *args):
+        self._stopping = True
+
+    def run(self, once=False):
+        """Watch until stopped, or with ``once`` until the folders are done."""
+        signal.signal(signal.SIGTERM, self.stop)
+        watcher = make_watcher(list(self.folders), self.poll, self.poll_seconds)
+        mode = "polling" if isinstance(watcher, PollingWatcher) else "inotify"
+        print(f"Watching {len(self.folders)} folder(s) with {mode}, {self.workers} workers", file=sys.stderr)
+        executor = self._start_pool()
+        try:
+            self.scan()
+            while not self._stopping:
+                if self._pool_broken and not self.running:
+                    print("A worker process died; starting a new pool", file=sys.stderr)
+                    executor.shutdown(wait=False)
+                    executor = self._start_pool()
+                self._submit_settled(executor)
+                if self.running:
+                    done, _ = wait(self.running, timeout=0)
+                    self._collect(done)
+                if once and not self.pending and not self.running:
+                    break
+                timeout = self._next_timeout()
+                if self.running:
+                    # Check for finished files regularly
+                    timeout = min(timeout, 0.2)
+                paths = watcher.wait(timeout)
+                if paths is None:
+                    self.scan()
+                else:
+                    for path in paths:
+                        self.note(path)
+            # Let files that already started finish, so their results are kept
+            if self.running:
+                done, _ = wait(self.running, return_when=ALL_COMPLETED)
+                self._collect(done)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown()
+            watcher.close()